@@ -0,0 +1,58 @@
+"""
+ASGI entry point for cloudrun-init.
+
+Serves the same Flask app and blueprints as ``app.wsgi:app`` from an ASGI
+server, through asgiref's WsgiToAsgi. The views stay synchronous: each
+request runs in its own asgiref ThreadSensitiveContext, and so on its own
+thread, and a worker serves up to ASGI_MAX_THREADS requests (default 64)
+at once; further requests wait for a slot.
+
+Usage:
+    uvicorn app.asgi:app --host 0.0.0.0 --port 8080
+"""
+import asyncio
+import os
+import sys
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+
+
+def create_asgi_app(wsgi_app=None, max_threads=None):
+    """
+    Wrap the Flask app for ASGI serving.
+
+    Without a ThreadSensitiveContext, WsgiToAsgi runs every request on
+    one thread per process, which would serve one request at a time.
+
+    Args:
+        wsgi_app (Flask): App to serve; defaults to the app in app.wsgi
+        max_threads (int): Requests run at once; defaults to
+            ASGI_MAX_THREADS
+
+    Returns:
+        callable: ASGI application
+    """
+    if wsgi_app is None:
+        from app.wsgi import app as wsgi_app
+    if max_threads is None:
+        max_threads = int(os.environ.get('ASGI_MAX_THREADS', '64'))
+
+    def with_error_stream(environ, start_response):
+        # asgiref passes a BytesIO, which Flask's log handler cannot write text to
+        environ['wsgi.errors'] = sys.stderr
+        return wsgi_app(environ, start_response)
+
+    wsgi_to_asgi = WsgiToAsgi(with_error_stream)
+    slots = asyncio.Semaphore(max_threads)
+
+    async def asgi_app(scope, receive, send):
+        async with slots:
+            async with ThreadSensitiveContext():
+                await wsgi_to_asgi(scope, receive, send)
+
+    return asgi_app
+
+
+# For uvicorn
+app = create_asgi_app()
@@ -3,14 +3,29 @@ Firebase authentication utilities for cloudrun-init.
 """
 import os
 import functools
+import threading
+import time
 from flask import g, request, jsonify, current_app
-import firebase_admin
-from firebase_admin import auth, credentials
-from google.auth.exceptions import GoogleAuthError
+from app.auth.keys import KeyManager, UnknownKeyError
+from app.auth.screen import REASON_VERIFY_FAILED
+from app.auth.session import get_session_user, refresh_session
+from app.auth.token_cache import token_hash
+from app.metrics import timed, PHASE_TOKEN_VERIFY
+from app.singleflight import get_group, GROUP_TOKEN_VERIFY
 
 
 def init_firebase():
-    """Initialize Firebase Admin SDK."""
+    """
+    Initialize Firebase Admin SDK.
+
+    Returns:
+        bool: True if initialized with credentials, False if a dummy app
+            was created for local development
+    """
+    # The Admin SDK is imported on first use, keeping it out of startup
+    import firebase_admin
+    from firebase_admin import credentials
+
     try:
         # Check if already initialized
         firebase_admin.get_app()
@@ -33,21 +48,310 @@ def init_firebase():
                 current_app.logger.info("Firebase will not be available. Set FIREBASE_SERVICE_ACCOUNT_KEY for full functionality.")
                 # Create a dummy app for testing
                 firebase_admin.initialize_app(project_id='test-project')
+                return False
+    return True
+
+
+class FirebaseState:
+    """
+    Cached outcome of Firebase Admin SDK initialization.
+
+    Initialization runs once, at startup (see app.warmup) or on first use.
+    Per-request code only reads the status; a failed initialization is retried at most once per backoff
+    interval (doubling up to retry_max), by a single request thread, so an
+    outage does not turn into a credential lookup on every request.
+
+    States:
+        ready: Initialized with credentials
+        degraded: Initialized without credentials (local development)
+        failed: Initialization raised; retried with backoff
+    """
+    READY = 'ready'
+    DEGRADED = 'degraded'
+    FAILED = 'failed'
+
+    def __init__(self, retry_base=5, retry_max=300, clock=time.monotonic):
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._clock = clock
+        self._retry_lock = threading.Lock()
+        self.status = None
+        self.error = None
+        self.failures = 0
+        self.next_retry_at = 0
+
+    def initialize(self):
+        """
+        Run Firebase initialization and record the outcome.
+
+        Must be called within an application context.
+
+        Returns:
+            str: The new status
+        """
+        try:
+            self.status = self.READY if init_firebase() else self.DEGRADED
+            self.error = None
+            self.failures = 0
+        except Exception as e:
+            current_app.logger.error(f"Failed to initialize Firebase: {e}")
+            self.status = self.FAILED
+            self.error = e
+            self.failures += 1
+            delay = min(self.retry_base * 2 ** (self.failures - 1), self.retry_max)
+            self.next_retry_at = self._clock() + delay
+        return self.status
+
+    def ensure_initialized(self):
+        """
+        Run the first initialization unless it has already happened.
+
+        Safe to call from the warm-up thread and request threads at once.
+
+        Returns:
+            str: The current status
+        """
+        if self.status is None:
+            with self._retry_lock:
+                if self.status is None:
+                    self.initialize()
+        return self.status
+
+    def available(self):
+        """
+        Check whether Firebase can be used, retrying a failed init if due.
+
+        Returns:
+            bool: True unless initialization has failed
+        """
+        if self.status is None:
+            # Deferred at startup and not warmed up yet
+            return self.ensure_initialized() != self.FAILED
+        if self.status != self.FAILED:
+            return True
+        if self._clock() < self.next_retry_at or not self._retry_lock.acquire(blocking=False):
+            return False
+        try:
+            if self._clock() >= self.next_retry_at:
+                self.initialize()
+        finally:
+            self._retry_lock.release()
+        return self.status != self.FAILED
+
+    def reset(self):
+        """
+        Forget the initialization so it runs again in this process.
+
+        Used in forked workers: the Firebase Admin app holds HTTP sessions
+        created by the parent, so it is deleted and rebuilt.
+        """
+        import firebase_admin
+
+        # Replace rather than acquire the lock: after fork() it may be held
+        # by a thread that no longer exists in this process.
+        self._retry_lock = threading.Lock()
+        try:
+            firebase_admin.delete_app(firebase_admin.get_app())
+        except ValueError:
+            pass
+        self.status = None
+        self.error = None
+        self.failures = 0
+        self.next_retry_at = 0
+
+
+def init_firebase_state(app, initialize=True):
+    """
+    Initialize Firebase once for the app and store the outcome.
+
+    Args:
+        app (Flask): Application to initialize Firebase for
+        initialize (bool): Initialize now; if False, initialization is
+            left to the warm-up or to the first request that needs it
+
+    Returns:
+        FirebaseState: The recorded initialization state
+    """
+    state = FirebaseState()
+    app.extensions['firebase'] = state
+    if initialize:
+        with app.app_context():
+            state.initialize()
+        app.logger.info(f"Firebase initialization: {state.status}")
+    return state
+
+
+def firebase_available():
+    """
+    Check whether tokens can be verified for the current app.
+
+    Returns:
+        bool: True if prefetched keys are loaded or Firebase initialized
+    """
+    if get_key_manager() is not None:
+        return True
+    state = current_app.extensions.get('firebase')
+    return state is None or state.available()
+
+
+def get_token_cache():
+    """
+    Get the verified-token cache of the current app.
 
+    Returns:
+        TokenCache: The app's token cache, or None if caching is disabled
+    """
+    return current_app.extensions.get('token_cache')
+
+
+def get_token_screen():
+    """
+    Get the pre-verification token screen of the current app.
 
-def verify_firebase_token(id_token):
+    Returns:
+        TokenScreen: The app's token screen, or None if screening is disabled
+    """
+    return current_app.extensions.get('token_screen')
+
+
+def _screened_out(id_token):
+    """Check a token against the screen; True if it must not be verified."""
+    screen = get_token_screen()
+    if screen is None:
+        return False
+    reason = screen.check(id_token, get_key_manager())
+    if reason is not None:
+        current_app.logger.debug(f"Token rejected before verification: {reason}")
+        return True
+    return False
+
+
+def get_key_manager():
+    """
+    Get the signing key manager of the current app.
+
+    Returns:
+        KeyManager: The app's key manager, or None if key prefetching is
+            disabled or no keys could be loaded
+    """
+    key_manager = current_app.extensions.get('firebase_keys')
+    if key_manager is not None and key_manager.ready:
+        return key_manager
+    return None
+
+
+def init_key_manager(app, start=True):
+    """
+    Load Firebase signing keys at startup and keep them refreshed.
+
+    Enabled by FIREBASE_KEY_PREFETCH; FIREBASE_CERTS_SOURCE may point at a
+    URL or a local JSON file of {kid: PEM} instead of Google's endpoint.
+    Until the keys are loaded, or if they cannot be, token verification
+    falls back to firebase_admin.
+
+    Args:
+        app (Flask): Application to attach the key manager to
+        start (bool): Load the keys now; if False, start_key_manager
+            must be called later (see app.warmup)
+
+    Returns:
+        KeyManager: The key manager, or None if prefetching is disabled
+    """
+    project_id = app.config.get('FIREBASE_PROJECT_ID') or app.config.get('GOOGLE_CLOUD_PROJECT')
+    if not app.config.get('FIREBASE_KEY_PREFETCH', False) or not project_id:
+        return None
+
+    key_manager = KeyManager(project_id, source=app.config.get('FIREBASE_CERTS_SOURCE'))
+    app.extensions['firebase_keys'] = key_manager
+    if start:
+        start_key_manager(app)
+    return key_manager
+
+
+def start_key_manager(app):
+    """
+    Load the app's signing keys and start their background refresh.
+
+    Returns:
+        bool: True if keys are loaded
+    """
+    key_manager = app.extensions.get('firebase_keys')
+    if key_manager is None:
+        return False
+    try:
+        key_manager.start()
+    except Exception as e:
+        app.logger.warning(f"Failed to prefetch Firebase signing keys, falling back to firebase_admin: {e}")
+        return False
+    app.logger.info(f"Loaded {key_manager.stats()['keys']} Firebase signing keys")
+    return True
+
+
+def verify_firebase_token(id_token, check_revoked=None):
     """
     Verify Firebase ID token and return user info.
+
+    Results are cached until the token's ``exp`` claim, so a token reused
+    across requests is only verified once per worker. Revocation checks
+    need a round trip to Firebase and therefore always bypass the cache.
     
     Args:
         id_token (str): Firebase ID token from client
+        check_revoked (bool): Also check whether the token was revoked;
+            defaults to the FIREBASE_CHECK_REVOKED config value
         
     Returns:
         dict: User information if token is valid, None otherwise
     """
+    if check_revoked is None:
+        check_revoked = current_app.config.get('FIREBASE_CHECK_REVOKED', False)
+
+    cache = None if check_revoked else get_token_cache()
+    if cache is not None:
+        user_info = cache.get(id_token)
+        if user_info is not None:
+            return user_info
+
+    # Junk, foreign and expired tokens are turned away without RSA work
+    if _screened_out(id_token):
+        return None
+
+    return _verify_coalesced(id_token, check_revoked, cache)
+
+
+def _verify_coalesced(id_token, check_revoked, cache):
+    """Verify a token once for all concurrent requests carrying it."""
+    group = get_group(GROUP_TOKEN_VERIFY)
+    if group is None:
+        return _verify_uncached(id_token, check_revoked, cache)
+    user_info, shared = group.do((token_hash(id_token), check_revoked),
+                                 _verify_uncached, id_token, check_revoked, cache)
+    # Each request gets its own dict, as from the token cache
+    return dict(user_info) if shared and user_info is not None else user_info
+
+
+def _is_unknown_key_error(error):
+    """Check whether verification failed only because the signing key is not loaded."""
+    cause = getattr(error, 'cause', None)
+    # google.auth, behind firebase_admin, reports a missing certificate as a ValueError
+    return isinstance(cause, UnknownKeyError) or 'Certificate for key id' in str(cause)
+
+
+@timed(PHASE_TOKEN_VERIFY)
+def _verify_uncached(id_token, check_revoked, cache):
+    """Verify a token that was not found in the cache, then cache it."""
+    from firebase_admin import auth
+    from google.auth.exceptions import GoogleAuthError
+
     try:
-        # Verify the ID token
-        decoded_token = auth.verify_id_token(id_token)
+        # Verify the ID token, against the prefetched keys when available
+        key_manager = None if check_revoked else get_key_manager()
+        if key_manager is not None:
+            decoded_token = key_manager.verify(id_token)
+        elif check_revoked:
+            decoded_token = auth.verify_id_token(id_token, check_revoked=True)
+        else:
+            decoded_token = auth.verify_id_token(id_token)
         
         # Extract user information
         user_info = {
@@ -58,16 +362,28 @@ def verify_firebase_token(id_token):
             'picture': decoded_token.get('picture'),
             'provider_id': decoded_token.get('firebase', {}).get('sign_in_provider', 'unknown')
         }
+
+        if cache is not None and 'exp' in decoded_token:
+            cache.put(id_token, user_info, decoded_token['exp'])
         
         return user_info
     except (ValueError, GoogleAuthError, auth.InvalidIdTokenError, auth.ExpiredIdTokenError) as e:
         current_app.logger.warning(f"Invalid Firebase token: {e}")
+        screen = get_token_screen()
+        if screen is not None and isinstance(e, auth.InvalidIdTokenError) and not _is_unknown_key_error(e):
+            # Replays of a token that failed verification are screened out;
+            # one signed with a key not loaded yet may verify after a refresh
+            screen.reject(id_token, REASON_VERIFY_FAILED)
         return None
 
 
 def get_token_from_request():
     """
     Extract Firebase ID token from request.
+
+    Signed session cookies (see app.auth.session) are checked by the
+    decorators before this is called; it is only the fallback once the
+    session is missing or expired.
     
     Returns:
         str: ID token if found, None otherwise
@@ -102,11 +418,13 @@ def login_required(f):
     """
     @functools.wraps(f)
     def decorated_function(*args, **kwargs):
-        # Initialize Firebase if not already done
-        try:
-            init_firebase()
-        except Exception as e:
-            current_app.logger.error(f"Failed to initialize Firebase: {e}")
+        # A valid signed session needs no Firebase verification
+        g.user = get_session_user()
+        if g.user:
+            return f(*args, **kwargs)
+
+        # Firebase was initialized at startup; only check the outcome
+        if not firebase_available():
             return jsonify({'error': 'Authentication service unavailable'}), 503
         
         # Get token from request
@@ -121,6 +439,7 @@ def login_required(f):
         
         # Attach user to Flask's g object
         g.user = user_info
+        refresh_session(user_info)
         
         return f(*args, **kwargs)
     
@@ -141,11 +460,13 @@ def optional_login(f):
     """
     @functools.wraps(f)
     def decorated_function(*args, **kwargs):
-        # Initialize Firebase if not already done
-        try:
-            init_firebase()
-        except Exception as e:
-            current_app.logger.error(f"Failed to initialize Firebase: {e}")
+        # A valid signed session needs no Firebase verification
+        g.user = get_session_user()
+        if g.user:
+            return f(*args, **kwargs)
+
+        # Firebase was initialized at startup; only check the outcome
+        if not firebase_available():
             # Continue without authentication
             g.user = None
             return f(*args, **kwargs)
@@ -157,6 +478,7 @@ def optional_login(f):
             user_info = verify_firebase_token(token)
             if user_info:
                 g.user = user_info
+                refresh_session(user_info)
             else:
                 g.user = None
         else:
@@ -164,4 +486,28 @@ def optional_login(f):
         
         return f(*args, **kwargs)
     
-    return decorated_function 
\ No newline at end of file
+    return decorated_function 
+
+
+def admin_required(f):
+    """
+    Decorator to restrict a route to admins.
+
+    Must be applied after login_required. Admins are the Firebase UIDs
+    listed in the ADMIN_UIDS config value.
+
+    Usage:
+        @app.route('/admin')
+        @login_required
+        @admin_required
+        def admin_route():
+            return jsonify({'admin': g.user['uid']})
+    """
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        user = g.get('user')
+        if not user or user['uid'] not in current_app.config.get('ADMIN_UIDS', []):
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+
+    return decorated_function
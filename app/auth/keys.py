@@ -0,0 +1,317 @@
+"""
+Firebase ID token signing key management for cloudrun-init.
+
+Google publishes the certificates that sign Firebase ID tokens at a public
+URL with a Cache-Control max-age of a few hours. Left to firebase_admin,
+they are fetched lazily, inline with whichever request happens to need
+them. KeyManager loads them once at startup, keeps the parsed public keys
+in memory and refreshes them from a background thread before they expire.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+# jwt, requests, cryptography and firebase_admin are imported where used,
+# so importing the app does not load them before a key or token needs them
+
+# Certificates used to sign Firebase ID tokens
+ID_TOKEN_CERT_URI = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+ID_TOKEN_ISSUER_PREFIX = 'https://securetoken.google.com/'
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownKeyError(ValueError):
+    """A token names a signing key that is not loaded."""
+
+
+def parse_max_age(cache_control):
+    """
+    Extract max-age from a Cache-Control header.
+
+    Args:
+        cache_control (str): Cache-Control header value
+
+    Returns:
+        int: max-age in seconds, or None if absent
+    """
+    match = re.search(r'max-age=(\d+)', cache_control or '')
+    return int(match.group(1)) if match else None
+
+
+def load_public_key(pem):
+    """
+    Parse a PEM certificate or public key into a key object.
+
+    Args:
+        pem (str): PEM encoded X.509 certificate or public key
+
+    Returns:
+        RSAPublicKey: Public key ready for signature verification
+    """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import serialization
+
+    data = pem.encode('utf-8')
+    if b'BEGIN CERTIFICATE' in data:
+        return x509.load_pem_x509_certificate(data).public_key()
+    return serialization.load_pem_public_key(data)
+
+
+def http_source(url=ID_TOKEN_CERT_URI, timeout=10):
+    """
+    Build a key source that fetches certificates over HTTPS.
+
+    Returns:
+        callable: Source returning (certificates, max_age)
+    """
+    def fetch():
+        import requests
+
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.json(), parse_max_age(response.headers.get('Cache-Control'))
+    return fetch
+
+
+def file_source(path):
+    """
+    Build a key source that reads a JSON file of {kid: PEM}.
+
+    Returns:
+        callable: Source returning (certificates, None)
+    """
+    def read():
+        with open(path) as f:
+            return json.load(f), None
+    return read
+
+
+def make_source(source):
+    """
+    Build a key source from a URL, a file path or a callable.
+
+    Args:
+        source: http(s) URL, path to a JSON file of {kid: PEM}, a callable
+            returning (certificates, max_age), or None for Google's URL
+
+    Returns:
+        callable: Key source
+    """
+    if source is None:
+        return http_source()
+    if callable(source):
+        return source
+    if source.startswith(('http://', 'https://')):
+        return http_source(source)
+    if source.startswith('file://'):
+        source = source[len('file://'):]
+    return file_source(source)
+
+
+class KeyManager:
+    """
+    Pre-fetched, background-refreshed Firebase token signing keys.
+
+    Usage:
+        keys = KeyManager(project_id='my-project')
+        keys.start()
+        claims = keys.verify(id_token)
+    """
+
+    def __init__(self, project_id, source=None, default_max_age=3600,
+                 refresh_margin=300, retry_interval=30, min_refresh_interval=60,
+                 clock=time.time):
+        self.project_id = project_id
+        self.issuer = ID_TOKEN_ISSUER_PREFIX + project_id
+        self._source = make_source(source)
+        self.default_max_age = default_max_age
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.min_refresh_interval = min_refresh_interval
+        self._clock = clock
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stopped = False
+        self.expires_at = 0
+        self.last_attempt_at = None
+        self.last_refresh_at = None
+        self.last_refresh_seconds = None
+        self.refresh_count = 0
+        self.refresh_failures = 0
+
+    @property
+    def ready(self):
+        """True if keys are loaded."""
+        return bool(self._keys)
+
+    def refresh(self):
+        """
+        Fetch and parse the current signing keys.
+
+        Raises:
+            Exception: If the source cannot be read or parsed; the
+                previously loaded keys stay in use.
+        """
+        started = time.perf_counter()
+        self.last_attempt_at = self._clock()
+        try:
+            certificates, max_age = self._source()
+            keys = {kid: load_public_key(pem) for kid, pem in certificates.items()}
+        except Exception:
+            self.refresh_failures += 1
+            raise
+
+        with self._lock:
+            self._keys = keys
+            self.expires_at = self._clock() + (max_age or self.default_max_age)
+            self.last_refresh_at = self._clock()
+            self.last_refresh_seconds = time.perf_counter() - started
+            self.refresh_count += 1
+
+    def start(self):
+        """Load keys now and keep them fresh from a background thread."""
+        if not self.ready:
+            self.refresh()
+        self._ensure_refresher()
+
+    def stop(self):
+        """Stop the background refresher."""
+        self._stopped = True
+        self._wakeup.set()
+
+    def _ensure_refresher(self):
+        # Threads do not survive fork(); each worker starts its own
+        if self._pid == os.getpid() or self._stopped:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='firebase-key-refresh', daemon=True)
+            self._thread.start()
+
+    def _next_refresh_delay(self):
+        return max(self.expires_at - self.refresh_margin - self._clock(), 0)
+
+    def _run(self):
+        delay = self._next_refresh_delay()
+        while not self._stopped:
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+            if self._stopped:
+                break
+            try:
+                self.refresh()
+                delay = self._next_refresh_delay()
+            except Exception as e:
+                logger.warning(f"Firebase signing key refresh failed: {e}")
+                delay = self.retry_interval
+
+    def get_key(self, kid):
+        """
+        Get the public key for a key ID, refreshing once on an unknown ID.
+
+        Returns:
+            RSAPublicKey: Public key, or None if the key ID is unknown
+        """
+        key = self._keys.get(kid)
+        if key is None and self.ready and self._clock() - self.last_attempt_at >= self.min_refresh_interval:
+            # Google may have rotated keys since our last refresh; rate
+            # limited so forged key IDs cannot force a fetch per request
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Firebase signing key refresh failed: {e}")
+            key = self._keys.get(kid)
+        return key
+
+    def is_unknown_kid(self, kid):
+        """
+        Check whether get_key would return None without refreshing.
+
+        Returns:
+            bool: True if kid is not loaded and a refresh for it is not
+                allowed yet
+        """
+        return (self.ready and kid not in self._keys
+                and self._clock() - self.last_attempt_at < self.min_refresh_interval)
+
+    def verify(self, id_token):
+        """
+        Verify a Firebase ID token against the loaded keys.
+
+        Performs the same checks as ``firebase_admin.auth.verify_id_token``
+        without revocation checking.
+
+        Args:
+            id_token (str): Firebase ID token
+
+        Returns:
+            dict: Decoded token claims, with ``uid`` set
+
+        Raises:
+            auth.InvalidIdTokenError: If the token is invalid
+            auth.ExpiredIdTokenError: If the token has expired
+        """
+        import jwt
+        from firebase_admin import auth
+
+        self._ensure_refresher()
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except jwt.InvalidTokenError as e:
+            raise auth.InvalidIdTokenError(f"Malformed Firebase ID token: {e}", cause=e)
+
+        if header.get('alg') != 'RS256':
+            raise auth.InvalidIdTokenError(
+                f"Firebase ID token has incorrect algorithm. Expected \"RS256\" but got \"{header.get('alg')}\".")
+
+        key = self.get_key(header.get('kid'))
+        if key is None:
+            raise auth.InvalidIdTokenError('Firebase ID token has an unknown "kid" claim.',
+                                           cause=UnknownKeyError(header.get('kid')))
+
+        try:
+            claims = jwt.decode(
+                id_token,
+                key,
+                algorithms=['RS256'],
+                audience=self.project_id,
+                issuer=self.issuer,
+                options={'require': ['exp', 'iat', 'sub']},
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise auth.ExpiredIdTokenError(f"Firebase ID token has expired: {e}", cause=e)
+        except jwt.InvalidTokenError as e:
+            raise auth.InvalidIdTokenError(f"Invalid Firebase ID token: {e}", cause=e)
+
+        subject = claims['sub']
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise auth.InvalidIdTokenError('Firebase ID token has an invalid "sub" (subject) claim.')
+
+        claims['uid'] = subject
+        return claims
+
+    def stats(self):
+        """
+        Get refresh timing metrics.
+
+        Returns:
+            dict: Key count, expiry, last refresh time and duration, refresh
+                and failure counts
+        """
+        return {
+            'keys': len(self._keys),
+            'expires_in': max(self.expires_at - self._clock(), 0),
+            'last_refresh_at': self.last_refresh_at,
+            'last_refresh_seconds': self.last_refresh_seconds,
+            'refresh_count': self.refresh_count,
+            'refresh_failures': self.refresh_failures,
+        }
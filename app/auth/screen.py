@@ -0,0 +1,225 @@
+"""
+Pre-verification screening of ID tokens for cloudrun-init.
+
+Verifying a token costs an RSA signature check, and tokens that cannot
+possibly be valid (junk, another project's tokens, replayed expired ones)
+cost the same. TokenScreen decodes the header and claims without any
+cryptography and rejects what Firebase would reject anyway, and keeps a
+short-lived negative cache of the digests of tokens that can never pass,
+so repeated bad tokens are turned away with a hash lookup.
+
+The screen is never stricter than verification: a token it passes still
+goes through the full check.
+"""
+import base64
+import binascii
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from app.auth.keys import ID_TOKEN_ISSUER_PREFIX
+from app.auth.token_cache import token_hash
+
+# Rejection reasons, as exported on /metrics
+REASON_OVERSIZED = 'oversized'
+REASON_MALFORMED = 'malformed'
+REASON_ALG = 'alg'
+REASON_KID = 'kid'
+REASON_AUDIENCE = 'aud'
+REASON_ISSUER = 'iss'
+REASON_EXPIRED = 'expired'
+REASON_NOT_YET_VALID = 'not_yet_valid'
+REASON_SUBJECT = 'sub'
+REASON_CACHED = 'cached'
+REASON_VERIFY_FAILED = 'verify_failed'
+
+# Reasons that may not hold for the same token later: its signing key may
+# not be loaded yet, or its issuer's clock may run ahead of ours. They are
+# counted but not negatively cached.
+TRANSIENT_REASONS = frozenset({REASON_KID, REASON_NOT_YET_VALID})
+
+
+def _decode_segment(segment):
+    return json.loads(base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4)))
+
+
+class TokenScreen:
+    """
+    Cheap structural checks on ID tokens, run before signature verification.
+
+    Usage:
+        screen = TokenScreen(project_id='my-project')
+        reason = screen.check(id_token)
+        if reason is None:
+            claims = verify(id_token)       # may still fail
+        ...
+        screen.reject(id_token, 'verify_failed')    # remember a failure
+    """
+
+    def __init__(self, project_id, max_length=4096, negative_cache_size=4096,
+                 negative_ttl=60, clock=time.time):
+        self.project_id = project_id
+        self.issuer = ID_TOKEN_ISSUER_PREFIX + project_id
+        self.max_length = max_length
+        self.negative_cache_size = negative_cache_size
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rejected = OrderedDict()
+        self.rejections = {}
+
+    def _count(self, reason):
+        with self._lock:
+            self.rejections[reason] = self.rejections.get(reason, 0) + 1
+
+    def _is_rejected(self, key, now):
+        with self._lock:
+            expires_at = self._rejected.get(key)
+            if expires_at is None:
+                return False
+            if now >= expires_at:
+                del self._rejected[key]
+                return False
+            return True
+
+    def reject(self, id_token, reason, key=None):
+        """
+        Remember a token as rejected for negative_ttl seconds.
+
+        Args:
+            id_token (str): The rejected token
+            reason (str): Why it was rejected (counted for /metrics)
+        """
+        self._count(reason)
+        if self.negative_cache_size <= 0:
+            return
+        key = key or token_hash(id_token)
+        with self._lock:
+            self._rejected[key] = self._clock() + self.negative_ttl
+            self._rejected.move_to_end(key)
+            while len(self._rejected) > self.negative_cache_size:
+                self._rejected.popitem(last=False)
+
+    def _screen(self, id_token, now, key_manager):
+        if len(id_token) > self.max_length:
+            return REASON_OVERSIZED
+        try:
+            header_segment, payload_segment, signature = id_token.split('.')
+            header = _decode_segment(header_segment)
+            claims = _decode_segment(payload_segment)
+        except (ValueError, binascii.Error):
+            return REASON_MALFORMED
+        if not isinstance(header, dict) or not isinstance(claims, dict) or not signature:
+            return REASON_MALFORMED
+
+        if header.get('alg') != 'RS256':
+            return REASON_ALG
+        kid = header.get('kid')
+        if not isinstance(kid, str) or not kid:
+            return REASON_KID
+        if key_manager is not None and key_manager.is_unknown_kid(kid):
+            return REASON_KID
+
+        if claims.get('aud') != self.project_id:
+            return REASON_AUDIENCE
+        if claims.get('iss') != self.issuer:
+            return REASON_ISSUER
+
+        exp, iat = claims.get('exp'), claims.get('iat')
+        if not isinstance(exp, (int, float)) or exp <= now:
+            return REASON_EXPIRED
+        if not isinstance(iat, (int, float)) or iat > now:
+            return REASON_NOT_YET_VALID
+        nbf = claims.get('nbf')
+        if nbf is not None and (not isinstance(nbf, (int, float)) or nbf > now):
+            return REASON_NOT_YET_VALID
+
+        subject = claims.get('sub')
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            return REASON_SUBJECT
+        return None
+
+    def check(self, id_token, key_manager=None):
+        """
+        Screen a token before verifying it.
+
+        Args:
+            id_token (str): Token from the request
+            key_manager (KeyManager): Loaded signing keys, if any; unknown
+                key IDs are rejected when the keys cannot be refreshed yet
+
+        Returns:
+            str: Rejection reason, or None if the token should be verified
+        """
+        if not isinstance(id_token, str) or len(id_token) > self.max_length:
+            self._count(REASON_OVERSIZED)
+            return REASON_OVERSIZED
+
+        now = self._clock()
+        key = token_hash(id_token)
+        if self._is_rejected(key, now):
+            self._count(REASON_CACHED)
+            return REASON_CACHED
+
+        reason = self._screen(id_token, now, key_manager)
+        if reason in TRANSIENT_REASONS:
+            self._count(reason)
+        elif reason is not None:
+            self.reject(id_token, reason, key=key)
+        return reason
+
+    def stats(self):
+        """
+        Get rejection counters.
+
+        Returns:
+            dict: Rejections per reason, and the negative cache size
+        """
+        with self._lock:
+            return {'rejections': dict(self.rejections), 'negative_cache': len(self._rejected)}
+
+
+def init_token_screen(app):
+    """
+    Screen tokens before verification if TOKEN_SCREEN_ENABLED is set.
+
+    Off by default. TOKEN_SCREEN_MAX_LENGTH bounds token size (default
+    4096 bytes); rejected tokens are remembered for TOKEN_SCREEN_NEGATIVE_TTL
+    seconds (default 60), up to TOKEN_SCREEN_NEGATIVE_CACHE_SIZE of them
+    (default 4096). Rejections are exported on /metrics as
+    app_token_screen_rejections_total{reason} when metrics are enabled.
+
+    Args:
+        app (Flask): Application to configure
+
+    Returns:
+        TokenScreen: The screen, or None if disabled
+    """
+    if not app.config.get('TOKEN_SCREEN_ENABLED', False):
+        return None
+    project_id = app.config.get('FIREBASE_PROJECT_ID') or app.config.get('GOOGLE_CLOUD_PROJECT')
+    if not project_id:
+        app.logger.warning("TOKEN_SCREEN_ENABLED ignored: no FIREBASE_PROJECT_ID to check tokens against")
+        return None
+
+    screen = TokenScreen(
+        project_id,
+        max_length=app.config.get('TOKEN_SCREEN_MAX_LENGTH', 4096),
+        negative_cache_size=app.config.get('TOKEN_SCREEN_NEGATIVE_CACHE_SIZE', 4096),
+        negative_ttl=app.config.get('TOKEN_SCREEN_NEGATIVE_TTL', 60),
+    )
+    app.extensions['token_screen'] = screen
+
+    metrics = app.extensions.get('metrics')
+    if metrics is not None:
+        def collect():
+            lines = ['# HELP app_token_screen_rejections_total Tokens rejected before or by '
+                     'signature verification, by reason.',
+                     '# TYPE app_token_screen_rejections_total counter']
+            for reason, count in sorted(screen.stats()['rejections'].items()):
+                lines.append(f'app_token_screen_rejections_total{{reason="{reason}"}} {count}')
+            return lines
+
+        metrics.add_collector(collect)
+    return screen
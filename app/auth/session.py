@@ -0,0 +1,226 @@
+"""
+Stateless signed session cookies for cloudrun-init.
+
+With AUTH_SESSION_ENABLED, /auth/login verifies the Firebase ID token
+once and sets an ``auth_session`` cookie holding the user info, an expiry
+and an HMAC-SHA256 tag. Later requests are authenticated by recomputing
+the tag, which is far cheaper than an RS256 verification and needs no
+shared state between instances. The ID token itself is not stored, so
+once the cookie expires a client has to log in again, unless it also
+sends the token in an Authorization header or a firebase_token cookie;
+those are verified with Firebase and the session is re-issued.
+
+Cookie format (all parts base64url without padding):
+
+    v1.<key id>.<payload>.<tag>
+
+The tag covers everything before it. Signing keys are derived from
+SECRET_KEY; keys derived from SECRET_KEY_FALLBACKS are still accepted, so
+the secret can be rotated without logging everyone out.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+from flask import current_app, g, request
+
+SESSION_COOKIE = 'auth_session'
+VERSION = 'v1'
+
+# Published placeholder secrets (app.main's default and env.example's),
+# which anyone could sign sessions with
+INSECURE_SECRETS = ('dev-secret-key', 'your-secret-key-here')
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def derive_key(secret):
+    """
+    Derive the session signing key from an app secret.
+
+    The secret is not used directly, so session tags cannot be confused
+    with anything else signed with SECRET_KEY.
+
+    Returns:
+        tuple: (key id, signing key)
+    """
+    if isinstance(secret, str):
+        secret = secret.encode('utf-8')
+    key = hmac.new(secret, b'cloudrun-init auth session', hashlib.sha256).digest()
+    return _b64encode(hashlib.sha256(key).digest()[:6]), key
+
+
+class SessionSigner:
+    """
+    Mints and checks signed session values.
+
+    Usage:
+        signer = SessionSigner([current_secret, previous_secret], ttl=3600)
+        value = signer.mint(user_info)
+        user_info = signer.verify(value)    # None if invalid or expired
+    """
+
+    def __init__(self, secrets, ttl=3600, clock=time.time):
+        if not secrets:
+            raise ValueError("At least one session secret is required")
+        keys = [derive_key(secret) for secret in secrets]
+        self.key_id, self._key = keys[0]
+        self._keys = dict(reversed(keys))
+        self.ttl = ttl
+        self._clock = clock
+
+    def _tag(self, key, signed):
+        return hmac.new(key, signed.encode('ascii'), hashlib.sha256).digest()
+
+    def mint(self, user_info, expires_at=None):
+        """
+        Create a session value for verified user info.
+
+        Args:
+            user_info (dict): User info from verify_firebase_token
+            expires_at (float): Expiry time, defaults to now + ttl
+
+        Returns:
+            str: Cookie value
+        """
+        expires_at = int(expires_at or self._clock() + self.ttl)
+        payload = json.dumps({'exp': expires_at, 'user': user_info},
+                             separators=(',', ':'), sort_keys=True).encode('utf-8')
+        signed = f'{VERSION}.{self.key_id}.{_b64encode(payload)}'
+        return f'{signed}.{_b64encode(self._tag(self._key, signed))}'
+
+    def verify(self, value):
+        """
+        Check a session value.
+
+        Returns:
+            dict: The user info, or None if the value is malformed, signed
+                with an unknown key, tampered with or expired
+        """
+        try:
+            signed, tag = value.rsplit('.', 1)
+            version, key_id, payload = signed.split('.')
+        except (AttributeError, ValueError):
+            return None
+        key = self._keys.get(key_id)
+        if version != VERSION or key is None:
+            return None
+        try:
+            tag = _b64decode(tag)
+        except ValueError:
+            return None
+        if not hmac.compare_digest(tag, self._tag(key, signed)):
+            return None
+
+        session = json.loads(_b64decode(payload))
+        if session['exp'] <= self._clock():
+            return None
+        return session['user']
+
+
+def get_session_signer():
+    """
+    Get the session signer of the current app.
+
+    Returns:
+        SessionSigner: The signer, or None if sessions are disabled
+    """
+    return current_app.extensions.get('session_signer')
+
+
+def get_session_user():
+    """
+    Authenticate the request from its session cookie.
+
+    An Authorization header takes precedence over the cookie, so it is
+    not consulted when one is present.
+
+    Returns:
+        dict: User info from a valid session, None otherwise
+    """
+    signer = get_session_signer()
+    if signer is None or 'Authorization' in request.headers:
+        return None
+    value = request.cookies.get(SESSION_COOKIE)
+    if not value:
+        return None
+    return signer.verify(value)
+
+
+def set_session_cookie(response, user_info):
+    """
+    Attach a new session cookie for verified user info.
+
+    Args:
+        response (Response): Response to add the cookie to
+        user_info (dict): User info from verify_firebase_token
+    """
+    signer = get_session_signer()
+    response.set_cookie(
+        SESSION_COOKIE,
+        signer.mint(user_info),
+        httponly=True,
+        secure=not current_app.debug,
+        samesite='Lax',
+        max_age=signer.ttl
+    )
+
+
+def refresh_session(user_info):
+    """
+    Re-issue the session cookie after falling back to a Firebase token.
+
+    Only done when the request carried a session cookie (one that has
+    expired or no longer checks out), so clients using Authorization
+    headers are not handed cookies.
+
+    Args:
+        user_info (dict): User info from verify_firebase_token
+    """
+    if get_session_signer() is not None and SESSION_COOKIE in request.cookies:
+        g.session_refresh = user_info
+
+
+def _set_refreshed_session(response):
+    user_info = g.pop('session_refresh', None)
+    if user_info is not None:
+        set_session_cookie(response, user_info)
+    return response
+
+
+def init_sessions(app):
+    """
+    Enable signed session cookies if AUTH_SESSION_ENABLED is set.
+
+    Sessions last AUTH_SESSION_TTL seconds (default 3600). They are not
+    used when FIREBASE_CHECK_REVOKED is on, because a session cannot
+    notice a revoked token, nor when SECRET_KEY or one of
+    SECRET_KEY_FALLBACKS is unset or a published placeholder, because
+    anyone could then sign a session for any user.
+
+    Args:
+        app (Flask): Application to configure
+    """
+    if not app.config.get('AUTH_SESSION_ENABLED', False):
+        return None
+    if app.config.get('FIREBASE_CHECK_REVOKED', False):
+        app.logger.warning("AUTH_SESSION_ENABLED ignored: FIREBASE_CHECK_REVOKED needs every "
+                           "request to be checked with Firebase")
+        return None
+    secrets = [app.config.get('SECRET_KEY')] + list(app.config.get('SECRET_KEY_FALLBACKS') or [])
+    if any(not secret or secret in INSECURE_SECRETS for secret in secrets):
+        app.logger.error("AUTH_SESSION_ENABLED ignored: SECRET_KEY and SECRET_KEY_FALLBACKS must be "
+                         "set to private values to sign sessions")
+        return None
+    signer = SessionSigner(secrets, ttl=app.config.get('AUTH_SESSION_TTL', 3600))
+    app.extensions['session_signer'] = signer
+    app.after_request(_set_refreshed_session)
+    return signer
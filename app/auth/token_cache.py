@@ -0,0 +1,114 @@
+"""
+Verified ID token cache for cloudrun-init.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def token_hash(id_token):
+    """
+    Hash an ID token for use as a cache key.
+
+    Args:
+        id_token (str): Firebase ID token
+
+    Returns:
+        bytes: SHA-256 digest of the token
+    """
+    return hashlib.sha256(id_token.encode('utf-8')).digest()
+
+
+class TokenCache:
+    """
+    Bounded, thread-safe LRU cache of verified token user info.
+
+    Entries are keyed by the token's SHA-256 digest (the raw token is never
+    stored) and expire at the token's ``exp`` claim, so a cached result is
+    never served for a token Firebase would reject as expired.
+
+    Usage:
+        cache = TokenCache(max_size=1024)
+        user_info = cache.get(id_token)
+        if user_info is None:
+            decoded = auth.verify_id_token(id_token)
+            cache.put(id_token, user_info, decoded['exp'])
+    """
+
+    def __init__(self, max_size=1024, clock=time.time):
+        self.max_size = max_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, id_token):
+        """
+        Get cached user info for a token.
+
+        Args:
+            id_token (str): Firebase ID token
+
+        Returns:
+            dict: Copy of the cached user info, or None on a miss
+        """
+        key = token_hash(id_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            user_info, expires_at = entry
+            if self._clock() >= expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(user_info)
+
+    def put(self, id_token, user_info, expires_at):
+        """
+        Cache user info for a verified token.
+
+        Args:
+            id_token (str): Firebase ID token
+            user_info (dict): User info extracted from the token
+            expires_at (float): Token expiry as a Unix timestamp
+        """
+        if self.max_size <= 0 or self._clock() >= expires_at:
+            return
+
+        key = token_hash(id_token)
+        with self._lock:
+            self._entries[key] = (dict(user_info), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Returns:
+            dict: size, max_size, hits, misses and evictions
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
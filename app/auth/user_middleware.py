@@ -4,11 +4,64 @@ Handles user persistence and attaches User model to Flask's g object.
 """
 import functools
 from flask import g, current_app, jsonify
-from app.models.user import User
-from app.ndb_client import with_ndb_context
+from app.singleflight import get_group, GROUP_USER_LOAD
+
+
+def get_user_repository():
+    """
+    Get the user storage backend of the current app.
+
+    Returns:
+        UserRepository: The app's user repository
+    """
+    return current_app.extensions['user_repository']
+
+
+def get_user_cache():
+    """
+    Get the per-worker User cache of the current app.
+
+    Returns:
+        UserCache: The app's user cache, or None if caching is disabled
+    """
+    return current_app.extensions.get('user_cache')
+
+
+def invalidate_user(uid):
+    """
+    Drop a user from the per-worker cache after writing it.
+
+    Args:
+        uid (str): Firebase user ID
+    """
+    cache = get_user_cache()
+    if cache is not None:
+        cache.invalidate(uid)
+
+
+def get_cached_user(firebase_user_info):
+    """
+    Get a user from the per-worker cache if it is still up to date.
+
+    Args:
+        firebase_user_info (dict): User info from Firebase token
+
+    Returns:
+        User: Cached user, or None if missing or if the token's claims
+            (or the updated_at refresh policy) call for a write
+    """
+    cache = get_user_cache()
+    if cache is None:
+        return None
+
+    user = cache.get(firebase_user_info['uid'])
+    if user is None:
+        return None
+    if user.apply_firebase_user(firebase_user_info) or user.needs_touch():
+        return None
+    return user
 
 
-@with_ndb_context
 def get_or_create_user(firebase_user_info):
     """
     Get existing user or create new one from Firebase user info.
@@ -16,40 +69,126 @@ def get_or_create_user(firebase_user_info):
     Args:
         firebase_user_info (dict): User info from Firebase token
         
+    Concurrent calls for the same UID in this worker share one lookup
+    (and, on a first login, one creation).
+
     Returns:
         User: User entity from database
     """
-    # Try to get existing user
-    user = User.get_by_uid(firebase_user_info['uid'])
-    
-    if user:
-        # Update user info from Firebase (in case it changed)
-        user.update_from_firebase_user(firebase_user_info)
-        current_app.logger.debug(f"Updated existing user: {user.uid}")
+    repository = get_user_repository()
+    group = get_group(GROUP_USER_LOAD)
+    shared = False
+    if group is None:
+        user, created = repository.get_or_create(firebase_user_info)
     else:
-        # Create new user
-        user = User.create_from_firebase_user(firebase_user_info)
+        (user, created), shared = group.do(firebase_user_info['uid'],
+                                           repository.get_or_create, firebase_user_info)
+    if shared:
+        # Another request's user: take a private copy, and write this
+        # token's claims ourselves if they differ from that request's
+        user = user.copy()
+        if user.apply_firebase_user(firebase_user_info) or user.needs_touch():
+            repository.save(user)
+        return user
+
+    if created:
         current_app.logger.info(f"Created new user: {user.uid}")
+    else:
+        current_app.logger.debug(f"Updated existing user: {user.uid}")
+
+    cache = get_user_cache()
+    if cache is not None:
+        cache.put(user)
     
     return user
 
 
+def load_user_for_update(firebase_user_info):
+    """
+    Get the user for a route that may change it, without writing yet.
+
+    The token's claims are applied but not saved, so a route that makes
+    its own change writes the user once (see save_user) rather than once
+    here and once in the route.
+
+    Args:
+        firebase_user_info (dict): User info from Firebase token
+
+    Returns:
+        tuple: (User, whether it needs saving)
+    """
+    user = get_cached_user(firebase_user_info)
+    if user is not None:
+        return user, False
+
+    user, dirty, created = get_user_repository().load_for_update(firebase_user_info)
+    if created:
+        current_app.logger.info(f"Creating new user: {user.uid}")
+
+    cache = get_user_cache()
+    if cache is not None and not dirty:
+        cache.put(user)
+    return user, dirty
+
+
+def update_user(firebase_user_info, change):
+    """
+    Read the user from the store, change it and save it if needed.
+
+    Unlike load_user_for_update, the per-worker cache is skipped, and on
+    Datastore the read, change and write run in one transaction (see
+    UserRepository.update). Use it when change checks a precondition
+    such as If-Match.
+
+    Args:
+        firebase_user_info (dict): User info from Firebase token
+        change (callable): Called with (user, whether it needs saving);
+            returns whether to save it, or raises to write nothing
+
+    Returns:
+        User: The user, saved if change asked for it
+    """
+    user = get_user_repository().update(firebase_user_info, change)
+    invalidate_user(user.uid)
+    return user
+
+
+def save_user(user):
+    """
+    Write a user loaded with load_user_for_update and drop its cached copy.
+
+    Args:
+        user (User): User to save
+    """
+    get_user_repository().save(user)
+    invalidate_user(user.uid)
+
+
 def attach_user_to_request():
     """
     Middleware function to attach User model to Flask's g object.
     This should be called after Firebase authentication.
+
+    The user is loaded at most once per request; later calls reuse
+    g.user_model. Users seen recently by this worker come from the
+    per-worker cache without a Datastore read.
     """
-    # Check if NDB is available
-    if not current_app.config.get('NDB_AVAILABLE', True):
-        current_app.logger.warning("NDB not available, skipping user model attachment")
+    # Check if the user store is available
+    if not get_user_repository().available():
+        current_app.logger.warning("User store not available, skipping user model attachment")
         g.user_model = None
         return
     
     if hasattr(g, 'user') and g.user:
+        # Already attached earlier in this request for the same token
+        if g.get('user_model') is not None and g.get('user_model_source') is g.user:
+            return
+
         try:
             # Get or create user in database
-            user_model = get_or_create_user(g.user)
+            user_model = get_cached_user(g.user) or get_or_create_user(g.user)
             g.user_model = user_model
+            g.user_model_source = g.user
             current_app.logger.debug(f"Attached user model to request: {user_model.uid}")
         except Exception as e:
             current_app.logger.error(f"Failed to attach user model: {e}")
@@ -0,0 +1,105 @@
+"""
+Flask CLI commands for cloudrun-init.
+"""
+import os
+import time
+import click
+from flask import current_app
+from app.ndb_client import ndb_registry, with_ndb_context
+
+
+@click.command('migrate-user-keys')
+@click.option('--batch-size', default=100, show_default=True,
+              help='Legacy entities moved per transaction.')
+@click.option('--max-batches', default=None, type=int,
+              help='Stop after this many batches.')
+@with_ndb_context
+def migrate_user_keys_command(batch_size, max_batches):
+    """Rewrite auto-ID User entities to UID-keyed entities."""
+    from app.models.migrations import migrate_user_keys
+
+    def progress(stats):
+        click.echo(f"batch {stats['batches']}: {stats['written']} written, {stats['deleted']} legacy deleted")
+
+    stats = migrate_user_keys(batch_size=batch_size, max_batches=max_batches, progress=progress)
+    current_app.logger.info(f"User key migration finished: {stats}")
+    click.echo(f"Done: {stats['written']} users written, {stats['deleted']} legacy entities deleted "
+               f"in {stats['batches']} batches")
+
+
+@click.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']), default=None,
+              help='Record format (default: from the file extension).')
+@click.option('--batch-size', default=500, show_default=True, type=click.IntRange(1, 500),
+              help='Users written per put_multi.')
+@click.option('--concurrency', default=8, show_default=True, type=click.IntRange(1),
+              help='Batches written at once.')
+@click.option('--retries', default=5, show_default=True, type=click.IntRange(0),
+              help='Retries per batch on contention or transient errors.')
+@click.option('--no-lookup', is_flag=True,
+              help='Write every user as new, without reading existing users first.')
+@click.option('--checkpoint', 'checkpoint_path', type=click.Path(dir_okay=False), default=None,
+              help='Checkpoint file for resuming (default: PATH.checkpoint).')
+@click.option('--restart', is_flag=True, help='Ignore an existing checkpoint.')
+@click.option('--report-every', default=5.0, show_default=True,
+              help='Seconds between progress reports.')
+def import_users_command(path, fmt, batch_size, concurrency, retries, no_lookup, checkpoint_path,
+                         restart, report_every):
+    """Import users from a JSONL or CSV file of Firebase user records."""
+    from app.models.imports import (detect_format, read_records, import_users, load_checkpoint,
+                                    save_checkpoint)
+
+    source = os.path.abspath(path)
+    checkpoint_path = checkpoint_path or f'{path}.checkpoint'
+    try:
+        resume = None if restart else load_checkpoint(checkpoint_path, source)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    start, stats = (resume['position'], resume['stats']) if resume else (0, None)
+    if start:
+        click.echo(f"Resuming after record {start} from {checkpoint_path}")
+
+    # Build the shared client here; worker threads only open contexts
+    ndb_registry.get_client()
+
+    started = time.monotonic()
+    initial_read = stats['read'] if stats else 0
+    last_report = [started]
+
+    def rate(stats):
+        return (stats['read'] - initial_read) / max(time.monotonic() - started, 1e-9)
+
+    def checkpoint(position, stats):
+        save_checkpoint(checkpoint_path, source, position, stats)
+
+    def progress(stats):
+        now = time.monotonic()
+        if now - last_report[0] >= report_every:
+            last_report[0] = now
+            click.echo(f"{stats['read']} read, {stats['written']} written, "
+                       f"{stats['unchanged']} unchanged ({rate(stats):.0f} rows/s)")
+
+    with open(path, newline='', encoding='utf-8') as f:
+        try:
+            stats = import_users(
+                read_records(f, fmt or detect_format(path)), ndb_registry.context,
+                batch_size=batch_size, concurrency=concurrency, lookup=not no_lookup,
+                retries=retries, start=start, stats=stats, checkpoint=checkpoint,
+                progress=progress)
+        except Exception as e:
+            current_app.logger.error(f"User import failed: {e}")
+            raise click.ClickException(f"Import failed: {e}. Re-run to resume from {checkpoint_path}")
+
+    os.remove(checkpoint_path)
+    elapsed = time.monotonic() - started
+    current_app.logger.info(f"User import finished: {stats}")
+    click.echo(f"Done: {stats['read']} read, {stats['written']} written, {stats['unchanged']} unchanged, "
+               f"{stats['coalesced']} coalesced, {stats['invalid']} invalid in {stats['batches']} batches "
+               f"({stats['retries']} retries) in {elapsed:.1f}s, {rate(stats):.0f} rows/s")
+
+
+def register_commands(app):
+    """Register CLI commands on the app."""
+    app.cli.add_command(migrate_user_keys_command)
+    app.cli.add_command(import_users_command)
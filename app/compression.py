@@ -0,0 +1,381 @@
+"""
+Response compression and precompressed static assets for cloudrun-init.
+
+Static files are compressed once: at build time with
+
+    python -m app.compression app/static
+
+which writes .gz and .br files next to each asset, or else when the app
+starts. They are served from memory with a content-hash ETag, so a
+request costs a dict lookup, and a 304 when the client already has the
+file. HTML is revalidated on every visit (no-cache); other assets are
+cached for STATIC_MAX_AGE seconds, or for a year when requested with the
+?v=<hash> of their content (see StaticAssets.url).
+
+JSON responses of at least COMPRESSION_MIN_SIZE bytes are compressed with
+brotli or gzip, whichever the client prefers. Each coding is a separate
+representation, so an ETag set by the route gets the coding appended
+("<etag>-gzip"); app.conditional matches a client's copy in any coding.
+
+Brotli needs the optional Brotli package; without it only gzip is used.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import sys
+import time
+
+from flask import current_app, request
+
+from app.metrics import record_phase, PHASE_COMPRESSION
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# Content codings, most preferred first, and their precompressed file suffixes
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# Responses compressed on the fly
+COMPRESSIBLE_MIMETYPES = ('application/json',)
+
+# Static files worth precompressing
+STATIC_COMPRESSIBLE_PREFIXES = ('text/', 'application/javascript', 'application/json',
+                                'application/xml', 'image/svg+xml')
+STATIC_MIN_SIZE = 256
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def available_encodings():
+    """Get the content codings this process can produce, most preferred first."""
+    return tuple(encoding for encoding in ENCODING_SUFFIXES if encoding != 'br' or brotli is not None)
+
+
+def encoded_etag(etag, encoding):
+    """
+    Get the ETag of a representation sent in a content coding.
+
+    Args:
+        etag (str): Unquoted ETag of the uncompressed representation
+        encoding (str): Content coding, or None for identity
+
+    Returns:
+        str: The ETag with the coding appended, if any
+    """
+    return f'{etag}-{encoding}' if encoding else etag
+
+
+def compress(data, encoding, level):
+    """
+    Compress data with a content coding.
+
+    Args:
+        data (bytes): Data to compress
+        encoding (str): 'br' or 'gzip'
+        level (int): Brotli quality (0-11) or gzip level (1-9)
+
+    Returns:
+        bytes: Compressed data
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    # mtime=0 keeps the output, and so the build artifacts, reproducible
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def negotiate_encoding(encodings):
+    """
+    Pick the content coding of the current request's response.
+
+    Args:
+        encodings (iterable): Codings available, most preferred first
+
+    Returns:
+        str: The coding with the highest quality in Accept-Encoding, or
+            None to send the response uncompressed
+    """
+    accept = request.accept_encodings
+    best, best_quality = None, 0
+    for encoding in encodings:
+        quality = accept[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _is_compressible(mimetype):
+    return mimetype.startswith(STATIC_COMPRESSIBLE_PREFIXES)
+
+
+def _read_precompressed(path, encoding):
+    variant = path + ENCODING_SUFFIXES[encoding]
+    try:
+        if os.path.getmtime(variant) < os.path.getmtime(path):
+            return None
+        with open(variant, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class StaticAsset:
+    """A static file and its compressed variants, held in memory."""
+
+    __slots__ = ('mimetype', 'etag', 'variants')
+
+    def __init__(self, data, mimetype, variants):
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(data).hexdigest()[:20]
+        # Content coding (None for identity) -> body
+        self.variants = {None: data, **variants}
+
+    @classmethod
+    def load(cls, path, gzip_level=9, brotli_quality=11):
+        """
+        Read a file, using its .gz/.br siblings when they are up to date
+        and compressing it otherwise.
+
+        Returns:
+            StaticAsset: The loaded asset
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+        variants = {}
+        if _is_compressible(mimetype) and len(data) >= STATIC_MIN_SIZE:
+            for encoding in available_encodings():
+                body = _read_precompressed(path, encoding)
+                if body is None:
+                    body = compress(data, encoding, brotli_quality if encoding == 'br' else gzip_level)
+                if len(body) < len(data):
+                    variants[encoding] = body
+        return cls(data, mimetype, variants)
+
+
+class StaticAssets:
+    """
+    Static files served from memory.
+
+    Usage:
+        assets = StaticAssets(max_age=3600)
+        assets.add_directory(app.static_folder)
+        assets.add('index.html', '/path/to/index.html')
+        ...
+        return assets.response('index.html')
+    """
+
+    def __init__(self, max_age=3600, gzip_level=9, brotli_quality=11):
+        self.max_age = max_age
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._assets = {}
+
+    def add(self, name, path):
+        """
+        Load a file under a name.
+
+        Returns:
+            StaticAsset: The asset
+
+        Raises:
+            ValueError: If the name is absolute or has a '..' segment, which
+                would serve it as if it were outside the static folder
+        """
+        if name.startswith('/') or '..' in name.split('/'):
+            raise ValueError(f"Asset name must be relative to the static folder: {name!r}")
+        asset = StaticAsset.load(path, gzip_level=self.gzip_level, brotli_quality=self.brotli_quality)
+        self._assets[name] = asset
+        return asset
+
+    def add_directory(self, directory):
+        """Load every file below a directory, named by relative path."""
+        suffixes = tuple(ENCODING_SUFFIXES.values())
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                if filename.endswith(suffixes):
+                    continue
+                path = os.path.join(root, filename)
+                self.add(os.path.relpath(path, directory).replace(os.sep, '/'), path)
+
+    def get(self, name):
+        """Get a loaded asset, or None."""
+        return self._assets.get(name)
+
+    def url(self, name, prefix='/static/'):
+        """
+        Get a URL of an asset that may be cached indefinitely.
+
+        Returns:
+            str: URL carrying the asset's content hash
+        """
+        return f'{prefix}{name}?v={self._assets[name].etag}'
+
+    def cache_control(self, asset):
+        if asset.mimetype == 'text/html':
+            return 'no-cache'
+        if request.args.get('v') == asset.etag:
+            return IMMUTABLE_CACHE_CONTROL
+        return f'public, max-age={self.max_age}'
+
+    def response(self, name):
+        """
+        Serve an asset to the current request.
+
+        Returns:
+            Response: The asset in the client's preferred encoding, a 304
+                if the client's copy is current, or None if unknown
+        """
+        asset = self._assets.get(name)
+        if asset is None:
+            return None
+
+        encoding = negotiate_encoding(coding for coding in asset.variants if coding)
+        etag = encoded_etag(asset.etag, encoding)
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(asset.variants[encoding], mimetype=asset.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = self.cache_control(asset)
+        return response
+
+
+def get_static_assets():
+    """
+    Get the static assets of the current app.
+
+    Returns:
+        StaticAssets: The assets, or None if served by Flask directly
+    """
+    return current_app.extensions.get('static_assets')
+
+
+def serve_asset(name):
+    """
+    Serve a file of the static folder, precompressed when possible.
+
+    Returns:
+        Response: The file, or a 404 if it does not exist
+    """
+    assets = get_static_assets()
+    response = assets.response(name) if assets is not None else None
+    if response is None:
+        return current_app.send_static_file(name)
+    return response
+
+
+def compress_response(response):
+    """
+    Compress a JSON response for the current request, if worthwhile.
+
+    Registered as an after_request hook by init_compression.
+
+    Returns:
+        Response: The same response
+    """
+    if response.status_code < 200 or response.status_code in (204, 304) or \
+            response.direct_passthrough or response.is_streamed or \
+            'Content-Encoding' in response.headers or \
+            response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    config = current_app.config
+    data = response.get_data()
+    if len(data) < config.get('COMPRESSION_MIN_SIZE', 1024):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(available_encodings())
+    if encoding is None:
+        return response
+
+    started = time.perf_counter()
+    if encoding == 'br':
+        level = config.get('COMPRESSION_BROTLI_QUALITY', 4)
+    else:
+        level = config.get('COMPRESSION_GZIP_LEVEL', 6)
+    response.set_data(compress(data, encoding, level))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(encoded_etag(etag, encoding), weak=weak)
+    record_phase(PHASE_COMPRESSION, time.perf_counter() - started)
+    return response
+
+
+def init_compression(app):
+    """
+    Serve precompressed static assets and compress JSON responses.
+
+    With STATIC_PRECOMPRESS (default on), files in the static folder are
+    loaded into memory at startup with gzip (level 9) and brotli (quality
+    11) variants, and /static/ is served from them; HTML is revalidated
+    with its ETag, other assets are cached for STATIC_MAX_AGE seconds
+    (default 3600). With COMPRESSION_ENABLED (default on), JSON responses
+    of at least COMPRESSION_MIN_SIZE bytes (default 1024) are compressed
+    at COMPRESSION_GZIP_LEVEL (default 6) or COMPRESSION_BROTLI_QUALITY
+    (default 4).
+
+    Args:
+        app (Flask): Application to configure
+
+    Returns:
+        StaticAssets: The static assets, or None if not precompressed
+    """
+    if app.config.get('COMPRESSION_ENABLED', True):
+        app.after_request(compress_response)
+
+    if not app.config.get('STATIC_PRECOMPRESS', True) or not app.static_folder:
+        return None
+
+    assets = StaticAssets(max_age=app.config.get('STATIC_MAX_AGE', 3600))
+    if os.path.isdir(app.static_folder):
+        assets.add_directory(app.static_folder)
+    app.extensions['static_assets'] = assets
+
+    send_static_file = app.view_functions['static']
+
+    def static(filename):
+        response = assets.response(filename)
+        if response is None:
+            return send_static_file(filename=filename)
+        return response
+
+    app.view_functions['static'] = static
+    return assets
+
+
+def precompress_directory(directory, gzip_level=9, brotli_quality=11):
+    """
+    Write .gz and .br files next to every compressible file in a directory.
+
+    Returns:
+        int: Number of files written
+    """
+    written = 0
+    suffixes = tuple(ENCODING_SUFFIXES.values())
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            path = os.path.join(root, filename)
+            if filename.endswith(suffixes):
+                continue
+            asset = StaticAsset.load(path, gzip_level=gzip_level, brotli_quality=brotli_quality)
+            for encoding, body in asset.variants.items():
+                if encoding is None:
+                    continue
+                with open(path + ENCODING_SUFFIXES[encoding], 'wb') as f:
+                    f.write(body)
+                written += 1
+    return written
+
+
+if __name__ == '__main__':
+    for directory in sys.argv[1:] or [os.path.join(os.path.dirname(__file__), 'static')]:
+        count = precompress_directory(directory)
+        print(f"{directory}: {count} precompressed files written")
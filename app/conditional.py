@@ -0,0 +1,191 @@
+"""
+Conditional request support (ETag, If-None-Match, If-Match) for user
+resources.
+
+A user's ETag is derived from its version (UID and updated_at), the
+Firebase claims of the current token and the representation variant
+(selected fields, format). The claims are included because a request
+whose token carries changed claims rewrites the user before responding,
+so it must not be answered with 304 from the old version.
+
+The version can be checked before the user is loaded: from the request's
+user, the per-worker user cache, or a repository version lookup. On
+Datastore that is a key lookup of the whole user (so it sees writes that
+just committed), and the user is kept for the request.
+"""
+import hashlib
+from datetime import datetime
+from flask import current_app, g, request
+from app.auth.user_middleware import get_cached_user, get_user_cache, get_user_repository
+from app.compression import ENCODING_SUFFIXES, encoded_etag
+from app.models.repository import UserVersion
+from app.models.user import User
+
+# Claims copied onto the User by apply_firebase_user
+SYNCED_CLAIMS = ('email', 'name', 'email_verified', 'picture', 'provider_id')
+
+
+class PreconditionFailed(Exception):
+    """An If-Match header does not match the current ETag."""
+
+    def __init__(self, etag):
+        super().__init__(f"If-Match does not match ETag {etag}")
+        self.etag = etag
+
+
+def make_etag(version, firebase_user_info, *variant):
+    """
+    Build the ETag value of a user representation.
+
+    Args:
+        version (UserVersion): Stored version of the user
+        firebase_user_info (dict): User info from the request's token
+        *variant: Anything else the representation depends on
+
+    Returns:
+        str: Unquoted strong ETag
+    """
+    parts = [version.uid, version.updated_at.isoformat() if version.updated_at else '']
+    parts.extend(repr(firebase_user_info.get(name)) for name in SYNCED_CLAIMS)
+    parts.extend(repr(value) for value in variant)
+    return hashlib.blake2b('\x1f'.join(parts).encode('utf-8'), digest_size=12).hexdigest()
+
+
+def version_of(user):
+    """Get the version of a loaded user."""
+    return UserVersion(user.uid, user.created_at, user.updated_at)
+
+
+def current_version(firebase_user_info):
+    """
+    Get the stored version of the request's user as cheaply as possible.
+
+    Returns:
+        UserVersion: The version, or None if the user has to be loaded
+            (unknown, or due for a write)
+    """
+    user = g.get('user_model')
+    if user is not None and g.get('user_model_source') is firebase_user_info:
+        return version_of(user)
+
+    user = get_cached_user(firebase_user_info)
+    if user is not None:
+        return version_of(user)
+
+    repository = get_user_repository()
+    if not repository.available():
+        return None
+    if repository.version_loads_user:
+        return _load_version(repository, firebase_user_info)
+    version = repository.get_version(firebase_user_info['uid'])
+    if version is None or version.updated_at is None:
+        return None
+    if User.touch_interval is not None and \
+            datetime.utcnow() - version.updated_at >= User.touch_interval:
+        return None
+    return version
+
+
+def _load_version(repository, firebase_user_info):
+    """
+    Load the request's user to get its version, keeping it for the route.
+
+    Returns:
+        UserVersion: The version, or None if the user has to be loaded
+            (unknown, or due for a write)
+    """
+    user = repository.get_by_uid(firebase_user_info['uid'])
+    if user is None or user.apply_firebase_user(firebase_user_info) or user.needs_touch():
+        return None
+    # attach_user_to_request reuses it if the client's copy is stale
+    g.user_model = user
+    g.user_model_source = firebase_user_info
+    cache = get_user_cache()
+    if cache is not None:
+        cache.put(user)
+    return version_of(user)
+
+
+def matching_etag(etags, etag, weak=True):
+    """
+    Find which representation of an ETag a conditional header names.
+
+    Compressed responses carry the ETag with their content coding
+    appended (see app.compression), so a client's copy in any coding
+    matches.
+
+    Args:
+        etags (ETags): If-None-Match or If-Match of the request
+        etag (str): Unquoted ETag of the uncompressed representation
+        weak (bool): Compare weakly, as for If-None-Match
+
+    Returns:
+        str: The matching ETag, or None
+    """
+    for encoding in (None, *ENCODING_SUFFIXES):
+        candidate = encoded_etag(etag, encoding)
+        if etags.contains_weak(candidate) if weak else etags.contains(candidate):
+            return candidate
+    return None
+
+
+def not_modified(etag):
+    """
+    Build a 304 response carrying the ETag.
+
+    Returns:
+        Response: Empty 304 response
+    """
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def if_none_match(etag_for):
+    """
+    Answer a conditional GET from the version alone, when possible.
+
+    Args:
+        etag_for (callable): Maps a UserVersion to the ETag of the
+            representation being requested
+
+    Returns:
+        Response: 304 response if the client's copy is current, else None
+    """
+    if not request.if_none_match:
+        return None
+    try:
+        version = current_version(g.user)
+    except Exception as e:
+        current_app.logger.warning(f"Version check failed, loading user: {e}")
+        return None
+    if version is None:
+        return None
+    etag = matching_etag(request.if_none_match, etag_for(version))
+    if etag is not None:
+        return not_modified(etag)
+    return None
+
+
+def if_match_failed(etag):
+    """
+    Check an If-Match precondition against the current ETag.
+
+    Returns:
+        bool: True if the request carries If-Match and it does not match
+    """
+    return bool(request.if_match) and matching_etag(request.if_match, etag, weak=False) is None
+
+
+def with_etag(response, etag):
+    """
+    Attach the ETag and revalidation headers to a full response.
+
+    Returns:
+        Response: The same response
+    """
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -2,13 +2,27 @@
 Main Flask application factory for cloudrun-init.
 """
 import os
-from flask import Flask, g, request, jsonify
+from datetime import timedelta
+from flask import Flask, jsonify, send_from_directory
 from flask_cors import CORS
-from google.cloud import ndb
 
 # Import blueprints
-from app.routes import auth_bp
+from app.routes import auth_bp, admin_bp
 from app.routes.profile import profile_bp
+from app.models.user import User
+from app.models.user_cache import UserCache
+from app.models.repository import create_user_repository
+from app.commands import register_commands
+from app.auth.token_cache import TokenCache
+from app.auth.firebase import init_firebase_state, init_key_manager
+from app.metrics import init_metrics
+from app.serialization import init_serialization
+from app.warmup import init_warmup
+from app.singleflight import init_singleflight
+from app.auth.session import init_sessions
+from app.auth.screen import init_token_screen
+from app.ratelimit import init_rate_limiting
+from app.compression import init_compression, serve_asset
 
 def create_app(test_config=None):
     """Application factory pattern for Flask app."""
@@ -19,8 +33,49 @@ def create_app(test_config=None):
         # Load the instance config, if it exists, when not testing
         app.config.from_mapping(
             SECRET_KEY=os.environ.get('SECRET_KEY', 'dev-secret-key'),
+            SECRET_KEY_FALLBACKS=[key for key in os.environ.get('SECRET_KEY_FALLBACKS', '').split(',') if key],
+            AUTH_SESSION_ENABLED=os.environ.get('AUTH_SESSION_ENABLED', 'false').lower() == 'true',
+            AUTH_SESSION_TTL=int(os.environ.get('AUTH_SESSION_TTL', '3600')),
             FIREBASE_PROJECT_ID=os.environ.get('FIREBASE_PROJECT_ID'),
             GOOGLE_CLOUD_PROJECT=os.environ.get('GOOGLE_CLOUD_PROJECT'),
+            USER_LEGACY_UID_LOOKUP=os.environ.get('USER_LEGACY_UID_LOOKUP', 'true').lower() == 'true',
+            USER_TOUCH_INTERVAL_MINUTES=int(os.environ.get('USER_TOUCH_INTERVAL_MINUTES', '0')),
+            TOKEN_CACHE_SIZE=int(os.environ.get('TOKEN_CACHE_SIZE', '1024')),
+            TOKEN_SCREEN_ENABLED=os.environ.get('TOKEN_SCREEN_ENABLED', 'false').lower() == 'true',
+            TOKEN_SCREEN_MAX_LENGTH=int(os.environ.get('TOKEN_SCREEN_MAX_LENGTH', '4096')),
+            TOKEN_SCREEN_NEGATIVE_CACHE_SIZE=int(os.environ.get('TOKEN_SCREEN_NEGATIVE_CACHE_SIZE', '4096')),
+            TOKEN_SCREEN_NEGATIVE_TTL=int(os.environ.get('TOKEN_SCREEN_NEGATIVE_TTL', '60')),
+            RATELIMIT_ENABLED=os.environ.get('RATELIMIT_ENABLED', 'false').lower() == 'true',
+            RATELIMIT_AUTH=os.environ.get('RATELIMIT_AUTH', '10/second'),
+            RATELIMIT_AUTH_BURST=int(os.environ.get('RATELIMIT_AUTH_BURST', '20')),
+            RATELIMIT_PROXY_COUNT=int(os.environ.get('RATELIMIT_PROXY_COUNT', '1')),
+            RATELIMIT_STORAGE=os.environ.get('RATELIMIT_STORAGE', 'memory'),
+            RATELIMIT_STORAGE_URL=os.environ.get('RATELIMIT_STORAGE_URL'),
+            RATELIMIT_STORAGE_RETRY=int(os.environ.get('RATELIMIT_STORAGE_RETRY', '30')),
+            RATELIMIT_STORAGE_SOCKET_TIMEOUT=float(os.environ.get('RATELIMIT_STORAGE_SOCKET_TIMEOUT', '0.1')),
+            FIREBASE_CHECK_REVOKED=os.environ.get('FIREBASE_CHECK_REVOKED', 'false').lower() == 'true',
+            ADMIN_UIDS=[uid for uid in os.environ.get('ADMIN_UIDS', '').split(',') if uid],
+            USER_CACHE_TTL=int(os.environ.get('USER_CACHE_TTL', '30')),
+            FIREBASE_KEY_PREFETCH=os.environ.get('FIREBASE_KEY_PREFETCH', 'true').lower() == 'true',
+            FIREBASE_CERTS_SOURCE=os.environ.get('FIREBASE_CERTS_SOURCE'),
+            USER_STORE=os.environ.get('USER_STORE', 'ndb'),
+            USER_STORE_PATH=os.environ.get('USER_STORE_PATH'),
+            SERIALIZATION_CACHE_SIZE=int(os.environ.get('SERIALIZATION_CACHE_SIZE', '4096')),
+            NDB_GLOBAL_CACHE=os.environ.get('NDB_GLOBAL_CACHE'),
+            NDB_GLOBAL_CACHE_URL=os.environ.get('NDB_GLOBAL_CACHE_URL'),
+            NDB_GLOBAL_CACHE_SOCKET_TIMEOUT=float(os.environ.get('NDB_GLOBAL_CACHE_SOCKET_TIMEOUT', '0.1')),
+            NDB_GLOBAL_CACHE_RETRY=int(os.environ.get('NDB_GLOBAL_CACHE_RETRY', '30')),
+            USER_GLOBAL_CACHE_TIMEOUT=int(os.environ.get('USER_GLOBAL_CACHE_TIMEOUT', '300')),
+            WARMUP=os.environ.get('WARMUP', 'background'),
+            SINGLEFLIGHT_ENABLED=os.environ.get('SINGLEFLIGHT_ENABLED', 'true').lower() == 'true',
+            METRICS_ENABLED=os.environ.get('METRICS_ENABLED', 'true').lower() == 'true',
+            METRICS_TOKEN=os.environ.get('METRICS_TOKEN'),
+            COMPRESSION_ENABLED=os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true',
+            COMPRESSION_MIN_SIZE=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+            COMPRESSION_GZIP_LEVEL=int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6')),
+            COMPRESSION_BROTLI_QUALITY=int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4')),
+            STATIC_PRECOMPRESS=os.environ.get('STATIC_PRECOMPRESS', 'true').lower() == 'true',
+            STATIC_MAX_AGE=int(os.environ.get('STATIC_MAX_AGE', '3600')),
         )
     else:
         # Load the test config if passed in
@@ -35,24 +90,72 @@ def create_app(test_config=None):
     # Initialize CORS
     CORS(app, origins=['http://localhost:3000', 'http://localhost:5000'])
 
-    # Initialize NDB client
-    try:
-        from app.ndb_client import init_ndb_client
-        ndb_client = init_ndb_client()
-        ndb_client.context().activate()
-        app.logger.info("NDB client initialized successfully")
-    except Exception as e:
-        # Log the error but don't fail the app startup
-        app.logger.warning(f"NDB initialization failed (this is OK for local development): {e}")
-        app.logger.info("NDB will not be available. Set DATASTORE_PROJECT_ID and DATASTORE_EMULATOR_HOST for local development.")
-        # Set a flag to indicate NDB is not available
+    # Per-endpoint latency and phase timings, served on /metrics
+    if app.config.get('METRICS_ENABLED', True):
+        init_metrics(app)
+
+    # Cache verified ID tokens so each token is only verified once
+    token_cache_size = app.config.get('TOKEN_CACHE_SIZE', 1024)
+    if token_cache_size > 0:
+        app.extensions['token_cache'] = TokenCache(max_size=token_cache_size)
+
+    # Reject malformed, foreign and expired tokens before RSA verification (opt-in)
+    init_token_screen(app)
+
+    # Token-bucket limits on the unauthenticated /auth endpoints (opt-in)
+    init_rate_limiting(app)
+
+    # Cache recently seen users per worker (short TTL, UID keyed)
+    user_cache_ttl = app.config.get('USER_CACHE_TTL', 30)
+    if user_cache_ttl > 0:
+        app.extensions['user_cache'] = UserCache(ttl=user_cache_ttl)
+
+    # Cache encoded user payloads per (uid, updated_at)
+    init_serialization(app)
+
+    # Coalesce concurrent verification of one token / loading of one user
+    init_singleflight(app)
+
+    # Signed session cookies that skip Firebase verification (opt-in)
+    init_sessions(app)
+
+    # Firebase is initialized once; request decorators only read the outcome
+    init_firebase_state(app, initialize=False)
+
+    # Load Firebase signing keys before the first request needs them
+    init_key_manager(app, start=False)
+
+    # User storage backend (ndb, memory or sqlite)
+    app.extensions['user_repository'] = create_user_repository(app)
+    if app.config.get('USER_STORE', 'ndb') != 'ndb':
+        app.logger.info(f"Using {app.config['USER_STORE']} user store")
         app.config['NDB_AVAILABLE'] = False
-    else:
-        app.config['NDB_AVAILABLE'] = True
+
+    # Initialize Firebase, the signing keys and the process-wide NDB client
+    # (per-request contexts are created from it by with_ndb_context), now
+    # or on a background thread depending on WARMUP
+    init_warmup(app)
+
+    # Keep reading auto-ID users until the key migration has run
+    User.legacy_uid_lookup = app.config.get('USER_LEGACY_UID_LOOKUP', True)
+
+    # Only rewrite unchanged users to refresh updated_at this often
+    touch_minutes = app.config.get('USER_TOUCH_INTERVAL_MINUTES')
+    User.touch_interval = timedelta(minutes=touch_minutes) if touch_minutes else None
+
+    # Seconds a user stays in the NDB global cache (when one is configured)
+    User._global_cache_timeout = app.config.get('USER_GLOBAL_CACHE_TIMEOUT', 300)
+
+    # Precompressed static files with content-hash ETags; compressed JSON
+    init_compression(app)
 
     # Register blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(profile_bp)
+    app.register_blueprint(admin_bp)
+
+    # Register CLI commands
+    register_commands(app)
 
     # Error handlers
     @app.errorhandler(404)
@@ -82,22 +185,22 @@ def create_app(test_config=None):
     # Root endpoint
     @app.route('/')
     def index():
-        return app.send_static_file('index.html')
+        return serve_asset('index.html')
+
+    # Optional: Serve Firebase test files from the project root (not part of
+    # the image, and not under /static/)
+    project_root = os.path.dirname(app.root_path)
 
-    # Optional: Serve Firebase test files
     @app.route('/test/firebase')
     def firebase_test():
-        return app.send_static_file('../test_firebase_config.html')
+        return send_from_directory(project_root, 'test_firebase_config.html')
     
     @app.route('/test/simple')
     def simple_test():
-        return app.send_static_file('../simple_firebase_test.html')
+        return send_from_directory(project_root, 'simple_firebase_test.html')
 
     return app
 
 
-# For gunicorn
-app = create_app()
-
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
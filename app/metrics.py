@@ -0,0 +1,337 @@
+"""
+Request timing instrumentation for cloudrun-init.
+
+Each request carries a small RequestTimings record in a context variable.
+Code on the hot path adds to it (token verification, NDB context setup,
+Datastore RPCs, JSON serialization) and the app folds it into per-endpoint
+histograms once the response is ready. The histograms are exposed in
+Prometheus text format on /metrics.
+
+Metrics are per process: with several gunicorn workers, each worker
+reports its own numbers.
+
+/metrics is only served when METRICS_TOKEN is set, to scrapers sending
+``Authorization: Bearer <METRICS_TOKEN>``.
+"""
+import bisect
+import contextvars
+import functools
+import hmac
+import threading
+import time
+
+import grpc
+from flask.json.provider import DefaultJSONProvider
+
+# Latency bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Request phases recorded by the app
+PHASE_TOKEN_VERIFY = 'token_verify'
+PHASE_NDB_CONTEXT = 'ndb_context'
+PHASE_DATASTORE = 'datastore'
+PHASE_SERIALIZATION = 'serialization'
+PHASE_COMPRESSION = 'compression'
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Timings collected while serving a single request."""
+
+    __slots__ = ('started', 'phases', 'rpcs')
+
+    def __init__(self, started):
+        self.started = started
+        self.phases = {}
+        # (rpc name, seconds); appended from gRPC callback threads
+        self.rpcs = []
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+def start_request():
+    """
+    Start collecting timings for the current request.
+
+    Returns:
+        contextvars.Token: Token to pass to finish_request
+    """
+    return _current.set(RequestTimings(time.perf_counter()))
+
+
+def finish_request(token):
+    """Stop collecting timings for the current request."""
+    _current.reset(token)
+
+
+def current_timings():
+    """Get the timings of the current request, or None outside a request."""
+    return _current.get()
+
+
+def record_phase(phase, seconds):
+    """Add time spent in a phase to the current request, if any."""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+
+def timed(phase):
+    """
+    Decorator recording the time spent in a function as a request phase.
+
+    Usage:
+        @timed(PHASE_TOKEN_VERIFY)
+        def verify(token):
+            ...
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_phase(phase, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class Histogram:
+    """Cumulative histogram with fixed bucket bounds."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Get cumulative bucket counts.
+
+        Returns:
+            list: (upper bound, count) pairs ending with ('+Inf', total)
+        """
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metrics:
+    """
+    Per-process request metrics.
+
+    Usage:
+        metrics = Metrics()
+        metrics.observe_request('GET', '/profile/', 200, timings)
+        text = metrics.render()
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._phases = {}
+        self._rpcs = {}
+        self._collectors = []
+
+    def add_collector(self, collector):
+        """
+        Add a source of extra series to render.
+
+        Args:
+            collector (callable): Returns a list of exposition format lines
+        """
+        self._collectors.append(collector)
+
+    def _histogram(self, series, labels):
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram(self.buckets)
+        return histogram
+
+    def observe_request(self, method, endpoint, status, timings, now=None):
+        """
+        Record a finished request.
+
+        Args:
+            method (str): HTTP method
+            endpoint (str): URL rule the request matched
+            status (int): Response status code
+            timings (RequestTimings): Timings collected for the request
+            now (float): perf_counter() at completion, defaults to now
+        """
+        elapsed = (now or time.perf_counter()) - timings.started
+        phases = dict(timings.phases)
+        rpcs = list(timings.rpcs)
+        if rpcs:
+            phases[PHASE_DATASTORE] = phases.get(PHASE_DATASTORE, 0.0) + sum(seconds for _, seconds in rpcs)
+
+        with self._lock:
+            self._histogram(self._latency, (method, endpoint, str(status))).observe(elapsed)
+            for phase, seconds in phases.items():
+                self._histogram(self._phases, (endpoint, phase)).observe(seconds)
+            for rpc, _ in rpcs:
+                key = (endpoint, rpc)
+                self._rpcs[key] = self._rpcs.get(key, 0) + 1
+
+    def reset(self):
+        """Drop all recorded series."""
+        with self._lock:
+            self._latency.clear()
+            self._phases.clear()
+            self._rpcs.clear()
+
+    def render(self):
+        """
+        Render all series in Prometheus text exposition format.
+
+        Returns:
+            str: Metrics text
+        """
+        with self._lock:
+            latency = {labels: (h.cumulative(), h.sum, h.count) for labels, h in self._latency.items()}
+            phases = {labels: (h.cumulative(), h.sum, h.count) for labels, h in self._phases.items()}
+            rpcs = dict(self._rpcs)
+
+        lines = []
+        self._render_histogram(lines, 'app_request_duration_seconds',
+                               'Request latency by endpoint.',
+                               ('method', 'endpoint', 'status'), latency)
+        self._render_histogram(lines, 'app_request_phase_seconds',
+                               'Time spent per request in token verification, NDB context setup, '
+                               'Datastore RPCs and JSON serialization.',
+                               ('endpoint', 'phase'), phases)
+        lines.append('# HELP app_datastore_rpcs_total Datastore RPCs issued by endpoint.')
+        lines.append('# TYPE app_datastore_rpcs_total counter')
+        for labels, count in sorted(rpcs.items()):
+            lines.append(f"app_datastore_rpcs_total{_labels(('endpoint', 'rpc'), labels)} {count}")
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histogram(lines, name, help_text, label_names, series):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, (buckets, total, count) in sorted(series.items()):
+            for bound, cumulative in buckets:
+                le = f'le="{bound}"'
+                lines.append(f'{name}_bucket{_labels(label_names, labels, le)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(label_names, labels)} {total}')
+            lines.append(f'{name}_count{_labels(label_names, labels)} {count}')
+
+
+class DatastoreRPCTimer(grpc.UnaryUnaryClientInterceptor):
+    """
+    gRPC interceptor recording Datastore RPC count and time per request.
+
+    NDB issues every RPC from the request thread, so the request's timings
+    are captured when the call starts and completed from the callback.
+    """
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        timings = _current.get()
+        if timings is None:
+            return continuation(client_call_details, request)
+
+        rpc = client_call_details.method.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        call = continuation(client_call_details, request)
+        call.add_done_callback(
+            lambda _: timings.rpcs.append((rpc, time.perf_counter() - started)))
+        return call
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider recording serialization time as a request phase."""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            record_phase(PHASE_SERIALIZATION, time.perf_counter() - started)
+
+
+def init_metrics(app):
+    """
+    Install request timing hooks and the /metrics endpoint.
+
+    The endpoint is registered only when METRICS_TOKEN is set, and
+    answers 401 to requests without it as a bearer token.
+
+    Args:
+        app (Flask): Application to instrument
+
+    Returns:
+        Metrics: The app's metrics registry
+    """
+    from flask import g, request
+
+    metrics = Metrics()
+    app.extensions['metrics'] = metrics
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_request_timing():
+        g._timings_token = start_request()
+
+    @app.after_request
+    def record_request_timing(response):
+        timings = _current.get()
+        if timings is not None:
+            rule = request.url_rule
+            metrics.observe_request(request.method, rule.rule if rule else 'unmatched',
+                                    response.status_code, timings)
+        return response
+
+    @app.teardown_request
+    def finish_request_timing(exc=None):
+        token = g.pop('_timings_token', None)
+        if token is not None:
+            try:
+                finish_request(token)
+            except (ValueError, RuntimeError):
+                # Token from another context, e.g. a copied test request
+                pass
+
+    token = app.config.get('METRICS_TOKEN')
+    if not token:
+        app.logger.info("METRICS_TOKEN not set: /metrics is not served")
+        return metrics
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.encode(), token.encode()):
+            return app.response_class('Unauthorized\n', status=401, mimetype='text/plain',
+                                      headers={'WWW-Authenticate': 'Bearer'})
+        return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
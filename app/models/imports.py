@@ -0,0 +1,342 @@
+"""
+Bulk user import for cloudrun-init.
+
+Records are streamed from a JSONL or CSV file and written with
+``ndb.put_multi`` in batches, several batches at a time on a thread pool.
+Only the batches being built or written are held in memory, so the size
+of the file does not matter.
+
+Records may use the claim names of a Firebase ID token (uid, name,
+picture, ...) or the field names of Firebase user records (localId,
+displayName, photoUrl, ...), one object per JSONL line or one row per
+CSV line under a header row. ``firebase auth:export`` output is neither
+(its JSON is a single document, its CSV has no header) and must be
+converted first. Later records for a UID win, as they would in a
+sequential import.
+"""
+import csv
+import json
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from google.api_core import exceptions as core_exceptions
+from google.cloud import ndb
+from app.models.user import User
+
+FORMATS = ('jsonl', 'csv')
+
+# Record fields accepted for each Firebase user info key
+FIELD_NAMES = {
+    'uid': ('uid', 'localId', 'user_id'),
+    'email': ('email',),
+    'name': ('name', 'displayName', 'display_name'),
+    'email_verified': ('email_verified', 'emailVerified'),
+    'picture': ('picture', 'photoUrl', 'photo_url'),
+    'provider_id': ('provider_id', 'providerId'),
+}
+
+# Errors worth retrying a batch for: contention, overload and timeouts
+RETRY_ERRORS = (
+    core_exceptions.Aborted,
+    core_exceptions.DeadlineExceeded,
+    core_exceptions.InternalServerError,
+    core_exceptions.ResourceExhausted,
+    core_exceptions.ServiceUnavailable,
+    core_exceptions.Unknown,
+)
+
+
+def detect_format(path):
+    """
+    Guess the record format from a file name.
+
+    Returns:
+        str: 'csv' for .csv files, 'jsonl' otherwise
+    """
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_records(stream, fmt):
+    """
+    Stream records from a JSONL or CSV file.
+
+    Args:
+        stream (file): Text stream to read
+        fmt (str): 'jsonl' or 'csv' (with a header row)
+
+    Yields:
+        dict: One record per row, or None for a line that is not valid JSON
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield record if isinstance(record, dict) else None
+
+
+def _field(record, key):
+    for name in FIELD_NAMES[key]:
+        value = record.get(name)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def user_info_from_record(record):
+    """
+    Convert an import record to Firebase user info.
+
+    Returns:
+        dict: User info as produced by verify_firebase_token, or None if
+            the record has no uid or email or a providerUserInfo that is
+            not a list of objects (CSV cells may hold it as JSON)
+    """
+    if not record:
+        return None
+    uid, email = _field(record, 'uid'), _field(record, 'email')
+    if not uid or not email:
+        return None
+
+    user_info = {'uid': str(uid), 'email': email}
+    for key in ('name', 'picture', 'provider_id'):
+        value = _field(record, key)
+        if value is not None:
+            user_info[key] = value
+    if 'provider_id' not in user_info and record.get('providerUserInfo'):
+        providers = record['providerUserInfo']
+        if isinstance(providers, str):
+            try:
+                providers = json.loads(providers)
+            except ValueError:
+                return None
+        if not isinstance(providers, list) or not all(isinstance(p, dict) for p in providers):
+            return None
+        if providers:
+            user_info['provider_id'] = providers[0].get('providerId')
+
+    verified = _field(record, 'email_verified')
+    if verified is not None:
+        if isinstance(verified, str):
+            verified = verified.strip().lower() in ('true', '1', 'yes')
+        user_info['email_verified'] = bool(verified)
+    return user_info
+
+
+def _new_user(user_info):
+    return User(
+        id=user_info['uid'],
+        uid=user_info['uid'],
+        email=user_info['email'],
+        display_name=user_info.get('name'),
+        email_verified=user_info.get('email_verified', False),
+        picture=user_info.get('picture'),
+        provider_id=user_info.get('provider_id')
+    )
+
+
+def write_batch(user_infos, lookup=True):
+    """
+    Write one batch of users with a single put_multi.
+
+    With lookup, existing users are read first (one get_multi) and the
+    record is applied as a login would (see User.apply_firebase_user):
+    created_at survives, and so do fields the record leaves out, but a
+    record's name replaces display_name. Unchanged users are not
+    rewritten; re-importing a file then costs reads only. Without
+    lookup, every user is written as new. Users still on auto-ID keys
+    are not found; run migrate_user_keys first. Must be called within
+    an NDB context.
+
+    Args:
+        user_infos (list): Firebase user info, one per UID
+        lookup (bool): Merge into existing users
+
+    Returns:
+        tuple: (number of users written, number left unchanged)
+    """
+    users = [_new_user(user_info) for user_info in user_infos]
+    if lookup:
+        existing = ndb.get_multi([user.key for user in users], use_cache=False)
+        users = [
+            user if current is None else current
+            for user, current, user_info in zip(users, existing, user_infos)
+            if current is None or current.apply_firebase_user(user_info)
+        ]
+    if users:
+        ndb.put_multi(users, use_cache=False)
+    return len(users), len(user_infos) - len(users)
+
+
+def _write_with_retry(context_factory, user_infos, lookup, retries, sleep):
+    for attempt in range(retries + 1):
+        try:
+            with context_factory():
+                return write_batch(user_infos, lookup=lookup) + (attempt,)
+        except RETRY_ERRORS:
+            if attempt == retries:
+                raise
+            # Exponential backoff with jitter, so retried batches spread out
+            sleep(min(0.1 * 2 ** attempt, 10) * (0.5 + random.random()))
+
+
+def load_checkpoint(path, source):
+    """
+    Read an import checkpoint.
+
+    Returns:
+        dict: Checkpoint with position and stats, or None if there is none
+
+    Raises:
+        ValueError: If the checkpoint belongs to another source file
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('source') != source:
+        raise ValueError(f"Checkpoint {path} is for {checkpoint.get('source')}, not {source}")
+    return checkpoint
+
+
+def save_checkpoint(path, source, position, stats):
+    """Atomically record that the first position records are imported."""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'source': source, 'position': position, 'stats': stats}, f)
+    os.replace(tmp_path, path)
+
+
+def import_users(records, context_factory, batch_size=500, concurrency=8, lookup=True,
+                 retries=5, start=0, stats=None, checkpoint=None, progress=None,
+                 sleep=time.sleep):
+    """
+    Import users from a stream of records.
+
+    Up to concurrency batches are written at once, each in its own NDB
+    context (from context_factory) on a worker thread. A UID repeated
+    within a batch is written once, from its last record; a batch holding
+    a UID that is still being written by another batch waits for it, so
+    later records always win. Batches failing with contention or
+    transient errors are retried with backoff up to retries times.
+
+    Such repeats are counted as coalesced. UIDs are not remembered once
+    their batch is written, so a UID repeated further apart in the file
+    is simply written again, and is not counted.
+
+    Progress is tracked as the number of leading records whose batches
+    have all been written. checkpoint is called with it after each batch,
+    and an interrupted import can be resumed by passing it back as start.
+
+    Args:
+        records (iterable): Records from read_records
+        context_factory (callable): Returns a new NDB context manager
+        batch_size (int): Users per put_multi (Datastore allows 500)
+        concurrency (int): Batches written at once
+        lookup (bool): Merge into existing users (see write_batch)
+        retries (int): Retries per batch
+        start (int): Number of leading records to skip (already imported)
+        stats (dict): Counts to continue from when resuming
+        checkpoint (callable): Called with (position, stats)
+        progress (callable): Called with the running stats after each batch
+
+    Returns:
+        dict: Counts of records read, users written and unchanged,
+            coalesced and invalid records, batches and retries
+    """
+    stats = dict({'read': 0, 'written': 0, 'unchanged': 0, 'coalesced': 0,
+                  'invalid': 0, 'batches': 0, 'retries': 0}, **(stats or {}))
+    submitted = deque()    # (end position, future) in submission order
+    batch_uids = {}        # future -> UIDs it writes
+    in_flight = {}         # uid -> future of the batch writing it
+    counted = set()
+    position = start
+
+    def finish(futures):
+        for future in futures:
+            if future in counted:
+                continue
+            written, unchanged, attempts = future.result()
+            counted.add(future)
+            stats['written'] += written
+            stats['unchanged'] += unchanged
+            stats['retries'] += attempts
+            stats['batches'] += 1
+            for uid in batch_uids.pop(future):
+                if in_flight.get(uid) is future:
+                    del in_flight[uid]
+        done = None
+        while submitted and submitted[0][1] in counted:
+            done, future = submitted.popleft()
+            counted.discard(future)
+        if done is not None:
+            if checkpoint:
+                checkpoint(done, dict(stats))
+            if progress:
+                progress(dict(stats))
+
+    def submit(batch, waits, end):
+        pending = [future for _, future in submitted if future not in counted]
+        while len(pending) >= concurrency or any(not future.done() for future in waits):
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            finish(finished)
+            pending = [future for future in pending if future not in finished]
+        future = pool.submit(_write_with_retry, context_factory, list(batch.values()),
+                             lookup, retries, sleep)
+        batch_uids[future] = list(batch)
+        for uid in batch:
+            in_flight[uid] = future
+        submitted.append((end, future))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        try:
+            batch, waits = {}, set()
+            for index, record in enumerate(records):
+                if index < start:
+                    continue
+                position = index + 1
+                stats['read'] += 1
+                user_info = user_info_from_record(record)
+                if user_info is None:
+                    stats['invalid'] += 1
+                    continue
+
+                uid = user_info['uid']
+                if uid in batch:
+                    stats['coalesced'] += 1
+                    del batch[uid]
+                elif uid in in_flight:
+                    stats['coalesced'] += 1
+                    waits.add(in_flight[uid])
+                batch[uid] = user_info
+
+                if len(batch) >= batch_size:
+                    submit(batch, waits, position)
+                    batch, waits = {}, set()
+            if batch:
+                submit(batch, waits, position)
+
+            finish([future for _, future in submitted])
+        except BaseException:
+            # Keep the checkpoint at the last fully written prefix
+            for _, future in submitted:
+                future.cancel()
+            finished = [future for _, future in submitted if not future.cancelled()]
+            wait(finished)
+            for _, future in list(submitted):
+                if future.cancelled() or future.exception() is not None:
+                    break
+                finish([future])
+            raise
+
+    if checkpoint:
+        checkpoint(position, dict(stats))
+    return stats
@@ -0,0 +1,87 @@
+"""
+Data migrations for cloudrun-init models.
+"""
+from datetime import datetime
+from google.cloud import ndb
+from app.models.user import User
+
+
+def _legacy_user_keys(batch_size):
+    """
+    Get the next batch of auto-ID User keys.
+
+    Keys with numeric IDs sort before keys with names, so ordering by key
+    returns legacy entities first and stops at the first UID-keyed one.
+    """
+    keys = User.query().order(User._key).fetch(batch_size, keys_only=True)
+    return [key for key in keys if key.integer_id() is not None]
+
+
+def _last_modified(user):
+    return user.updated_at or user.created_at or datetime.min
+
+
+@ndb.transactional()
+def _migrate_batch(legacy_keys):
+    """
+    Rewrite a batch of auto-ID users to UID keys in one transaction.
+
+    Returns:
+        tuple: (number of UID-keyed entities written, number of legacy
+            entities deleted)
+    """
+    legacy_users = [user for user in ndb.get_multi(legacy_keys) if user is not None]
+
+    # Keep the most recently updated entity when a UID was duplicated
+    latest = {}
+    for user in sorted(legacy_users, key=_last_modified):
+        latest[user.uid] = user
+
+    uids = list(latest)
+    existing = ndb.get_multi([User.key_for_uid(uid) for uid in uids])
+    to_write = [
+        User(id=uid, **{name: getattr(latest[uid], name) for name in User._properties})
+        for uid, current in zip(uids, existing)
+        if current is None
+    ]
+
+    ndb.put_multi(to_write)
+    ndb.delete_multi([user.key for user in legacy_users])
+    return len(to_write), len(legacy_users)
+
+
+def migrate_user_keys(batch_size=100, max_batches=None, progress=None):
+    """
+    Rewrite auto-ID User entities to entities keyed by Firebase UID.
+
+    Safe to run while the service is serving: ``User.get_by_uid`` reads the
+    UID key first and falls back to the uid query, and each batch is moved
+    in its own transaction. An existing UID-keyed entity always wins over a
+    legacy one, and a request that loaded a legacy entity before its batch
+    was moved saves it under the UID key (see ``User._pre_put_hook``), so
+    the update is kept and the legacy entity is not brought back. The migration is idempotent and can be re-run or resumed at
+    any time. Must be called within an NDB context.
+
+    Args:
+        batch_size (int): Number of legacy entities per transaction
+        max_batches (int): Stop after this many batches (None for all)
+        progress (callable): Called with the running stats after each batch
+
+    Returns:
+        dict: Counts of batches, written and deleted entities
+    """
+    stats = {'batches': 0, 'written': 0, 'deleted': 0}
+
+    while max_batches is None or stats['batches'] < max_batches:
+        legacy_keys = _legacy_user_keys(batch_size)
+        if not legacy_keys:
+            break
+
+        written, deleted = _migrate_batch(legacy_keys)
+        stats['batches'] += 1
+        stats['written'] += written
+        stats['deleted'] += deleted
+        if progress:
+            progress(stats)
+
+    return stats
@@ -0,0 +1,552 @@
+"""
+User storage backends for cloudrun-init.
+
+The app reads and writes users through a UserRepository chosen by the
+USER_STORE setting:
+
+    ndb     Cloud Datastore through google-cloud-ndb (default)
+    memory  Process-local dictionary; nothing is persisted
+    sqlite  Local SQLite database file (USER_STORE_PATH) in WAL mode
+
+All backends hand out ``User`` instances. Only the NDB backend gives them
+keys; the others identify users by ``uid`` alone.
+"""
+import base64
+import bisect
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from datetime import datetime
+from google.cloud import ndb
+from app.models.user import User
+from app.ndb_client import with_ndb_context
+
+# Property names stored by every backend, in a fixed order
+USER_FIELDS = ('uid', 'email', 'display_name', 'created_at', 'updated_at',
+               'email_verified', 'picture', 'provider_id')
+
+# Timestamps identifying the stored state of a user
+UserVersion = namedtuple('UserVersion', ['uid', 'created_at', 'updated_at'])
+
+
+def encode_cursor(uid):
+    """Encode the last UID of a page as an opaque cursor."""
+    return base64.urlsafe_b64encode(uid.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    return base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+
+
+def _row(values, fields):
+    return {name: values[name].isoformat() if isinstance(values[name], datetime) else values[name]
+            for name in fields}
+
+
+class UserRepository:
+    """
+    Interface for user storage.
+
+    Subclasses implement the lookups and ``save``; the Firebase sync logic
+    (``load_for_update``, ``get_or_create``, ``update_from_firebase_user``)
+    is shared.
+    """
+
+    name = None
+
+    # Whether get_version reads the whole user anyway, so a caller should
+    # load the user instead and keep it (see app.conditional.current_version)
+    version_loads_user = False
+
+    def available(self):
+        """Return True if the backend can serve requests."""
+        return True
+
+    def get_by_uid(self, uid):
+        """
+        Get user by Firebase UID.
+
+        Returns:
+            User: User if found, None otherwise
+        """
+        raise NotImplementedError
+
+    def get_many_by_uid(self, uids):
+        """
+        Get many users by Firebase UID.
+
+        Returns:
+            list: Users in the same order as uids, None for misses
+        """
+        raise NotImplementedError
+
+    def get_by_email(self, email):
+        """
+        Get user by email address.
+
+        Returns:
+            User: User if found, None otherwise
+        """
+        raise NotImplementedError
+
+    def get_version(self, uid):
+        """
+        Get a user's timestamps, without loading the whole user unless
+        version_loads_user is set.
+
+        Returns:
+            UserVersion: created_at and updated_at, or None if not found
+        """
+        raise NotImplementedError
+
+    def list_page(self, fields, page_size=100, cursor=None):
+        """
+        Get one page of users, ordered by the backend.
+
+        Returns:
+            tuple: (list of dicts with the requested fields, next cursor
+                or None, whether more results may exist)
+        """
+        raise NotImplementedError
+
+    def save(self, user):
+        """
+        Write a user, setting created_at and updated_at like NDB does.
+
+        Returns:
+            User: The saved user
+        """
+        raise NotImplementedError
+
+    def new_user(self, firebase_user_info):
+        """
+        Build an unsaved user from Firebase user info.
+
+        Returns:
+            User: New user, not yet written
+        """
+        return User(
+            uid=firebase_user_info['uid'],
+            email=firebase_user_info['email'],
+            display_name=firebase_user_info.get('name'),
+            email_verified=firebase_user_info.get('email_verified', False),
+            picture=firebase_user_info.get('picture'),
+            provider_id=firebase_user_info.get('provider_id')
+        )
+
+    def create(self, firebase_user_info):
+        """
+        Create a new user from Firebase user info.
+
+        Returns:
+            User: Newly created user
+        """
+        return self.save(self.new_user(firebase_user_info))
+
+    def update_from_firebase_user(self, user, firebase_user_info, force=False):
+        """
+        Copy Firebase user info onto a user, writing only if needed.
+
+        See ``User.update_from_firebase_user``.
+
+        Returns:
+            User: The updated user
+        """
+        changed = user.apply_firebase_user(firebase_user_info)
+        if changed or force or user.needs_touch():
+            self.save(user)
+        return user
+
+    def load_for_update(self, firebase_user_info):
+        """
+        Get or build the user for a token without writing it.
+
+        The token's claims are applied. A caller that changes the user
+        further saves it once afterwards, instead of once for the claims
+        and once for its own change.
+
+        Returns:
+            tuple: (User, whether it needs saving, whether it is new)
+        """
+        user = self.get_by_uid(firebase_user_info['uid'])
+        if user is None:
+            return self.new_user(firebase_user_info), True, True
+        return user, user.apply_firebase_user(firebase_user_info) or user.needs_touch(), False
+
+    def get_or_create(self, firebase_user_info):
+        """
+        Get existing user or create a new one from Firebase user info.
+
+        Returns:
+            tuple: (User, whether it was created)
+        """
+        user, dirty, created = self.load_for_update(firebase_user_info)
+        if dirty:
+            self.save(user)
+        return user, created
+
+    def update(self, firebase_user_info, change):
+        """
+        Read a user from the store, change it and save it.
+
+        The user is read from the store itself, never a cache, with the
+        token's claims applied. The NDB backend runs the read, change and
+        write in a transaction, so a concurrent write makes it start over
+        instead of being overwritten.
+
+        Args:
+            firebase_user_info (dict): User info from Firebase token
+            change (callable): Called with (user, whether it needs saving);
+                returns whether to save it, or raises to write nothing
+
+        Returns:
+            User: The user, saved if change asked for it
+        """
+        user, dirty, _ = self.load_for_update(firebase_user_info)
+        if change(user, dirty):
+            self.save(user)
+        return user
+
+
+class NDBUserRepository(UserRepository):
+    """Users stored in Cloud Datastore through the ``User`` NDB model."""
+
+    name = 'ndb'
+    version_loads_user = True
+
+    def __init__(self, app=None):
+        self.app = app
+
+    def available(self):
+        return self.app is None or self.app.config.get('NDB_AVAILABLE', True)
+
+    @with_ndb_context
+    def get_by_uid(self, uid):
+        return User.get_by_uid(uid)
+
+    @with_ndb_context
+    def get_many_by_uid(self, uids):
+        return User.get_many_by_uid(uids)
+
+    @with_ndb_context
+    def get_by_email(self, email):
+        return User.get_by_email(email)
+
+    @with_ndb_context
+    def get_version(self, uid):
+        # A strongly consistent key lookup (a global cache hit when one is
+        # configured): an index query could still return the updated_at
+        # from before a write that just committed
+        user = User.get_by_uid(uid)
+        return UserVersion(uid, user.created_at, user.updated_at) if user else None
+
+    @with_ndb_context
+    def list_page(self, fields, page_size=100, cursor=None):
+        return User.list_page(fields, page_size=page_size, cursor=cursor)
+
+    @with_ndb_context
+    def save(self, user):
+        return self.save_async(user).result()
+
+    @ndb.tasklet
+    def save_async(self, user):
+        """
+        Tasklet version of save.
+
+        Returns:
+            ndb.Future: Resolves to the saved user
+        """
+        if user.key is None:
+            user.key = User.key_for_uid(user.uid)
+        yield user.put_async()
+        raise ndb.Return(user)
+
+    @with_ndb_context
+    def update_from_firebase_user(self, user, firebase_user_info, force=False):
+        return super().update_from_firebase_user(user, firebase_user_info, force=force)
+
+    @with_ndb_context
+    def load_for_update(self, firebase_user_info):
+        return self.load_for_update_async(firebase_user_info).result()
+
+    @ndb.tasklet
+    def load_for_update_async(self, firebase_user_info):
+        """
+        Tasklet version of load_for_update.
+
+        Returns:
+            ndb.Future: Resolves to (User, whether it needs saving,
+                whether it is new)
+        """
+        user = yield User.get_by_uid_async(firebase_user_info['uid'])
+        if user is None:
+            raise ndb.Return((self.new_user(firebase_user_info), True, True))
+        raise ndb.Return((user, user.apply_firebase_user(firebase_user_info) or user.needs_touch(),
+                          False))
+
+    @with_ndb_context
+    def get_or_create(self, firebase_user_info):
+        # One NDB context and one tasklet for the lookup and the write
+        return self._get_or_create_async(firebase_user_info).result()
+
+    @ndb.tasklet
+    def _get_or_create_async(self, firebase_user_info):
+        user, dirty, created = yield self.load_for_update_async(firebase_user_info)
+        if dirty:
+            yield self.save_async(user)
+        raise ndb.Return((user, created))
+
+    @with_ndb_context
+    def update(self, firebase_user_info, change):
+        key = User.key_for_uid(firebase_user_info['uid'])
+
+        @ndb.transactional()
+        def update_by_key():
+            user = key.get(use_cache=False)
+            if user is None:
+                return None
+            if change(user, user.apply_firebase_user(firebase_user_info) or user.needs_touch()):
+                user.put()
+            return user
+
+        user = update_by_key()
+        if user is None:
+            # New, or still on an auto-ID key, which only a query finds and
+            # a transaction cannot run one
+            user = super().update(firebase_user_info, change)
+        return user
+
+
+class MemoryUserRepository(UserRepository):
+    """
+    Users kept in a process-local dictionary.
+
+    Intended for tests, load tests and local development; every worker
+    has its own copy and nothing survives a restart.
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}
+        self._uids_by_email = {}
+        self._sorted_uids = []
+
+    def _load(self, values):
+        return User(**values) if values is not None else None
+
+    def get_by_uid(self, uid):
+        with self._lock:
+            return self._load(self._users.get(uid))
+
+    def get_many_by_uid(self, uids):
+        with self._lock:
+            return [self._load(self._users.get(uid)) for uid in uids]
+
+    def get_by_email(self, email):
+        with self._lock:
+            uid = self._uids_by_email.get(email)
+            return self._load(self._users.get(uid)) if uid else None
+
+    def get_version(self, uid):
+        with self._lock:
+            values = self._users.get(uid)
+            return UserVersion(uid, values['created_at'], values['updated_at']) if values else None
+
+    def list_page(self, fields, page_size=100, cursor=None):
+        after = decode_cursor(cursor) if cursor else None
+        with self._lock:
+            start = bisect.bisect_right(self._sorted_uids, after) if after is not None else 0
+            uids = self._sorted_uids[start:start + page_size + 1]
+            rows = [_row(self._users[uid], fields) for uid in uids[:page_size]]
+        more = len(uids) > page_size
+        return rows, encode_cursor(uids[page_size - 1]) if more else None, more
+
+    def save(self, user):
+        now = datetime.utcnow()
+        if user.created_at is None:
+            user.created_at = now
+        user.updated_at = now
+        values = {name: getattr(user, name) for name in USER_FIELDS}
+
+        with self._lock:
+            previous = self._users.get(user.uid)
+            if previous is None:
+                bisect.insort(self._sorted_uids, user.uid)
+            elif previous['email'] != user.email and self._uids_by_email.get(previous['email']) == user.uid:
+                del self._uids_by_email[previous['email']]
+            self._users[user.uid] = values
+            self._uids_by_email.setdefault(user.email, user.uid)
+        return user
+
+    def clear(self):
+        """Drop all users."""
+        with self._lock:
+            self._users.clear()
+            self._uids_by_email.clear()
+            self._sorted_uids.clear()
+
+
+class SQLiteUserRepository(UserRepository):
+    """
+    Users stored in a local SQLite database.
+
+    The database runs in WAL mode so readers never block the writer. Each
+    thread has its own connection, and all SQL uses fixed statements with
+    ``?`` parameters, which sqlite3 compiles once per connection and
+    reuses from its statement cache.
+    """
+
+    name = 'sqlite'
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS users ('
+        ' uid TEXT PRIMARY KEY,'
+        ' email TEXT NOT NULL,'
+        ' display_name TEXT,'
+        ' created_at TEXT,'
+        ' updated_at TEXT,'
+        ' email_verified INTEGER NOT NULL DEFAULT 0,'
+        ' picture TEXT,'
+        ' provider_id TEXT'
+        ') WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS users_email ON users (email)',
+    )
+    COLUMNS = ', '.join(USER_FIELDS)
+    SELECT_BY_UID = f'SELECT {COLUMNS} FROM users WHERE uid = ?'
+    SELECT_BY_EMAIL = f'SELECT {COLUMNS} FROM users WHERE email = ? LIMIT 1'
+    SELECT_VERSION = 'SELECT created_at, updated_at FROM users WHERE uid = ?'
+    UPSERT = (
+        f'INSERT INTO users ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT (uid) DO UPDATE SET email = excluded.email, '
+        'display_name = excluded.display_name, updated_at = excluded.updated_at, '
+        'email_verified = excluded.email_verified, picture = excluded.picture, '
+        'provider_id = excluded.provider_id'
+    )
+
+    # Stay below SQLITE_MAX_VARIABLE_NUMBER on older SQLite builds
+    IN_QUERY_SIZE = 500
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        for statement in self.SCHEMA:
+            connection.execute(statement)
+
+    def _connection(self):
+        # Connections are per thread and must not cross fork()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _load(row):
+        if row is None:
+            return None
+        values = dict(zip(USER_FIELDS, row))
+        for name in ('created_at', 'updated_at'):
+            if values[name] is not None:
+                values[name] = datetime.fromisoformat(values[name])
+        values['email_verified'] = bool(values['email_verified'])
+        return User(**values)
+
+    def get_by_uid(self, uid):
+        return self._load(self._connection().execute(self.SELECT_BY_UID, (uid,)).fetchone())
+
+    def get_many_by_uid(self, uids):
+        found = {}
+        connection = self._connection()
+        for start in range(0, len(uids), self.IN_QUERY_SIZE):
+            chunk = uids[start:start + self.IN_QUERY_SIZE]
+            placeholders = ', '.join('?' * len(chunk))
+            for row in connection.execute(
+                    f'SELECT {self.COLUMNS} FROM users WHERE uid IN ({placeholders})', chunk):
+                found[row[0]] = row
+        return [self._load(found.get(uid)) for uid in uids]
+
+    def get_by_email(self, email):
+        return self._load(self._connection().execute(self.SELECT_BY_EMAIL, (email,)).fetchone())
+
+    def get_version(self, uid):
+        row = self._connection().execute(self.SELECT_VERSION, (uid,)).fetchone()
+        if row is None:
+            return None
+        created_at, updated_at = (datetime.fromisoformat(value) if value else None for value in row)
+        return UserVersion(uid, created_at, updated_at)
+
+    def list_page(self, fields, page_size=100, cursor=None):
+        columns = ', '.join(name for name in USER_FIELDS if name in fields)
+        after = decode_cursor(cursor) if cursor else ''
+        rows = self._connection().execute(
+            f'SELECT uid, {columns} FROM users WHERE uid > ? ORDER BY uid LIMIT ?',
+            (after, page_size + 1)).fetchall()
+
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        selected = [name for name in USER_FIELDS if name in fields]
+        users = []
+        for row in rows:
+            values = dict(zip(selected, row[1:]))
+            if 'email_verified' in values:
+                values['email_verified'] = bool(values['email_verified'])
+            users.append({name: values[name] for name in fields})
+        return users, encode_cursor(rows[-1][0]) if more else None, more
+
+    def save(self, user):
+        now = datetime.utcnow()
+        if user.created_at is None:
+            user.created_at = now
+        user.updated_at = now
+        self._connection().execute(self.UPSERT, (
+            user.uid,
+            user.email,
+            user.display_name,
+            user.created_at.isoformat(),
+            user.updated_at.isoformat(),
+            int(bool(user.email_verified)),
+            user.picture,
+            user.provider_id,
+        ))
+        return user
+
+
+def create_user_repository(app):
+    """
+    Build the user repository selected by the app's USER_STORE setting.
+
+    Args:
+        app (Flask): Application being configured
+
+    Returns:
+        UserRepository: Repository for the app
+
+    Raises:
+        ValueError: If USER_STORE names an unknown backend
+    """
+    backend = app.config.get('USER_STORE', 'ndb')
+    if backend == 'ndb':
+        return NDBUserRepository(app)
+    if backend == 'memory':
+        return MemoryUserRepository()
+    if backend == 'sqlite':
+        path = app.config.get('USER_STORE_PATH') or os.path.join(app.instance_path, 'users.sqlite3')
+        return SQLiteUserRepository(path)
+    raise ValueError(f"Unknown USER_STORE: {backend}")
@@ -8,6 +8,11 @@ from datetime import datetime
 class User(ndb.Model):
     """
     User model representing a Firebase-authenticated user.
+
+    Entities are keyed by Firebase UID, so lookups are single-key gets.
+    Entities written before that change have auto-allocated IDs; while
+    ``legacy_uid_lookup`` is enabled they are still found through a query
+    on ``uid``. See ``app.models.migrations.migrate_user_keys``.
     
     Properties:
         uid: Firebase user ID (unique identifier)
@@ -27,7 +32,35 @@ class User(ndb.Model):
     email_verified = ndb.BooleanProperty(default=False)
     picture = ndb.StringProperty()
     provider_id = ndb.StringProperty()
-    
+
+    # Serve users from the NDB global cache when one is configured; the
+    # timeout bounds how long an entry can outlive a failed invalidation
+    _use_global_cache = True
+    _global_cache_timeout = 300
+
+    # Fall back to querying on uid for auto-ID entities (migration window)
+    legacy_uid_lookup = True
+
+    # Maximum number of values in one Datastore IN filter
+    LEGACY_IN_QUERY_SIZE = 30
+
+    # When nothing changed, still rewrite (to refresh updated_at) once the
+    # entity is older than this; None means never
+    touch_interval = None
+
+    @classmethod
+    def key_for_uid(cls, uid):
+        """
+        Build the key of the user with the given Firebase UID.
+
+        Args:
+            uid (str): Firebase user ID
+
+        Returns:
+            ndb.Key: Key of the user entity
+        """
+        return ndb.Key(cls, uid)
+
     @classmethod
     def get_by_uid(cls, uid):
         """
@@ -39,8 +72,50 @@ class User(ndb.Model):
         Returns:
             User: User entity if found, None otherwise
         """
-        return cls.query(cls.uid == uid).get()
+        return cls.get_by_uid_async(uid).result()
+
+    @classmethod
+    @ndb.tasklet
+    def get_by_uid_async(cls, uid):
+        """
+        Tasklet version of get_by_uid.
+
+        Lookups started together from several tasklets are sent to
+        Datastore as one batch.
+
+        Returns:
+            ndb.Future: Resolves to the User, or None if not found
+        """
+        user = yield cls.key_for_uid(uid).get_async()
+        if user is None and cls.legacy_uid_lookup:
+            user = yield cls.query(cls.uid == uid).get_async()
+        raise ndb.Return(user)
     
+    @classmethod
+    def get_many_by_uid(cls, uids):
+        """
+        Get many users by Firebase UID in a single batch lookup.
+
+        Args:
+            uids (list): Firebase user IDs
+
+        Returns:
+            list: User entities in the same order as uids, with None for
+                UIDs that have no user
+        """
+        users = ndb.get_multi([cls.key_for_uid(uid) for uid in uids])
+
+        missing = [uid for uid, user in zip(uids, users) if user is None]
+        if missing and cls.legacy_uid_lookup:
+            legacy = {}
+            for start in range(0, len(missing), cls.LEGACY_IN_QUERY_SIZE):
+                chunk = missing[start:start + cls.LEGACY_IN_QUERY_SIZE]
+                for user in cls.query(cls.uid.IN(chunk)):
+                    legacy.setdefault(user.uid, user)
+            users = [user if user is not None else legacy.get(uid) for uid, user in zip(uids, users)]
+
+        return users
+
     @classmethod
     def get_by_email(cls, email):
         """
@@ -54,6 +129,39 @@ class User(ndb.Model):
         """
         return cls.query(cls.email == email).get()
     
+    @classmethod
+    def list_page(cls, fields, page_size=100, cursor=None):
+        """
+        Get one page of users as a projection query.
+
+        Only the requested properties are read, so no full entities are
+        loaded. Projecting more than one property needs a composite index
+        (see index.yaml).
+
+        Args:
+            fields (list): Property names to return
+            page_size (int): Maximum number of users in the page
+            cursor (str): URL-safe cursor from a previous page
+
+        Returns:
+            tuple: (list of dicts, next cursor or None, whether more
+                results may exist)
+        """
+        start_cursor = ndb.Cursor(urlsafe=cursor) if cursor else None
+        projection = [cls._properties[name] for name in fields]
+        users, next_cursor, more = cls.query().fetch_page(
+            page_size, start_cursor=start_cursor, projection=projection)
+
+        rows = []
+        for user in users:
+            row = {}
+            for name in fields:
+                value = getattr(user, name)
+                row[name] = value.isoformat() if isinstance(value, datetime) else value
+            rows.append(row)
+
+        return rows, next_cursor.urlsafe().decode('ascii') if (more and next_cursor) else None, more
+
     def to_dict(self):
         """
         Convert user entity to dictionary.
@@ -72,6 +180,23 @@ class User(ndb.Model):
             'provider_id': self.provider_id
         }
     
+    def _pre_put_hook(self):
+        # A legacy auto-ID entity loaded before migrate_user_keys moved it
+        # is written under its UID key instead: writing it back would
+        # resurrect the deleted entity and lose the update. Any legacy
+        # copy left behind is deleted by the next migration pass.
+        if self.key is not None and self.key.integer_id() is not None:
+            self.key = self.key_for_uid(self.uid)
+
+    def copy(self):
+        """
+        Get an independent instance with the same key and values.
+
+        Returns:
+            User: Unsaved copy of this entity
+        """
+        return User(key=self.key, **{name: getattr(self, name) for name in self._properties})
+
     @classmethod
     def create_from_firebase_user(cls, firebase_user_info):
         """
@@ -84,6 +209,7 @@ class User(ndb.Model):
             User: Newly created user entity
         """
         user = cls(
+            id=firebase_user_info['uid'],
             uid=firebase_user_info['uid'],
             email=firebase_user_info['email'],
             display_name=firebase_user_info.get('name'),
@@ -94,20 +220,69 @@ class User(ndb.Model):
         user.put()
         return user
     
-    def update_from_firebase_user(self, firebase_user_info):
+    def apply_firebase_user(self, firebase_user_info):
+        """
+        Copy Firebase user info onto this entity without saving it.
+
+        Args:
+            firebase_user_info (dict): User info from Firebase token
+
+        Returns:
+            bool: True if any stored value changed
+        """
+        claims = {
+            'email': firebase_user_info['email'],
+            'display_name': firebase_user_info.get('name', self.display_name),
+            'email_verified': firebase_user_info.get('email_verified', self.email_verified),
+            'picture': firebase_user_info.get('picture', self.picture),
+            'provider_id': firebase_user_info.get('provider_id', self.provider_id),
+        }
+
+        changed = False
+        for name, value in claims.items():
+            if getattr(self, name) != value:
+                setattr(self, name, value)
+                changed = True
+        return changed
+
+    def needs_touch(self, now=None):
+        """
+        Check whether updated_at is due for a refresh under touch_interval.
+
+        Returns:
+            bool: True if the entity should be rewritten even if unchanged
+        """
+        if self.touch_interval is None or self.updated_at is None:
+            return False
+        now = now or datetime.utcnow()
+        return now - self.updated_at >= self.touch_interval
+
+    def update_from_firebase_user(self, firebase_user_info, force=False):
         """
         Update user from Firebase user info.
+
+        The entity is only written when a value actually changed, when
+        updated_at is due for a refresh (see touch_interval), or when
+        force is set.
         
         Args:
             firebase_user_info (dict): User info from Firebase token
+            force (bool): Write even if nothing changed
             
         Returns:
             User: Updated user entity
         """
-        self.email = firebase_user_info['email']
-        self.display_name = firebase_user_info.get('name', self.display_name)
-        self.email_verified = firebase_user_info.get('email_verified', self.email_verified)
-        self.picture = firebase_user_info.get('picture', self.picture)
-        self.provider_id = firebase_user_info.get('provider_id', self.provider_id)
-        self.put()
-        return self 
\ No newline at end of file
+        return self.update_from_firebase_user_async(firebase_user_info, force=force).result()
+
+    @ndb.tasklet
+    def update_from_firebase_user_async(self, firebase_user_info, force=False):
+        """
+        Tasklet version of update_from_firebase_user.
+
+        Returns:
+            ndb.Future: Resolves to the updated user entity
+        """
+        changed = self.apply_firebase_user(firebase_user_info)
+        if changed or force or self.needs_touch():
+            yield self.put_async()
+        raise ndb.Return(self)
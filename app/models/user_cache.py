@@ -0,0 +1,97 @@
+"""
+Per-worker User entity cache for cloudrun-init.
+"""
+import threading
+import time
+from collections import OrderedDict
+from app.models.user import User
+
+
+class UserCache:
+    """
+    Short-TTL, bounded LRU cache of User entities keyed by Firebase UID.
+
+    Entities are stored as snapshots of their property values and handed
+    out as fresh User instances, so a request mutating its user never
+    affects other threads. Writers must call ``invalidate`` (or ``put``
+    with the new state) after changing a user; other instances only see
+    the change once the TTL has passed.
+
+    Usage:
+        cache = UserCache(ttl=30)
+        user = cache.get(uid)
+        if user is None:
+            user = User.get_by_uid(uid)
+            cache.put(user)
+    """
+
+    def __init__(self, ttl=30, max_size=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uid):
+        """
+        Get a copy of the cached user.
+
+        Args:
+            uid (str): Firebase user ID
+
+        Returns:
+            User: Fresh User instance, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None or self._clock() >= entry[0]:
+                if entry is not None:
+                    del self._entries[uid]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(uid)
+            self.hits += 1
+            _, key, values = entry
+
+        return User(key=key, **values)
+
+    def put(self, user):
+        """
+        Cache a snapshot of a user.
+
+        Args:
+            user (User): User entity to cache
+        """
+        values = {name: getattr(user, name) for name in User._properties}
+        with self._lock:
+            self._entries[user.uid] = (self._clock() + self.ttl, user.key, values)
+            self._entries.move_to_end(user.uid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, uid):
+        """
+        Drop a user from the cache.
+
+        Args:
+            uid (str): Firebase user ID
+        """
+        with self._lock:
+            self._entries.pop(uid, None)
+
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Returns:
+            dict: size, hits and misses
+        """
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
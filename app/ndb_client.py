@@ -1,9 +1,27 @@
 """
 NDB client configuration for cloudrun-init.
+
+Contexts can be backed by a global cache (Redis or memcached, selected by
+NDB_GLOBAL_CACHE) shared by every instance, so entities read by one
+instance are served to the others without a Datastore lookup. Which
+models use it, and for how long, is set per model with
+``_use_global_cache`` and ``_global_cache_timeout``.
 """
 import os
+import functools
+import logging
+import threading
+import time
+import grpc
 from google.cloud import ndb
+from google.cloud.ndb.global_cache import GlobalCache
+from google.cloud.datastore_v1.services.datastore.transports.grpc import DatastoreGrpcTransport
 from flask import current_app
+from app.metrics import DatastoreRPCTimer, record_phase, PHASE_NDB_CONTEXT
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_CACHE_BACKENDS = ('redis', 'memcached')
 
 
 def init_ndb_client():
@@ -33,32 +51,298 @@ def init_ndb_client():
             client = ndb.Client()
             current_app.logger.warning("No project ID specified, using default NDB client")
     
+    return instrument_client(client)
+
+
+def instrument_client(client):
+    """
+    Route an NDB client's Datastore RPCs through the request timer.
+
+    Args:
+        client (ndb.Client): Client to instrument
+
+    Returns:
+        ndb.Client: The same client
+    """
+    channel = grpc.intercept_channel(client.stub.grpc_channel, DatastoreRPCTimer())
+    client.stub = DatastoreGrpcTransport(host=client.host, client_info=client.client_info,
+                                         channel=channel)
     return client
 
 
+class GlobalCacheUnavailable(ConnectionError):
+    """Raised instead of calling a global cache that failed recently."""
+
+
+class FailOpenCache(GlobalCache):
+    """
+    Global cache wrapper that keeps NDB working while the cache is down.
+
+    Errors from the backend are transient errors for NDB, which treats
+    them as cache misses (reads) or skipped invalidations (writes) because
+    strict_read and strict_write are off. After a failure the backend is
+    not called again for retry_interval seconds, so an outage does not
+    add a connection timeout to every Datastore operation.
+
+    Skipped invalidations can leave a stale entity cached; it expires after
+    the model's _global_cache_timeout.
+
+    Usage:
+        cache = FailOpenCache(ndb.RedisCache(redis.Redis.from_url(url)))
+        with client.context(global_cache=cache):
+            ...
+    """
+
+    strict_read = False
+    strict_write = False
+
+    def __init__(self, cache, retry_interval=30, clock=time.monotonic):
+        self.cache = cache
+        self.retry_interval = retry_interval
+        self._clock = clock
+        self.transient_errors = tuple(cache.transient_errors) + (GlobalCacheUnavailable,)
+        self.down_until = 0
+        self.failures = 0
+
+    @property
+    def available(self):
+        """False while failing fast after an error."""
+        return self._clock() >= self.down_until
+
+    def _call(self, method, *args, **kwargs):
+        if not self.available:
+            raise GlobalCacheUnavailable("global cache unavailable, skipping")
+        try:
+            return getattr(self.cache, method)(*args, **kwargs)
+        except self.cache.transient_errors as e:
+            self.failures += 1
+            self.down_until = self._clock() + self.retry_interval
+            logger.warning(f"Global cache {method} failed, bypassing it for "
+                           f"{self.retry_interval}s: {e}")
+            raise
+
+    def get(self, keys):
+        return self._call('get', keys)
+
+    def set(self, items, expires=None):
+        return self._call('set', items, expires=expires)
+
+    def set_if_not_exists(self, items, expires=None):
+        return self._call('set_if_not_exists', items, expires=expires)
+
+    def delete(self, keys):
+        return self._call('delete', keys)
+
+    def watch(self, items):
+        return self._call('watch', items)
+
+    def unwatch(self, keys):
+        return self._call('unwatch', keys)
+
+    def compare_and_swap(self, items, expires=None):
+        return self._call('compare_and_swap', items, expires=expires)
+
+    def clear(self):
+        return self._call('clear')
+
+
+def parse_memcached_hosts(text, default_port=11211):
+    """
+    Parse space-separated memcached host[:port] entries.
+
+    IPv6 addresses are written in brackets when a port follows, as in
+    ``[::1]:11211``.
+
+    Returns:
+        list: (host, port) tuples
+
+    Raises:
+        ValueError: If a port is not a number
+    """
+    hosts = []
+    for entry in text.split():
+        if entry.startswith('['):
+            host, _, port = entry[1:].partition(']')
+            port = port[1:]
+        elif entry.count(':') == 1:
+            host, _, port = entry.partition(':')
+        else:
+            host, port = entry, ''
+        hosts.append((host, int(port) if port else default_port))
+    return hosts
+
+
+def init_global_cache():
+    """
+    Create the global cache configured for the current app.
+
+    NDB_GLOBAL_CACHE selects the backend ('redis' or 'memcached'; unset
+    for none) and NDB_GLOBAL_CACHE_URL its address: a redis:// URL, or
+    space-separated memcached host[:port] entries. Socket operations time
+    out after NDB_GLOBAL_CACHE_SOCKET_TIMEOUT seconds (default 0.1).
+
+    Returns:
+        FailOpenCache: The cache, or None if none is configured
+
+    Raises:
+        ValueError: If NDB_GLOBAL_CACHE names an unknown backend
+    """
+    backend = current_app.config.get('NDB_GLOBAL_CACHE')
+    if not backend:
+        return None
+    if backend not in GLOBAL_CACHE_BACKENDS:
+        raise ValueError(f"Unknown NDB_GLOBAL_CACHE backend: {backend!r} "
+                         f"(expected one of {', '.join(GLOBAL_CACHE_BACKENDS)})")
+
+    url = current_app.config.get('NDB_GLOBAL_CACHE_URL')
+    timeout = current_app.config.get('NDB_GLOBAL_CACHE_SOCKET_TIMEOUT', 0.1)
+    if backend == 'redis':
+        import redis
+        client = redis.Redis.from_url(url or 'redis://localhost:6379',
+                                      socket_timeout=timeout, socket_connect_timeout=timeout)
+        cache = ndb.RedisCache(client)
+    else:
+        import pymemcache
+        hosts = parse_memcached_hosts(url or 'localhost:11211')
+        if len(hosts) == 1:
+            client = pymemcache.PooledClient(hosts[0], connect_timeout=timeout, timeout=timeout)
+        else:
+            client = pymemcache.HashClient(hosts, use_pooling=True, connect_timeout=timeout,
+                                           timeout=timeout)
+        cache = ndb.MemcacheCache(client)
+
+    current_app.logger.info(f"Using NDB global cache: {backend}")
+    return FailOpenCache(cache, retry_interval=current_app.config.get('NDB_GLOBAL_CACHE_RETRY', 30))
+
+
+class NDBClientRegistry:
+    """
+    Process-wide holder for the application's NDB client.
+
+    Building an ``ndb.Client`` means credential discovery and gRPC channel
+    setup, so it is done once per process and shared by every thread. The
+    client is tied to the PID that created it: gRPC channels do not survive
+    ``fork()``, so a gunicorn worker forked from a preloaded master builds
+    its own client on first use. The global cache, if any, is created
+    alongside the client and shared the same way.
+    """
+
+    def __init__(self, factory=init_ndb_client, cache_factory=None):
+        self._factory = factory
+        self._cache_factory = cache_factory
+        self._lock = threading.Lock()
+        self._client = None
+        self._global_cache = None
+        self._pid = None
+
+    def get_client(self):
+        """
+        Get the process-wide NDB client, creating it on first use.
+
+        Returns:
+            ndb.Client: Shared NDB client for this process
+        """
+        client = self._client
+        if client is not None and self._pid == os.getpid():
+            return client
+
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                self._client = self._factory()
+                self._global_cache = self._cache_factory() if self._cache_factory else None
+                self._pid = os.getpid()
+            return self._client
+
+    def get_global_cache(self):
+        """
+        Get the process-wide global cache.
+
+        Returns:
+            GlobalCache: The cache, or None if none is configured
+        """
+        self.get_client()
+        return self._global_cache
+
+    def initialize(self):
+        """
+        Eagerly create the client.
+
+        Returns:
+            bool: True if a client is available, False otherwise
+        """
+        try:
+            self.get_client()
+        except Exception as e:
+            current_app.logger.warning(f"NDB initialization failed (this is OK for local development): {e}")
+            current_app.logger.info("NDB will not be available. Set DATASTORE_PROJECT_ID and DATASTORE_EMULATOR_HOST for local development.")
+            return False
+        return True
+
+    def is_available(self):
+        """Return True if a client has been created for this process."""
+        return self._client is not None and self._pid == os.getpid()
+
+    def context(self, **kwargs):
+        """
+        Create a new per-request context from the shared client.
+
+        The context uses the global cache unless global_cache is passed.
+
+        Returns:
+            ndb.Context: Context manager establishing an NDB context
+        """
+        client = self.get_client()
+        if self._global_cache is not None:
+            kwargs.setdefault('global_cache', self._global_cache)
+        return client.context(**kwargs)
+
+    def reset(self):
+        """Drop the current client so the next call builds a fresh one."""
+        # Replace rather than acquire the lock: after fork() it may be held
+        # by a thread that no longer exists in this process.
+        self._lock = threading.Lock()
+        self._client = None
+        self._global_cache = None
+        self._pid = None
+
+
+# Shared registry for the whole process
+ndb_registry = NDBClientRegistry(cache_factory=init_global_cache)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=ndb_registry.reset)
+
+
 def get_ndb_context():
     """
     Get NDB context for database operations.
     
     Returns:
-        ndb.Context: Active NDB context
+        ndb.Context: Context manager for a new NDB context
     """
-    client = init_ndb_client()
-    return client.context()
+    return ndb_registry.context()
 
 
 def with_ndb_context(func):
     """
     Decorator to provide NDB context for database operations.
     
+    If an NDB context is already active on this thread (for example when
+    decorated functions call each other), it is reused instead of nesting
+    a new one.
+
     Usage:
         @with_ndb_context
         def my_database_function():
             user = User.get_by_uid('some_uid')
             return user
     """
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        context = get_ndb_context()
-        with context:
+        if ndb.get_context(raise_context_error=False) is not None:
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        with get_ndb_context():
+            record_phase(PHASE_NDB_CONTEXT, time.perf_counter() - started)
             return func(*args, **kwargs)
-    return wrapper 
\ No newline at end of file
+    return wrapper
@@ -0,0 +1,407 @@
+"""
+Token-bucket rate limiting for cloudrun-init.
+
+Buckets use GCRA (the generic cell rate algorithm): the state of a bucket
+is a single number, the time at which it would be full again, so a bucket
+needs no background refill and fits in one dict entry or one Redis key.
+
+Every request is first checked against an in-process bucket. That check
+takes no lock and needs no network, so clients over the limit on this
+instance are turned away cheaply. With a shared backend (Redis), requests
+that pass are also checked against a bucket shared by all instances, so
+limits hold however many instances Cloud Run starts. If the backend is
+unreachable, requests are only limited per instance until it is tried
+again.
+
+Limits can be applied with the rate_limit decorator or, for a whole
+blueprint, with limit_blueprint:
+
+    @bp.route('/expensive')
+    @rate_limit('5/second', burst=10, key=(KEY_IP,))
+    def expensive():
+        ...
+"""
+import functools
+import heapq
+import math
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+
+# Parts a bucket key can be built from
+KEY_IP = 'ip'
+KEY_UID = 'uid'
+KEY_ROUTE = 'route'
+
+RATE_UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+RATELIMIT_BACKENDS = ('memory', 'redis')
+
+# GCRA in one round trip; Redis' clock is used so instances agree on time
+GCRA_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then tat = now end
+local new_tat = tat + interval
+local allow_at = new_tat - burst * interval
+if allow_at > now then
+    return tostring(allow_at - now)
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return '0'
+"""
+
+
+def parse_rate(rate):
+    """
+    Parse a rate such as '10/second' or '100/minute'.
+
+    Returns:
+        float: Requests per second
+
+    Raises:
+        ValueError: If the rate cannot be parsed
+    """
+    if isinstance(rate, (int, float)):
+        per_second = float(rate)
+    else:
+        count, _, unit = rate.partition('/')
+        unit = unit.strip().lower()
+        unit = unit[:-1] if unit.endswith('s') else unit
+        if (unit or 'second') not in RATE_UNITS:
+            raise ValueError(f"Unknown rate unit in {rate!r} (expected one of {', '.join(RATE_UNITS)})")
+        per_second = float(count) / RATE_UNITS[unit or 'second']
+    if per_second <= 0:
+        raise ValueError(f"Rate must be positive: {rate!r}")
+    return per_second
+
+
+class LocalBackend:
+    """
+    In-process GCRA buckets.
+
+    Each bucket is one float replaced with a single dict store, so checks
+    take no lock. Threads racing on the same key may both be admitted,
+    which makes the limit approximate by at most the number of threads.
+    Once there are more than max_keys buckets, those that have refilled
+    are dropped; if that is not enough, the fullest of the rest are, down
+    to nine tenths of max_keys. Throttled clients have the emptiest
+    buckets, so a flood of new keys cannot reset their limits.
+    """
+
+    def __init__(self, max_keys=100000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self._clock = clock
+        self._tat = {}
+        self._sweep_lock = threading.Lock()
+
+    def hit(self, key, rate, burst):
+        """
+        Take one token from a bucket.
+
+        Args:
+            key (str): Bucket key
+            rate (float): Tokens added per second
+            burst (int): Bucket capacity
+
+        Returns:
+            float: 0 if the request is allowed, otherwise seconds until it
+                would be
+        """
+        now = self._clock()
+        interval = 1.0 / rate
+        new_tat = max(self._tat.get(key, now), now) + interval
+        allow_at = new_tat - burst * interval
+        if allow_at > now:
+            return allow_at - now
+        self._tat[key] = new_tat
+        if len(self._tat) > self.max_keys:
+            self._sweep(now)
+        return 0.0
+
+    def _sweep(self, now):
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            # Iterate over a copy: hit() adds keys from other threads meanwhile
+            for key, tat in self._tat.copy().items():
+                if tat <= now:
+                    self._tat.pop(key, None)
+            if len(self._tat) > self.max_keys:
+                # The earliest TATs are the buckets closest to full; forgetting
+                # them lets those clients through a little early at most
+                excess = len(self._tat) - self.max_keys * 9 // 10
+                for key, _ in heapq.nsmallest(excess, self._tat.copy().items(), key=lambda item: item[1]):
+                    self._tat.pop(key, None)
+        finally:
+            self._sweep_lock.release()
+
+    def __len__(self):
+        return len(self._tat)
+
+
+class RedisBackend:
+    """
+    GCRA buckets shared through Redis.
+
+    Usage:
+        backend = RedisBackend(redis.Redis.from_url(url))
+        retry_after = backend.hit('login:203.0.113.7', rate=10, burst=20)
+    """
+
+    def __init__(self, client, prefix='ratelimit:'):
+        self.prefix = prefix
+        self._script = client.register_script(GCRA_SCRIPT)
+
+    def hit(self, key, rate, burst):
+        """Take one token from a shared bucket; see LocalBackend.hit."""
+        return float(self._script(keys=[self.prefix + key], args=[1.0 / rate, burst]))
+
+
+class RateLimiter:
+    """
+    Per-instance buckets in front of an optional shared backend.
+
+    Usage:
+        limiter = RateLimiter(backend=RedisBackend(client))
+        retry_after = limiter.hit('auth:203.0.113.7:auth.login', rate=10, burst=20)
+    """
+
+    def __init__(self, backend=None, retry_interval=30, max_keys=100000, clock=time.monotonic):
+        self.local = LocalBackend(max_keys=max_keys, clock=clock)
+        self.backend = backend
+        self.retry_interval = retry_interval
+        self._clock = clock
+        self._failed_at = None
+        self._lock = threading.Lock()
+        self.rejections = {}
+        self.backend_failures = 0
+
+    @property
+    def backend_available(self):
+        """False while a failed shared backend is left alone."""
+        return self._failed_at is None or self._clock() - self._failed_at >= self.retry_interval
+
+    def hit(self, key, rate, burst):
+        """
+        Take one token for key.
+
+        Returns:
+            float: 0 if the request is allowed, otherwise seconds to wait
+        """
+        retry_after = self.local.hit(key, rate, burst)
+        if retry_after or self.backend is None or not self.backend_available:
+            return retry_after
+        try:
+            retry_after = self.backend.hit(key, rate, burst)
+        except Exception as e:
+            self._failed_at = self._clock()
+            self.backend_failures += 1
+            current_app.logger.warning(f"Rate limit backend unavailable, limiting per instance: {e}")
+            return 0.0
+        self._failed_at = None
+        return retry_after
+
+    def count_rejection(self, scope):
+        with self._lock:
+            self.rejections[scope] = self.rejections.get(scope, 0) + 1
+
+    def stats(self):
+        """
+        Get rejection counters.
+
+        Returns:
+            dict: Rejections per scope, backend failures and local bucket count
+        """
+        with self._lock:
+            return {'rejections': dict(self.rejections), 'backend_failures': self.backend_failures,
+                    'buckets': len(self.local)}
+
+
+def get_rate_limiter():
+    """
+    Get the rate limiter of the current app.
+
+    Returns:
+        RateLimiter: The limiter, or None if rate limiting is disabled
+    """
+    return current_app.extensions.get('rate_limiter')
+
+
+def client_ip():
+    """
+    Get the client's address.
+
+    Behind RATELIMIT_PROXY_COUNT proxies (default 1, Cloud Run's front
+    end), the address is taken from X-Forwarded-For as appended by the
+    outermost trusted proxy. Set it to 0 when clients connect directly,
+    or they could pick their own address.
+
+    Returns:
+        str: Client IP address
+    """
+    proxies = current_app.config.get('RATELIMIT_PROXY_COUNT', 1)
+    if proxies:
+        forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',')]
+        forwarded = [part for part in forwarded if part]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.remote_addr or 'unknown'
+
+
+def request_key(parts):
+    """
+    Build the bucket key of the current request.
+
+    Args:
+        parts (tuple): KEY_IP, KEY_UID and/or KEY_ROUTE; KEY_UID falls
+            back to the client IP for unauthenticated requests
+
+    Returns:
+        str: Bucket key
+    """
+    values = []
+    for part in parts:
+        if part == KEY_IP:
+            values.append(client_ip())
+        elif part == KEY_UID:
+            user = g.get('user')
+            values.append(f"uid={user['uid']}" if user else f'ip={client_ip()}')
+        elif part == KEY_ROUTE:
+            values.append(request.endpoint or request.path)
+        else:
+            raise ValueError(f"Unknown rate limit key part: {part!r}")
+    return ':'.join(values)
+
+
+def check_rate_limit(scope, rate, burst=None, key=(KEY_IP,)):
+    """
+    Check the current request against a limit.
+
+    Args:
+        scope (str): Name of the limit (separates its buckets from others)
+        rate (str): Rate such as '10/second'
+        burst (int): Bucket capacity; defaults to one second's worth
+        key (tuple): Parts of the bucket key (see request_key)
+
+    Returns:
+        Response: 429 response with Retry-After, or None if allowed
+    """
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return None
+    per_second = parse_rate(rate)
+    retry_after = limiter.hit(f'{scope}:{request_key(key)}', per_second,
+                              burst or max(math.ceil(per_second), 1))
+    if not retry_after:
+        return None
+
+    limiter.count_rejection(scope)
+    response = jsonify({'error': 'Too many requests'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(math.ceil(retry_after), 1))
+    return response
+
+
+def rate_limit(rate, burst=None, key=(KEY_IP,), scope=None):
+    """
+    Decorator to rate limit a view.
+
+    Place it below login_required to key by KEY_UID.
+
+    Usage:
+        @app.route('/expensive')
+        @login_required
+        @rate_limit('1/second', burst=5, key=(KEY_UID,))
+        def expensive():
+            ...
+    """
+    def decorator(f):
+        limit_scope = scope or f.__name__
+
+        @functools.wraps(f)
+        def decorated_function(*args, **kwargs):
+            response = check_rate_limit(limit_scope, rate, burst, key)
+            if response is not None:
+                return response
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
+
+
+def limit_blueprint(app, blueprint_name, rate, burst=None, key=(KEY_IP, KEY_ROUTE)):
+    """
+    Rate limit every request to a blueprint from a before_request hook.
+
+    Works whether or not the blueprint has been registered yet.
+
+    Args:
+        app (Flask): Application
+        blueprint_name (str): Name of the blueprint
+        rate, burst, key: As for check_rate_limit
+    """
+    def limit_request():
+        return check_rate_limit(blueprint_name, rate, burst, key)
+
+    app.before_request_funcs.setdefault(blueprint_name, []).append(limit_request)
+
+
+def init_rate_limiting(app):
+    """
+    Enable rate limiting if RATELIMIT_ENABLED is set.
+
+    Every /auth request is limited per client IP and route to
+    RATELIMIT_AUTH (default '10/second') with bursts of RATELIMIT_AUTH_BURST
+    (default 20). RATELIMIT_STORAGE selects 'memory' (per instance, the
+    default) or 'redis' at RATELIMIT_STORAGE_URL. A failing Redis is
+    retried after RATELIMIT_STORAGE_RETRY seconds (default 30). Rejections
+    are exported on /metrics as app_ratelimit_rejections_total{scope}.
+
+    Args:
+        app (Flask): Application to configure
+
+    Returns:
+        RateLimiter: The limiter, or None if disabled
+
+    Raises:
+        ValueError: If RATELIMIT_STORAGE names an unknown backend
+    """
+    if not app.config.get('RATELIMIT_ENABLED', False):
+        return None
+
+    storage = app.config.get('RATELIMIT_STORAGE') or 'memory'
+    if storage not in RATELIMIT_BACKENDS:
+        raise ValueError(f"Unknown RATELIMIT_STORAGE backend: {storage!r} "
+                         f"(expected one of {', '.join(RATELIMIT_BACKENDS)})")
+    backend = None
+    if storage == 'redis':
+        import redis
+        timeout = app.config.get('RATELIMIT_STORAGE_SOCKET_TIMEOUT', 0.1)
+        client = redis.Redis.from_url(app.config.get('RATELIMIT_STORAGE_URL') or 'redis://localhost:6379',
+                                      socket_timeout=timeout, socket_connect_timeout=timeout)
+        backend = RedisBackend(client)
+
+    limiter = RateLimiter(backend=backend, retry_interval=app.config.get('RATELIMIT_STORAGE_RETRY', 30))
+    app.extensions['rate_limiter'] = limiter
+
+    auth_rate = app.config.get('RATELIMIT_AUTH', '10/second')
+    if auth_rate:
+        limit_blueprint(app, 'auth', auth_rate, burst=app.config.get('RATELIMIT_AUTH_BURST', 20))
+
+    metrics = app.extensions.get('metrics')
+    if metrics is not None:
+        def collect():
+            lines = ['# HELP app_ratelimit_rejections_total Requests rejected with 429, by limit.',
+                     '# TYPE app_ratelimit_rejections_total counter']
+            for scope, count in sorted(limiter.stats()['rejections'].items()):
+                lines.append(f'app_ratelimit_rejections_total{{scope="{scope}"}} {count}')
+            return lines
+
+        metrics.add_collector(collect)
+    return limiter
@@ -3,5 +3,6 @@ Routes package for cloudrun-init.
 """
 from app.routes.auth import auth_bp
 from app.routes.profile import profile_bp
+from app.routes.admin import admin_bp
 
-__all__ = ['auth_bp', 'profile_bp'] 
\ No newline at end of file
+__all__ = ['auth_bp', 'profile_bp', 'admin_bp'] 
\ No newline at end of file
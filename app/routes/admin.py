@@ -0,0 +1,108 @@
+"""
+Admin routes for cloudrun-init.
+"""
+import binascii
+from flask import Blueprint, request, jsonify, current_app
+from google.api_core import exceptions as api_exceptions
+from google.cloud.ndb import exceptions as ndb_exceptions
+from app.auth.firebase import login_required, admin_required
+from app.auth.user_middleware import get_user_repository
+from app.models.user import User
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+# Fields returned by the user listing unless ?fields= is given
+DEFAULT_LIST_FIELDS = ['uid', 'email', 'display_name']
+
+# Multi-property projections with a composite index in index.yaml; any
+# other combination fails with NeedIndex on Datastore
+INDEXED_PROJECTIONS = [
+    frozenset(DEFAULT_LIST_FIELDS),
+]
+
+# Upper bounds for page and batch sizes
+MAX_PAGE_SIZE = 1000
+MAX_LOOKUP_SIZE = 1000
+
+
+def list_users_page(fields, page_size, cursor):
+    return get_user_repository().list_page(fields, page_size=page_size, cursor=cursor)
+
+
+def lookup_users(uids):
+    return [user.to_dict() if user else None for user in get_user_repository().get_many_by_uid(uids)]
+
+
+@admin_bp.route('/users', methods=['GET'])
+@login_required
+@admin_required
+def list_users():
+    """
+    List users page by page.
+
+    Query parameters:
+        limit: Page size (default 100, max 1000)
+        cursor: Cursor returned as next_cursor by the previous page
+        fields: Comma-separated User properties (default uid,email,display_name);
+            a single property, or one of the INDEXED_PROJECTIONS sets
+    """
+    try:
+        page_size = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+
+    fields = request.args.get('fields')
+    fields = list(dict.fromkeys(fields.split(','))) if fields else DEFAULT_LIST_FIELDS
+    unknown = [name for name in fields if name not in User._properties]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    if len(fields) > 1 and frozenset(fields) not in INDEXED_PROJECTIONS:
+        supported = '; '.join(','.join(sorted(projection)) for projection in INDEXED_PROJECTIONS)
+        return jsonify({'error': f"Unsupported combination of fields (use one field, or one of: {supported})"}), 400
+
+    try:
+        users, next_cursor, more = list_users_page(fields, page_size, request.args.get('cursor'))
+    except (binascii.Error, ValueError, ndb_exceptions.BadValueError,
+            api_exceptions.InvalidArgument):
+        return jsonify({'error': 'Invalid cursor'}), 400
+    except Exception as e:
+        current_app.logger.error(f"User listing error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+    return jsonify({
+        'users': users,
+        'next_cursor': next_cursor,
+        'more': more
+    }), 200
+
+
+@admin_bp.route('/users/lookup', methods=['POST'])
+@login_required
+@admin_required
+def bulk_lookup_users():
+    """
+    Look up many users by UID in one batch.
+
+    Expected JSON payload:
+    {
+        "uids": ["uid1", "uid2", ...]
+    }
+
+    Returns users in request order, with null for unknown UIDs.
+    """
+    data = request.get_json(silent=True)
+    uids = data.get('uids') if isinstance(data, dict) else None
+    if not isinstance(uids, list) or not all(isinstance(uid, str) and uid for uid in uids):
+        return jsonify({'error': 'uids must be a list of non-empty strings'}), 400
+    if len(uids) > MAX_LOOKUP_SIZE:
+        return jsonify({'error': f'At most {MAX_LOOKUP_SIZE} uids per request'}), 400
+
+    try:
+        users = lookup_users(uids)
+    except Exception as e:
+        current_app.logger.error(f"Bulk user lookup error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+    return jsonify({'users': users}), 200
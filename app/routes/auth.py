@@ -3,6 +3,7 @@ Authentication routes for cloudrun-init.
 """
 from flask import Blueprint, request, jsonify, g, current_app
 from app.auth.firebase import login_required, optional_login, verify_firebase_token, get_token_from_request
+from app.auth.session import SESSION_COOKIE, get_session_signer, set_session_cookie
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -16,6 +17,9 @@ def login():
     {
         "idToken": "firebase_id_token_here"
     }
+
+    With AUTH_SESSION_ENABLED, a signed session cookie is set instead of
+    the ID token itself, so later requests skip token verification.
     """
     try:
         data = request.get_json()
@@ -35,6 +39,10 @@ def login():
             'user': user_info
         })
         
+        if get_session_signer() is not None:
+            set_session_cookie(response, user_info)
+            return response, 200
+
         # Set token in cookie for future requests
         response.set_cookie(
             'firebase_token',
@@ -57,6 +65,7 @@ def logout():
     """Logout endpoint that clears the authentication token."""
     response = jsonify({'message': 'Logout successful'})
     response.delete_cookie('firebase_token')
+    response.delete_cookie(SESSION_COOKIE)
     return response, 200
 
 
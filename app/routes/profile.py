@@ -1,32 +1,90 @@
 """
 Profile routes for cloudrun-init.
 """
+from datetime import datetime
 from flask import Blueprint, request, jsonify, g, current_app
-from app.auth.user_middleware import user_required, attach_user_to_request
+from app.auth.user_middleware import (attach_user_to_request, get_user_repository, load_user_for_update,
+                                      save_user, update_user)
 from app.auth.firebase import login_required
-from app.models.user import User
-from app.ndb_client import with_ndb_context
+from app.serialization import parse_fields, user_response, negotiate_format
+from app.conditional import (PreconditionFailed, make_etag, version_of, if_none_match, if_match_failed,
+                             matching_etag, not_modified, with_etag)
 
 profile_bp = Blueprint('profile', __name__, url_prefix='/profile')
 
 
+def account_age_days(created_at, now):
+    """Whole days since created_at, or None if unknown."""
+    # now may be taken before a first-login user is created
+    return max((now - created_at).days, 0) if created_at else None
+
+
+def load_user_for_route():
+    """
+    Load the request's user for a route that writes it.
+
+    Sets g.user_model like attach_user_to_request, but leaves the token's
+    claims unsaved so the route can write everything at once.
+
+    Returns:
+        bool: Whether the user needs saving, or None if it is unavailable
+            (g.user_model is then None)
+    """
+    if g.get('user_model') is not None and g.get('user_model_source') is g.user:
+        # Already attached (and saved) earlier in this request
+        return False
+    g.user_model = None
+    if not get_user_repository().available():
+        current_app.logger.warning("User store not available, skipping user model attachment")
+        return None
+    try:
+        g.user_model, dirty = load_user_for_update(g.user)
+    except Exception as e:
+        current_app.logger.error(f"Failed to attach user model: {e}")
+        return None
+    g.user_model_source = g.user
+    return dirty
+
+
 @profile_bp.route('/', methods=['GET'])
 @login_required
 def get_profile():
     """
     Get current user's profile information.
     Requires Firebase authentication.
+
+    Query parameters:
+        fields: Comma-separated user fields to return (default: all)
+
+    Responses carry an ETag; a matching If-None-Match gets 304, usually
+    without loading the user.
     """
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    fmt = negotiate_format()
+
+    def etag_for(version):
+        return make_etag(version, g.user, 'profile', fields, fmt)
+
+    response = if_none_match(etag_for)
+    if response is not None:
+        return response
+
     # Attach user model to request
     attach_user_to_request()
     
     if not g.user_model:
         return jsonify({'error': 'User not found in database'}), 500
+
+    etag = etag_for(version_of(g.user_model))
+    client_etag = matching_etag(request.if_none_match, etag)
+    if client_etag is not None:
+        return not_modified(client_etag)
     
-    return jsonify({
-        'user': g.user_model.to_dict(),
-        'message': 'Profile retrieved successfully'
-    }), 200
+    return with_etag(user_response(g.user_model, 'Profile retrieved successfully', fields=fields), etag)
 
 
 @profile_bp.route('/', methods=['PUT', 'PATCH'])
@@ -40,12 +98,22 @@ def update_profile():
     {
         "display_name": "New Display Name"
     }
+
+    An If-Match header must match the profile's current ETag (as
+    returned by GET /profile/ with the same fields and Accept), otherwise
+    nothing is written and 412 is returned. The user is then read from
+    the store, not the per-worker cache, and checked and written in one
+    transaction, so a concurrent update cannot be overwritten.
     """
-    # Attach user model to request
-    attach_user_to_request()
-    
-    if not g.user_model:
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not get_user_repository().available():
         return jsonify({'error': 'User not found in database'}), 500
+
+    fmt = negotiate_format()
     
     try:
         data = request.get_json()
@@ -53,24 +121,45 @@ def update_profile():
             return jsonify({'error': 'No data provided'}), 400
         
         # Validate input
+        display_name = data.get('display_name')
         if 'display_name' in data:
-            display_name = data['display_name']
             if not isinstance(display_name, str):
                 return jsonify({'error': 'display_name must be a string'}), 400
             if len(display_name.strip()) == 0:
                 return jsonify({'error': 'display_name cannot be empty'}), 400
-            
+            display_name = display_name.strip()
+
+        def apply_update(user, dirty):
+            etag = make_etag(version_of(user), g.user, 'profile', fields, fmt)
+            if if_match_failed(etag):
+                raise PreconditionFailed(etag)
+
             # Update user
-            g.user_model.display_name = display_name.strip()
-            g.user_model.put()
-            
-            current_app.logger.info(f"Updated display_name for user {g.user_model.uid}")
-        
-        return jsonify({
-            'user': g.user_model.to_dict(),
-            'message': 'Profile updated successfully'
-        }), 200
+            if display_name is not None and user.display_name != display_name:
+                user.display_name = display_name
+                dirty = True
+                current_app.logger.info(f"Updated display_name for user {user.uid}")
+            # One write for the token's claims and the update, if anything changed
+            return dirty
+
+        if request.if_match:
+            g.user_model = update_user(g.user, apply_update)
+            g.user_model_source = g.user
+        else:
+            # Load the user; claim changes are written together with the update
+            dirty = load_user_for_route()
+            if not g.user_model:
+                return jsonify({'error': 'User not found in database'}), 500
+            if apply_update(g.user_model, dirty):
+                save_user(g.user_model)
         
+        etag = make_etag(version_of(g.user_model), g.user, 'profile', fields, fmt)
+        return with_etag(user_response(g.user_model, 'Profile updated successfully', fields=fields), etag)
+
+    except PreconditionFailed as e:
+        response = jsonify({'error': 'Profile has been modified'})
+        response.set_etag(e.etag)
+        return response, 412
     except Exception as e:
         current_app.logger.error(f"Profile update error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -82,12 +171,28 @@ def get_user_stats():
     """
     Get user statistics and metadata.
     Requires Firebase authentication.
+
+    Supports If-None-Match like GET /profile/.
     """
+    today = datetime.utcnow()
+
+    def etag_for(version):
+        return make_etag(version, g.user, 'stats', account_age_days(version.created_at, today))
+
+    response = if_none_match(etag_for)
+    if response is not None:
+        return response
+
     # Attach user model to request
     attach_user_to_request()
     
     if not g.user_model:
         return jsonify({'error': 'User not found in database'}), 500
+
+    etag = etag_for(version_of(g.user_model))
+    client_etag = matching_etag(request.if_none_match, etag)
+    if client_etag is not None:
+        return not_modified(client_etag)
     
     try:
         # Calculate some basic stats
@@ -99,16 +204,13 @@ def get_user_stats():
         }
         
         # Calculate account age
-        if g.user_model.created_at:
-            from datetime import datetime
-            now = datetime.utcnow()
-            age_delta = now - g.user_model.created_at
-            stats['account_age_days'] = age_delta.days
+        stats['account_age_days'] = account_age_days(g.user_model.created_at, today)
         
-        return jsonify({
+        response = jsonify({
             'stats': stats,
             'message': 'User stats retrieved successfully'
-        }), 200
+        })
+        return with_etag(response, etag), 200
         
     except Exception as e:
         current_app.logger.error(f"User stats error: {e}")
@@ -123,21 +225,24 @@ def sync_profile():
     Requires Firebase authentication.
     """
     try:
-        # Attach user model to request
-        attach_user_to_request()
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        # Load the user with the latest Firebase data applied
+        dirty = load_user_for_route()
         
         if not g.user_model:
             return jsonify({'error': 'User not found in database'}), 500
         
-        # Update user with latest Firebase data
-        g.user_model.update_from_firebase_user(g.user)
+        # Written once, and only if something changed
+        if dirty:
+            save_user(g.user_model)
         
         current_app.logger.info(f"Synced profile for user {g.user_model.uid}")
         
-        return jsonify({
-            'user': g.user_model.to_dict(),
-            'message': 'Profile synced successfully'
-        }), 200
+        return user_response(g.user_model, 'Profile synced successfully', fields=fields)
         
     except Exception as e:
         current_app.logger.error(f"Profile sync error: {e}")
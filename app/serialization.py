@@ -0,0 +1,216 @@
+"""
+Response serialization for User payloads.
+
+Profile responses are built from pre-encoded user bytes. The encoding of
+a user depends only on its stored state, so it is cached per
+(uid, updated_at, fields, format): a user whose entity has not changed is
+encoded once per worker. The user must be saved (updated_at set) before
+it is serialized after a change, as the routes do.
+
+Clients may ask for a subset of fields with ``?fields=uid,email`` and for
+MessagePack instead of JSON with ``Accept: application/msgpack``.
+"""
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request
+
+from app.metrics import record_phase, PHASE_SERIALIZATION
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+# Keys of User.to_dict(), which ?fields= may select from
+USER_PAYLOAD_FIELDS = ('uid', 'email', 'display_name', 'created_at', 'updated_at',
+                       'email_verified', 'picture', 'provider_id')
+
+
+def encode_json(obj):
+    """Encode like Flask's jsonify outside debug mode."""
+    return json.dumps(obj, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+class PayloadCache:
+    """
+    Bounded LRU cache of encoded user payloads.
+
+    Usage:
+        cache = PayloadCache(max_size=4096)
+        data = cache.get(key)
+        if data is None:
+            cache.put(key, encode(user))
+    """
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Returns:
+            dict: size, hits and misses
+        """
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def parse_fields(value):
+    """
+    Parse a ``fields`` query parameter.
+
+    Args:
+        value (str): Comma-separated field names, or None for all fields
+
+    Returns:
+        tuple: Selected field names, in USER_PAYLOAD_FIELDS order
+
+    Raises:
+        ValueError: If an unknown field is requested
+    """
+    if not value:
+        return USER_PAYLOAD_FIELDS
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = requested.difference(USER_PAYLOAD_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in USER_PAYLOAD_FIELDS if name in requested)
+
+
+def negotiate_format():
+    """
+    Pick the response format from the Accept header.
+
+    Returns:
+        str: 'msgpack' if the client prefers MessagePack and it is
+            installed, 'json' otherwise
+    """
+    if msgpack is None:
+        return 'json'
+    offered = (JSON_MIMETYPE,) + MSGPACK_MIMETYPES
+    best = request.accept_mimetypes.best_match(offered, default=JSON_MIMETYPE)
+    return 'msgpack' if best in MSGPACK_MIMETYPES else 'json'
+
+
+def _encode_user(user, fields, fmt):
+    data = user.to_dict()
+    if fields is not USER_PAYLOAD_FIELDS:
+        data = {name: data[name] for name in fields}
+    if fmt == 'msgpack':
+        return msgpack.packb(data, use_bin_type=True)
+    return encode_json(data)
+
+
+def encode_user(user, fields=USER_PAYLOAD_FIELDS, fmt='json'):
+    """
+    Encode a user, reusing the cached bytes when the user is unchanged.
+
+    Args:
+        user (User): User to encode
+        fields (tuple): Field names from parse_fields
+        fmt (str): 'json' or 'msgpack'
+
+    Returns:
+        bytes: Encoded user object
+    """
+    cache = current_app.extensions.get('payload_cache')
+    if cache is None or user.updated_at is None:
+        return _encode_user(user, fields, fmt)
+
+    key = (user.uid, user.updated_at, fields, fmt)
+    data = cache.get(key)
+    if data is None:
+        data = _encode_user(user, fields, fmt)
+        cache.put(key, data)
+    return data
+
+
+@functools.lru_cache(maxsize=64)
+def _envelope_prefix(message, fmt):
+    # Everything before the user object; route messages are constants
+    if fmt == 'msgpack':
+        # A two-entry map: message, then user
+        return (b'\x82' + msgpack.packb('message') + msgpack.packb(message, use_bin_type=True)
+                + msgpack.packb('user'))
+    return b'{"message":' + encode_json(message) + b',"user":'
+
+
+def user_response(user, message, status=200, fields=USER_PAYLOAD_FIELDS):
+    """
+    Build a ``{"user": ..., "message": ...}`` response.
+
+    The format is negotiated from the Accept header; the user part comes
+    from encode_user, so a cache hit only joins pre-encoded bytes.
+
+    Args:
+        user (User): User to return
+        message (str): Message for the envelope
+        status (int): HTTP status code
+        fields (tuple): Field names from parse_fields
+
+    Returns:
+        Response: Flask response
+    """
+    started = time.perf_counter()
+    fmt = negotiate_format()
+    user_bytes = encode_user(user, fields, fmt)
+
+    if fmt == 'msgpack':
+        body = _envelope_prefix(message, fmt) + user_bytes
+        mimetype = MSGPACK_MIMETYPES[0]
+    else:
+        body = _envelope_prefix(message, fmt) + user_bytes + b'}\n'
+        mimetype = JSON_MIMETYPE
+
+    response = current_app.response_class(body, status=status, mimetype=mimetype)
+    response.headers['Vary'] = 'Accept'
+    record_phase(PHASE_SERIALIZATION, time.perf_counter() - started)
+    return response
+
+
+def init_serialization(app):
+    """
+    Create the app's encoded payload cache.
+
+    Disabled when SERIALIZATION_CACHE_SIZE is 0.
+
+    Args:
+        app (Flask): Application to configure
+    """
+    size = app.config.get('SERIALIZATION_CACHE_SIZE', 4096)
+    if size > 0:
+        app.extensions['payload_cache'] = PayloadCache(max_size=size)
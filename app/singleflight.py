@@ -0,0 +1,141 @@
+"""
+Per-worker coalescing of concurrent identical work for cloudrun-init.
+
+A page load sends several requests with the same token at once
+(/auth/status, /auth/me, /profile/). Without coordination each one
+verifies the token, and on a first login each one looks up and creates
+the user. A SingleFlight group lets the first caller for a key do the
+work while concurrent callers with the same key wait for its outcome.
+
+Two groups are kept per app:
+
+    token_verify  keyed by the token's SHA-256 digest
+    user_load     keyed by Firebase UID
+"""
+import threading
+from flask import current_app
+
+GROUP_TOKEN_VERIFY = 'token_verify'
+GROUP_USER_LOAD = 'user_load'
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs concurrent calls with the same key once and shares the outcome.
+
+    Only calls that overlap in time are coalesced; nothing is cached once
+    the leading call returns. Waiters get the leader's return value (or
+    its exception) as is, so callers that mutate results should copy them.
+
+    Usage:
+        group = SingleFlight()
+        result, shared = group.do(key, func, *args)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Call func(*args, **kwargs) unless a call for key is in progress.
+
+        Returns:
+            tuple: (result, whether it came from another caller's call)
+
+        Raises:
+            Exception: Whatever the leading call raised
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        """Number of keys currently being worked on."""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        """
+        Get coalescing counters.
+
+        Returns:
+            dict: executed and coalesced call counts
+        """
+        with self._lock:
+            return {'executed': self.executed, 'coalesced': self.coalesced}
+
+
+def get_group(name):
+    """
+    Get one of the current app's single-flight groups.
+
+    Returns:
+        SingleFlight: The group, or None if coalescing is disabled
+    """
+    return current_app.extensions.get('singleflight', {}).get(name)
+
+
+def init_singleflight(app):
+    """
+    Create the app's single-flight groups.
+
+    Disabled when SINGLEFLIGHT_ENABLED is false. Counters are exported on
+    /metrics as app_singleflight_calls_total{group,outcome} when metrics
+    are enabled.
+
+    Args:
+        app (Flask): Application to configure
+    """
+    if not app.config.get('SINGLEFLIGHT_ENABLED', True):
+        return
+    groups = {GROUP_TOKEN_VERIFY: SingleFlight(), GROUP_USER_LOAD: SingleFlight()}
+    app.extensions['singleflight'] = groups
+
+    metrics = app.extensions.get('metrics')
+    if metrics is not None:
+        def collect():
+            lines = ['# HELP app_singleflight_calls_total Calls that ran (executed) or waited '
+                     'for a concurrent identical call (coalesced).',
+                     '# TYPE app_singleflight_calls_total counter']
+            for name, group in sorted(groups.items()):
+                for outcome, count in sorted(group.stats().items()):
+                    lines.append(f'app_singleflight_calls_total{{group="{name}",'
+                                 f'outcome="{outcome}"}} {count}')
+            return lines
+
+        metrics.add_collector(collect)
@@ -0,0 +1,152 @@
+"""
+Startup initialization of external dependencies for cloudrun-init.
+
+Initializing Firebase Admin, loading the token signing keys and creating
+the NDB client involve credential discovery and network round trips.
+With WARMUP=background they run on a daemon thread after create_app
+returns, so the server starts accepting connections (and answering
+/health) without waiting for them. Each dependency also initializes
+itself on first use, so a request that arrives before the warm-up has
+finished still works:
+
+    Firebase Admin   FirebaseState.available() initializes it
+    Signing keys     verification falls back to firebase_admin
+    NDB client       NDBClientRegistry creates it on first context
+
+With WARMUP=eager (the default for test configs) everything runs inside
+create_app, as before. With WARMUP=worker nothing runs in create_app and
+the gunicorn post_worker_init hook (gunicorn.conf.py) calls after_fork in
+each worker, so a preloading master never opens connections its workers
+would inherit.
+"""
+import threading
+import time
+
+
+class Warmup:
+    """
+    Runs the dependency initialization steps and records their timings.
+
+    Usage:
+        warmup = Warmup(app)
+        warmup.start()
+        warmup.wait(timeout=10)
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.timings = {}
+        self.finished = threading.Event()
+        self._thread = None
+
+    def steps(self):
+        """
+        Get the initialization steps for the app.
+
+        Returns:
+            list: (name, callable) pairs, run in order
+        """
+        from app.auth.firebase import start_key_manager
+
+        steps = [('firebase', self._init_firebase)]
+        if self.app.extensions.get('firebase_keys') is not None:
+            steps.append(('firebase_keys', lambda: start_key_manager(self.app)))
+        if self.app.config.get('USER_STORE', 'ndb') == 'ndb':
+            steps.append(('ndb', self._init_ndb))
+        return steps
+
+    def _init_firebase(self):
+        state = self.app.extensions['firebase']
+        state.ensure_initialized()
+        self.app.logger.info(f"Firebase initialization: {state.status}")
+
+    def _init_ndb(self):
+        from app.ndb_client import ndb_registry
+
+        ndb_available = ndb_registry.initialize()
+        if ndb_available:
+            self.app.logger.info("NDB client initialized successfully")
+        self.app.config['NDB_AVAILABLE'] = ndb_available
+
+    def run(self):
+        """Run all steps in an application context."""
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                for name, step in self.steps():
+                    step_started = time.perf_counter()
+                    try:
+                        step()
+                    except Exception as e:
+                        self.app.logger.error(f"Warm-up step {name} failed: {e}")
+                    self.timings[name] = time.perf_counter() - step_started
+        finally:
+            self.timings['total'] = time.perf_counter() - started
+            self.finished.set()
+        self.app.logger.info(f"Warm-up finished in {self.timings['total'] * 1000:.0f} ms")
+
+    def start(self):
+        """Run the steps on a background daemon thread."""
+        self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the warm-up to finish.
+
+        Returns:
+            bool: True if it finished within the timeout
+        """
+        return self.finished.wait(timeout)
+
+
+def init_warmup(app):
+    """
+    Initialize the app's dependencies now, in the background or per worker.
+
+    Controlled by the WARMUP setting ('background', 'eager' or 'worker').
+
+    Args:
+        app (Flask): Application being created
+
+    Returns:
+        Warmup: The app's warm-up, also stored as app.extensions['warmup']
+    """
+    warmup = Warmup(app)
+    app.extensions['warmup'] = warmup
+    mode = app.config.get('WARMUP', 'eager')
+    if mode == 'background':
+        warmup.start()
+    elif mode != 'worker':
+        warmup.run()
+    return warmup
+
+
+def after_fork(app):
+    """
+    Rebuild per-process state in a forked worker and warm it up.
+
+    The NDB client's gRPC channel and the Firebase Admin app's HTTP
+    sessions cannot be shared with the parent, so both are dropped and
+    recreated by a new background warm-up. Loaded signing keys are plain
+    data and are kept; their refresh thread is restarted.
+
+    Args:
+        app (Flask): Application loaded in the worker
+
+    Returns:
+        Warmup: The worker's warm-up
+    """
+    from app.ndb_client import ndb_registry
+
+    ndb_registry.reset()
+    state = app.extensions.get('firebase')
+    if state is not None:
+        state.reset()
+    if app.config.get('USER_STORE', 'ndb') == 'ndb':
+        app.config.pop('NDB_AVAILABLE', None)
+
+    warmup = Warmup(app)
+    app.extensions['warmup'] = warmup
+    warmup.start()
+    return warmup
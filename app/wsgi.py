@@ -0,0 +1,13 @@
+"""
+WSGI entry point for cloudrun-init.
+
+Creating the app starts its warm-up (see app.warmup), so it is done here
+rather than in app.main, which tests and tools import for create_app.
+
+Usage:
+    gunicorn --config gunicorn.conf.py app.wsgi:app
+"""
+from app.main import create_app
+
+# For gunicorn
+app = create_app()
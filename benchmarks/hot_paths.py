@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-request hot paths and check them against a baseline.
+
+Runs the real decorator chains (login_required, optional_login,
+user_required), attach_user_to_request, User.to_dict and
+verify_firebase_token against an in-process Datastore stand-in, with ID
+tokens signed by a local key pair. Each case reports ops/sec, p50 and p99.
+
+The first run on a machine saves its results as the JSON baseline
+(benchmarks/baselines/, not committed: numbers from one machine mean
+nothing on another). Later runs fail (exit status 1) when a case's
+ops/sec drops by more than the threshold below its baseline; --save
+replaces the baseline, e.g. after an intended change to a hot path.
+
+Usage:
+    python -m benchmarks.hot_paths [--duration 1] [--threshold 0.25]
+                                   [--baseline PATH] [--save] [cases ...]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from flask import g, jsonify
+
+from support.datastore_fake import FakeDatastore
+from support.tokens import LocalIssuer
+
+PROJECT_ID = 'bench-project'
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'hot_paths.json')
+DEFAULT_THRESHOLD = 0.25
+
+
+def measure(func, duration=1.0, warmup=0.1):
+    """
+    Call func repeatedly for duration seconds.
+
+    Returns:
+        dict: ops_per_sec, p50_us, p99_us and iterations
+    """
+    deadline = time.perf_counter() + warmup
+    while time.perf_counter() < deadline:
+        func()
+
+    latencies = []
+    started = time.perf_counter()
+    deadline = started + duration
+    clock = time.perf_counter
+    while True:
+        op_started = clock()
+        func()
+        op_finished = clock()
+        latencies.append(op_finished - op_started)
+        if op_finished >= deadline:
+            break
+    elapsed = clock() - started
+
+    latencies.sort()
+    return {
+        'ops_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_us': round(latencies[len(latencies) // 2] * 1e6, 2),
+        'p99_us': round(latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1e6, 2),
+        'iterations': len(latencies),
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Find cases whose throughput regressed past the threshold.
+
+    Args:
+        results (dict): {case: measurement} from this run
+        baseline (dict): {case: measurement} to compare against
+        threshold (float): Allowed fractional drop in ops/sec
+
+    Returns:
+        list: (case, baseline ops/sec, current ops/sec) for each regression
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected and result['ops_per_sec'] < expected['ops_per_sec'] * (1 - threshold):
+            regressions.append((name, expected['ops_per_sec'], result['ops_per_sec']))
+    return regressions
+
+
+def build_cases(datastore):
+    """
+    Create the benchmark apps and their cases.
+
+    Returns:
+        dict: {case name: zero-argument callable}
+    """
+    from app.main import create_app
+    from app.auth.firebase import (login_required, optional_login, verify_firebase_token,
+                                   get_token_cache)
+    from app.auth.user_middleware import attach_user_to_request, user_required
+    from app.models.user import User
+    from app.ndb_client import ndb_registry
+
+    os.environ['DATASTORE_EMULATOR_HOST'] = datastore.host
+    os.environ['DATASTORE_PROJECT_ID'] = PROJECT_ID
+    issuer = LocalIssuer(PROJECT_ID)
+    token = issuer.mint('bench-user', email='bench@example.com', name='Bench User')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def make_app(**config):
+        app = create_app(dict({
+            'TESTING': True,
+            'FIREBASE_PROJECT_ID': PROJECT_ID,
+            'FIREBASE_KEY_PREFETCH': True,
+            'FIREBASE_CERTS_SOURCE': issuer.certificates,
+        }, **config))
+        app.logger.setLevel(logging.ERROR)
+        return app
+
+    app = make_app()
+    uncached_app = make_app(USER_CACHE_TTL=0)
+
+    @login_required
+    def protected():
+        return jsonify({'uid': g.user['uid']})
+
+    @optional_login
+    def optional():
+        return jsonify({'uid': g.user['uid'] if g.user else None})
+
+    @login_required
+    @user_required
+    def profile():
+        return jsonify({'user': g.user_model.to_dict()})
+
+    def in_request(target_app, view, request_headers=headers):
+        def run():
+            with target_app.test_request_context('/', headers=request_headers):
+                view()
+        return run
+
+    with app.test_request_context('/', headers=headers):
+        user_info = verify_firebase_token(token)
+        # Create the user so every case below reads an existing one
+        profile()
+    with uncached_app.test_request_context('/', headers=headers):
+        verify_firebase_token(token)
+
+    def verify_uncached():
+        with app.app_context():
+            get_token_cache().clear()
+            verify_firebase_token(token)
+
+    def verify_cached():
+        with app.app_context():
+            verify_firebase_token(token)
+
+    def attach_uncached():
+        with uncached_app.test_request_context('/'):
+            g.user = user_info
+            attach_user_to_request()
+
+    with app.app_context(), ndb_registry.context():
+        user = User.get_by_uid('bench-user')
+
+    return {
+        'request_context': in_request(app, lambda: None),
+        'verify_firebase_token.uncached': verify_uncached,
+        'verify_firebase_token.cached': verify_cached,
+        'login_required': in_request(app, protected),
+        'optional_login.anonymous': in_request(app, optional, {}),
+        'optional_login.token': in_request(app, optional),
+        'user_required.cached_user': in_request(app, profile),
+        'user_required.datastore': in_request(uncached_app, profile),
+        'attach_user_to_request.datastore': attach_uncached,
+        'User.to_dict': user.to_dict,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('cases', nargs='*', help='Cases to run (default: all)')
+    parser.add_argument('--duration', type=float, default=1.0, help='Seconds per case')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline JSON file')
+    parser.add_argument('--threshold', type=float,
+                        default=float(os.environ.get('BENCH_THRESHOLD', DEFAULT_THRESHOLD)),
+                        help='Allowed fractional ops/sec drop before failing (default 0.25)')
+    parser.add_argument('--save', action='store_true', help='Write results as the new baseline')
+    args = parser.parse_args(argv)
+
+    datastore = FakeDatastore()
+    datastore.start()
+    try:
+        cases = build_cases(datastore)
+        unknown = set(args.cases) - set(cases)
+        if unknown:
+            parser.error(f"Unknown cases: {', '.join(sorted(unknown))}")
+
+        results = {}
+        print(f"{'case':36s} {'ops/sec':>12s} {'p50 us':>10s} {'p99 us':>10s}")
+        for name, func in cases.items():
+            if args.cases and name not in args.cases:
+                continue
+            results[name] = measure(func, duration=args.duration)
+            result = results[name]
+            print(f"{name:36s} {result['ops_per_sec']:12.1f} {result['p50_us']:10.1f} {result['p99_us']:10.1f}")
+    finally:
+        datastore.stop()
+
+    if args.save or not os.path.exists(args.baseline):
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}; later runs compare against it")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for name, expected, actual in regressions:
+        print(f"REGRESSION {name}: {actual:.1f} ops/sec vs baseline {expected:.1f} "
+              f"(-{(1 - actual / expected) * 100:.0f}%, threshold {args.threshold * 100:.0f}%)")
+    if regressions:
+        return 1
+    print(f"No regressions beyond {args.threshold * 100:.0f}% of {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
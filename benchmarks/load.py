@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Concurrent load generator for the authenticated API.
+
+Starts a Datastore stand-in with simulated RPC latency and signs ID tokens
+with a local key pair (the server verifies them via FIREBASE_CERTS_SOURCE),
+then drives /auth/status, /auth/me, GET /profile/ and PATCH /profile/ from
+--concurrency connections against a server started with gunicorn.conf.py
+(or uvicorn with --server asgi). Scenarios:
+
+  steady      --users existing users send the --mix of requests for
+              --duration seconds
+  cold-start  load starts the moment the server is spawned; reports the
+              time to the first 200 and latencies while it warms up
+  storm       --users brand-new users each load the page (/auth/status,
+              /auth/me, /profile/) at once: every request is a first login
+
+Throughput, latency percentiles per route and error counts are printed
+(--output also writes them as JSON). Other environment variables are
+passed to the server, so settings can be compared, e.g.
+SINGLEFLIGHT_ENABLED=false python -m benchmarks.load --scenario storm.
+
+Usage:
+    python -m benchmarks.load [--scenario steady|cold-start|storm|all] [--concurrency 64]
+        [--users 1000] [--duration 10] [--mix status=3,me=3,profile=3,patch=1]
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import queue
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.serving import PROJECT_ID, percentile, wait_for_server
+from support.datastore_fake import FakeDatastore
+from support.tokens import LocalIssuer
+
+# name -> (method, path)
+ROUTES = {
+    'status': ('GET', '/auth/status'),
+    'me': ('GET', '/auth/me'),
+    'profile': ('GET', '/profile/'),
+    'patch': ('PATCH', '/profile/'),
+}
+
+# Requests a browser sends when a signed-in user opens the page
+PAGE_LOAD = ('status', 'me', 'profile')
+
+DEFAULT_MIX = 'status=3,me=3,profile=3,patch=1'
+
+SERVERS = {
+    'gunicorn': ['gunicorn', '--config', 'gunicorn.conf.py', 'app.wsgi:app'],
+    'asgi': ['uvicorn', '--host', '127.0.0.1', '--port', '{port}', '--workers', '{workers}',
+             '--no-access-log', 'app.asgi:app'],
+}
+
+
+def parse_mix(text):
+    """
+    Parse a request mix such as 'status=3,me=1'.
+
+    Returns:
+        dict: Route name -> relative weight
+
+    Raises:
+        ValueError: For unknown routes or weights that are not positive
+    """
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"Unknown route {name!r}; choose from {', '.join(ROUTES)}")
+        mix[name] = float(weight or 1)
+        if mix[name] <= 0:
+            raise ValueError(f"Weight of {name} must be positive")
+    return mix
+
+
+def storm_plan(tokens):
+    """
+    Order the page loads of new users so each user's requests run together.
+
+    Returns:
+        list: (route, token) in the order workers should take them
+    """
+    return [(route, token) for token in tokens for route in PAGE_LOAD]
+
+
+class Connection:
+    """Keep-alive HTTP connection that reconnects after failures."""
+
+    def __init__(self, port, timeout=30):
+        self.port = port
+        self.timeout = timeout
+        self._connection = None
+        self._sequence = itertools.count()
+
+    def send(self, route, token):
+        """
+        Send one request.
+
+        Returns:
+            int: HTTP status
+
+        Raises:
+            OSError: If the server cannot be reached
+        """
+        method, path = ROUTES[route]
+        headers = {'Authorization': f'Bearer {token}'}
+        body = None
+        if method == 'PATCH':
+            body = json.dumps({'display_name': f'Load {next(self._sequence)}'})
+            headers['Content-Type'] = 'application/json'
+        if self._connection is None:
+            self._connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.timeout)
+        try:
+            self._connection.request(method, path, body=body, headers=headers)
+            response = self._connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def _run_workers(concurrency, worker):
+    samples = []
+    lock = threading.Lock()
+
+    def run():
+        local = worker()
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=run) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def _timed_send(connection, route, token, local):
+    started = time.perf_counter()
+    try:
+        status = connection.send(route, token)
+    except (OSError, http.client.HTTPException):
+        status = None
+    local.append((route, time.perf_counter() - started, status, time.perf_counter()))
+    return status
+
+
+def run_mix(port, tokens, concurrency, duration, mix, retry_refused=False):
+    """
+    Send a weighted mix of requests from concurrency connections.
+
+    With retry_refused, connection failures before a connection's first
+    response are retried instead of counted (for cold starts).
+
+    Returns:
+        list: (route, latency, HTTP status or None, finish time) samples
+    """
+    routes, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        rng = random.Random()
+        connection = Connection(port)
+        local = []
+        waiting = retry_refused
+        while time.perf_counter() < deadline:
+            route = rng.choices(routes, weights)[0]
+            token = tokens[rng.randrange(len(tokens))]
+            status = _timed_send(connection, route, token, local)
+            if status is None and waiting:
+                local.pop()
+                time.sleep(0.01)
+            elif status is not None:
+                waiting = False
+        connection.close()
+        return local
+
+    return _run_workers(concurrency, worker)
+
+
+def run_plan(port, plan, concurrency):
+    """
+    Send each (route, token) of plan once, from concurrency connections.
+
+    Returns:
+        list: Samples as from run_mix
+    """
+    work = queue.SimpleQueue()
+    for item in plan:
+        work.put(item)
+
+    def worker():
+        connection = Connection(port)
+        local = []
+        while True:
+            try:
+                route, token = work.get_nowait()
+            except queue.Empty:
+                break
+            _timed_send(connection, route, token, local)
+        connection.close()
+        return local
+
+    return _run_workers(concurrency, worker)
+
+
+def summarize(samples, elapsed):
+    """
+    Summarize samples per route and overall.
+
+    Returns:
+        dict: Route name (and 'all') -> requests, req/s, errors and
+            latency percentiles in milliseconds
+    """
+    by_route = {}
+    for sample in samples:
+        by_route.setdefault(sample[0], []).append(sample)
+    by_route['all'] = samples
+
+    summary = {}
+    for route, route_samples in by_route.items():
+        if not route_samples:
+            continue
+        latencies = [sample[1] for sample in route_samples]
+        summary[route] = {
+            'requests': len(route_samples),
+            'req_per_sec': len(route_samples) / elapsed if elapsed else 0.0,
+            'errors': sum(1 for sample in route_samples if sample[2] is None or sample[2] >= 400),
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p90_ms': percentile(latencies, 0.90) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'max_ms': max(latencies) * 1000,
+        }
+    return summary
+
+
+def print_summary(title, summary):
+    print(title)
+    for route in list(ROUTES) + ['all']:
+        if route not in summary:
+            continue
+        row = summary[route]
+        print(f"  {route:8s} {row['requests']:7d} req {row['req_per_sec']:9.1f} req/s  "
+              f"p50 {row['p50_ms']:7.1f}  p90 {row['p90_ms']:7.1f}  p99 {row['p99_ms']:7.1f}  "
+              f"max {row['max_ms']:7.1f} ms  errors {row['errors']}")
+
+
+def start_server(args, env):
+    command = [part.format(port=args.port, workers=args.workers or 2) for part in SERVERS[args.server]]
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_server(server):
+    server.terminate()
+    server.wait()
+
+
+def scenario_steady(args, env, issuer, datastore):
+    tokens = [issuer.mint(f'steady-user-{i}') for i in range(args.users)]
+    server = start_server(args, env)
+    try:
+        wait_for_server(args.port)
+        # Create the users and fill the caches before measuring
+        run_plan(args.port, storm_plan(tokens), args.concurrency)
+        started = time.perf_counter()
+        samples = run_mix(args.port, tokens, args.concurrency, args.duration, args.mix)
+        elapsed = time.perf_counter() - started
+    finally:
+        stop_server(server)
+    return {'summary': summarize(samples, elapsed)}
+
+
+def scenario_cold_start(args, env, issuer, datastore):
+    tokens = [issuer.mint(f'cold-user-{i}') for i in range(args.users)]
+    spawned = time.perf_counter()
+    server = start_server(args, env)
+    try:
+        samples = run_mix(args.port, tokens, args.concurrency, args.duration, args.mix,
+                          retry_refused=True)
+        elapsed = time.perf_counter() - spawned
+    finally:
+        stop_server(server)
+    ok = [sample[3] for sample in samples if sample[2] is not None and sample[2] < 400]
+    return {
+        'first_ok_sec': (min(ok) - spawned) if ok else None,
+        'summary': summarize(samples, elapsed),
+    }
+
+
+def scenario_storm(args, env, issuer, datastore):
+    tokens = [issuer.mint(f'storm-user-{i}') for i in range(args.users)]
+    server = start_server(args, env)
+    try:
+        wait_for_server(args.port)
+        users_before = datastore.count('User')
+        commits_before = datastore.calls['commit']
+        started = time.perf_counter()
+        samples = run_plan(args.port, storm_plan(tokens), args.concurrency)
+        elapsed = time.perf_counter() - started
+    finally:
+        stop_server(server)
+    return {
+        'users_created': datastore.count('User') - users_before,
+        'commits': datastore.calls['commit'] - commits_before,
+        'logins_per_sec': args.users / elapsed,
+        'summary': summarize(samples, elapsed),
+    }
+
+
+SCENARIOS = {
+    'steady': scenario_steady,
+    'cold-start': scenario_cold_start,
+    'storm': scenario_storm,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--scenario', choices=list(SCENARIOS) + ['all'], default='all')
+    parser.add_argument('--concurrency', type=int, default=64, help='Concurrent connections')
+    parser.add_argument('--users', type=int, default=1000,
+                        help='Users per scenario (new users for storm)')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='Seconds of load for steady and cold-start')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'Weighted request mix (default {DEFAULT_MIX})')
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='Simulated Datastore RPC latency in seconds')
+    parser.add_argument('--server', choices=list(SERVERS), default='gunicorn')
+    parser.add_argument('--workers', type=int, help='Server workers (default: sized by gunicorn.conf.py)')
+    parser.add_argument('--threads', type=int, help='Threads per gunicorn worker')
+    parser.add_argument('--port', type=int, default=18100)
+    parser.add_argument('--output', help='Also write the results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    datastore = FakeDatastore(latency=args.latency)
+    datastore.start()
+    issuer = LocalIssuer(PROJECT_ID)
+    results = {'server': args.server, 'concurrency': args.concurrency, 'users': args.users}
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            certs_path = os.path.join(tmp, 'certs.json')
+            issuer.write_certificates(certs_path)
+            env = dict(
+                os.environ,
+                PORT=str(args.port),
+                DATASTORE_EMULATOR_HOST=datastore.host,
+                DATASTORE_PROJECT_ID=PROJECT_ID,
+                GOOGLE_CLOUD_PROJECT=PROJECT_ID,
+                FIREBASE_PROJECT_ID=PROJECT_ID,
+                FIREBASE_CERTS_SOURCE=certs_path,
+                ASGI_MAX_THREADS=str(args.concurrency),
+            )
+            if args.workers:
+                env['GUNICORN_WORKERS'] = str(args.workers)
+            if args.threads:
+                env['GUNICORN_THREADS'] = str(args.threads)
+
+            names = list(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+            for name in names:
+                result = SCENARIOS[name](args, env, issuer, datastore)
+                results[name] = result
+                extra = ', '.join(f'{key} {value:.2f}' if isinstance(value, float) else f'{key} {value}'
+                                  for key, value in result.items() if key != 'summary')
+                print_summary(f"{name} ({args.server}, concurrency {args.concurrency}"
+                              f"{', ' + extra if extra else ''})", result['summary'])
+    finally:
+        datastore.stop()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
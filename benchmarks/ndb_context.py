@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-request NDB context creation.
+
+Compares the old behaviour (a new ndb.Client for every decorated call)
+with contexts handed out by the process-wide NDBClientRegistry.
+
+Usage:
+    python -m benchmarks.ndb_context [iterations]
+"""
+import os
+import sys
+import time
+
+# Point NDB at an (unused) emulator address so no credentials are needed;
+# no RPCs are made, only client and context setup is measured.
+os.environ.setdefault('DATASTORE_EMULATOR_HOST', 'localhost:8081')
+os.environ.setdefault('DATASTORE_PROJECT_ID', 'bench-project')
+
+from app.main import create_app  # noqa: E402
+from app.ndb_client import init_ndb_client, ndb_registry  # noqa: E402
+
+
+def per_call_client():
+    """Old path: build a new client, then a context from it."""
+    with init_ndb_client().context():
+        pass
+
+
+def pooled_client():
+    """New path: context from the shared client."""
+    with ndb_registry.context():
+        pass
+
+
+def run(func, iterations):
+    """Run func iterations times and return microseconds per call."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    app = create_app({'TESTING': True, 'GOOGLE_CLOUD_PROJECT': 'bench-project'})
+    # Keep client construction logging out of the measurement
+    app.logger.disabled = True
+
+    with app.app_context():
+        # Warm up both paths
+        per_call_client()
+        pooled_client()
+
+        before = run(per_call_client, iterations)
+        after = run(pooled_client, iterations)
+
+    print(f"NDB context setup ({iterations} iterations)")
+    print(f"  new client per call: {before:10.1f} us/request")
+    print(f"  pooled client:       {after:10.1f} us/request")
+    print(f"  speedup:             {before / after:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
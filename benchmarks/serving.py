@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Load-test comparison of the gunicorn (sync) and ASGI serving modes.
+
+Starts a Datastore stand-in with simulated RPC latency, signs ID tokens
+with a local key pair (the app verifies them via FIREBASE_CERTS_SOURCE),
+then drives concurrent GET /profile/ requests against:
+
+  * gunicorn with gunicorn.conf.py (gthread) app.wsgi:app
+  * uvicorn app.asgi:app                              (ASGI mode)
+
+Both get --workers workers and run --concurrency requests at once:
+gunicorn sizes its threads from CONCURRENCY, and each uvicorn worker
+gets the same number of request threads (ASGI_MAX_THREADS), so only the
+serving mode differs. The per-worker user cache is disabled so every
+request reaches Datastore.
+
+Usage:
+    python -m benchmarks.serving [--concurrency 64] [--workers 2] [--duration 10] [--latency 0.02]
+"""
+import argparse
+import http.client
+import math
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from support.datastore_fake import FakeDatastore
+from support.tokens import LocalIssuer
+
+PROJECT_ID = 'bench-project'
+
+SERVERS = {
+    'gunicorn (gthread)': ['gunicorn', '--config', 'gunicorn.conf.py', '--bind', '127.0.0.1:{port}',
+                           'app.wsgi:app'],
+    'uvicorn (ASGI)': ['uvicorn', '--host', '127.0.0.1', '--port', '{port}', '--workers', '{workers}',
+                       '--no-access-log', 'app.asgi:app'],
+}
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def drive(port, tokens, concurrency, duration):
+    """
+    Send GET /profile/ from concurrency threads for duration seconds.
+
+    Returns:
+        tuple: (list of latencies in seconds, number of errors)
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        headers = {'Authorization': f'Bearer {tokens[index % len(tokens)]}'}
+        local = []
+        failed = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                connection.request('GET', '/profile/', headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Simulated Datastore RPC latency in seconds')
+    parser.add_argument('--port', type=int, default=18080)
+    args = parser.parse_args()
+
+    datastore = FakeDatastore(latency=args.latency)
+    datastore.start()
+    issuer = LocalIssuer(PROJECT_ID)
+    tokens = [issuer.mint(f'bench-user-{i}') for i in range(args.concurrency)]
+    # Threads per worker for both servers, as gunicorn.conf.py sizes them
+    threads = math.ceil(args.concurrency / args.workers)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        certs_path = os.path.join(tmp, 'certs.json')
+        issuer.write_certificates(certs_path)
+        env = dict(
+            os.environ,
+            DATASTORE_EMULATOR_HOST=datastore.host,
+            DATASTORE_PROJECT_ID=PROJECT_ID,
+            GOOGLE_CLOUD_PROJECT=PROJECT_ID,
+            FIREBASE_PROJECT_ID=PROJECT_ID,
+            FIREBASE_KEY_PREFETCH='true',
+            FIREBASE_CERTS_SOURCE=certs_path,
+            USER_CACHE_TTL='0',
+            CONCURRENCY=str(args.concurrency),
+            GUNICORN_WORKERS=str(args.workers),
+            GUNICORN_THREADS=str(threads),
+            ASGI_MAX_THREADS=str(threads),
+        )
+
+        print(f"GET /profile/, concurrency {args.concurrency}, {args.workers} workers x "
+              f"{threads} threads, {args.duration:.0f}s, "
+              f"Datastore latency {args.latency * 1000:.0f} ms")
+        for name, command in SERVERS.items():
+            command = [part.format(port=args.port, workers=args.workers) for part in command]
+            server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL)
+            try:
+                wait_for_server(args.port)
+                # Warm up: create the users and fill the token caches
+                drive(args.port, tokens, args.concurrency, 1)
+                latencies, errors = drive(args.port, tokens, args.concurrency, args.duration)
+            finally:
+                server.terminate()
+                server.wait()
+
+            print(f"  {name:20s} {len(latencies) / args.duration:8.1f} req/s  "
+                  f"p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+                  f"p99 {percentile(latencies, 0.99) * 1000:7.1f} ms  errors {errors}")
+
+    datastore.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
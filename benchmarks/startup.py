@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark.
+
+Measures what a new Cloud Run instance pays before it can serve:
+
+  * import time of app.wsgi, which creates the app, in fresh
+    interpreters (median of --imports)
+  * time from spawning gunicorn (the Dockerfile command) to the first
+    200 from /health and from an authenticated GET /profile/, for each
+    WARMUP mode
+
+The Datastore stand-in and locally signed tokens from benchmarks.serving
+are used, so no network access is needed.
+
+Usage:
+    python -m benchmarks.startup [--imports 5] [--runs 3] [--output startup.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.serving import PROJECT_ID
+from support.datastore_fake import FakeDatastore
+from support.tokens import LocalIssuer
+
+IMPORT_SNIPPET = ('import time; started = time.perf_counter(); import app.wsgi; '
+                  'print(time.perf_counter() - started)')
+
+SERVER = ['gunicorn', '--bind', '127.0.0.1:{port}', '--workers', '1', '--threads', '2',
+          '--timeout', '120', 'app.wsgi:app']
+
+
+def measure_import(env, runs):
+    """
+    Time ``import app.wsgi`` in fresh interpreters.
+
+    Returns:
+        list: Import times in seconds
+    """
+    times = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return times
+
+
+def first_ok(port, path, headers, deadline):
+    """
+    Poll a path until it answers 200.
+
+    Returns:
+        float: perf_counter() time of the first 200
+    """
+    while time.perf_counter() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status == 200:
+                return time.perf_counter()
+        except OSError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError(f"GET {path} on port {port} did not succeed")
+
+
+def measure_start(env, port, token, timeout=60):
+    """
+    Spawn the server and time its first successful responses.
+
+    Returns:
+        dict: Seconds from spawn to first /health and first /profile/
+    """
+    started = time.perf_counter()
+    server = subprocess.Popen([part.format(port=port) for part in SERVER], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = started + timeout
+        health = first_ok(port, '/health', {}, deadline)
+        profile = first_ok(port, '/profile/', {'Authorization': f'Bearer {token}'}, deadline)
+    finally:
+        server.terminate()
+        server.wait()
+    return {'health': health - started, 'profile': profile - started}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--imports', type=int, default=5, help='Fresh-interpreter import runs')
+    parser.add_argument('--runs', type=int, default=3, help='Server starts per WARMUP mode')
+    parser.add_argument('--port', type=int, default=18090)
+    parser.add_argument('--output', help='Also write the results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    datastore = FakeDatastore()
+    datastore.start()
+    issuer = LocalIssuer(PROJECT_ID)
+    results = {'python': sys.version.split()[0]}
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            certs_path = os.path.join(tmp, 'certs.json')
+            issuer.write_certificates(certs_path)
+            env = dict(
+                os.environ,
+                DATASTORE_EMULATOR_HOST=datastore.host,
+                DATASTORE_PROJECT_ID=PROJECT_ID,
+                GOOGLE_CLOUD_PROJECT=PROJECT_ID,
+                FIREBASE_PROJECT_ID=PROJECT_ID,
+                FIREBASE_CERTS_SOURCE=certs_path,
+            )
+
+            imports = measure_import(env, args.imports)
+            results['import_app_wsgi'] = statistics.median(imports)
+            print(f"import app.wsgi          {results['import_app_wsgi'] * 1000:8.1f} ms "
+                  f"(median of {len(imports)})")
+
+            for mode in ('eager', 'background'):
+                runs = [measure_start(dict(env, WARMUP=mode), args.port,
+                                      issuer.mint(f'startup-user-{mode}-{i}'))
+                        for i in range(args.runs)]
+                results[f'warmup_{mode}'] = {
+                    name: statistics.median(run[name] for run in runs)
+                    for name in ('health', 'profile')
+                }
+                summary = results[f'warmup_{mode}']
+                print(f"WARMUP={mode:10s}  first /health {summary['health'] * 1000:8.1f} ms  "
+                      f"first /profile/ {summary['profile'] * 1000:8.1f} ms")
+    finally:
+        datastore.stop()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Gunicorn configuration for cloudrun-init.
+
+Workers and threads are sized from the container instead of being fixed:
+
+  workers  one per available CPU, capped by how many fit in the memory
+           limit at GUNICORN_WORKER_MEMORY_MB each
+  threads  enough for the workers together to serve CONCURRENCY requests
+           at once (Cloud Run's container concurrency, default 80)
+
+GUNICORN_WORKERS and GUNICORN_THREADS override the computed values.
+
+The app is preloaded in the master so workers share its imported code
+copy-on-write. The master does not initialize Firebase, the signing keys
+or the Datastore client (WARMUP=worker); each worker does that after the
+fork, in the background (see app.warmup.after_fork).
+
+Usage:
+    gunicorn app.wsgi:app        # picks up ./gunicorn.conf.py
+"""
+import math
+import os
+
+DEFAULT_CONCURRENCY = 80
+DEFAULT_WORKER_MEMORY_MB = 256
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_count():
+    """
+    Get the number of CPUs this container may use.
+
+    Honors a cgroup CPU quota (what Cloud Run's --cpu sets) and the CPU
+    affinity mask; never less than 1.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    cpu_max = _read('/sys/fs/cgroup/cpu.max')
+    if cpu_max:
+        limit, period = cpu_max.split()
+        if limit != 'max':
+            quota = int(limit) / int(period)
+    else:
+        limit = _read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+        period = _read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+        if limit and period and int(limit) > 0:
+            quota = int(limit) / int(period)
+
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(cpus, 1)
+
+
+def memory_limit():
+    """
+    Get the container's memory limit in bytes.
+
+    Returns:
+        int: The cgroup limit, or the machine's memory; None if unknown
+    """
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        value = _read(path)
+        # cgroup v1 reports "no limit" as a huge number
+        if value and value != 'max' and int(value) < 1 << 60:
+            return int(value)
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def size_workers(cpus, memory, concurrency, worker_memory_mb=DEFAULT_WORKER_MEMORY_MB):
+    """
+    Choose the worker and thread counts.
+
+    Args:
+        cpus (int): Available CPUs
+        memory (int): Memory limit in bytes, or None if unknown
+        concurrency (int): Requests the instance should serve at once
+        worker_memory_mb (int): Expected memory use of one worker
+
+    Returns:
+        tuple: (workers, threads)
+    """
+    workers = max(cpus, 1)
+    if memory:
+        workers = min(workers, max(memory // (worker_memory_mb * 1024 * 1024), 1))
+    threads = max(math.ceil(concurrency / workers), 1)
+    return workers, threads
+
+
+def _env_int(name, default=None):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+_workers, _threads = size_workers(
+    cpu_count(), memory_limit(),
+    _env_int('CONCURRENCY', DEFAULT_CONCURRENCY),
+    _env_int('GUNICORN_WORKER_MEMORY_MB', DEFAULT_WORKER_MEMORY_MB),
+)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = _env_int('GUNICORN_WORKERS', _workers)
+threads = _env_int('GUNICORN_THREADS', _threads)
+worker_class = 'gthread'
+timeout = _env_int('GUNICORN_TIMEOUT', 120)
+preload_app = True
+# Heartbeat files on tmpfs rather than the container's overlay filesystem
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Connections are opened per worker, after the fork
+os.environ.setdefault('WARMUP', 'worker')
+
+
+def on_starting(server):
+    server.log.info(f"Starting {workers} workers x {threads} threads "
+                    f"(CPUs {cpu_count()}, concurrency target "
+                    f"{_env_int('CONCURRENCY', DEFAULT_CONCURRENCY)})")
+
+
+def post_worker_init(worker):
+    # Runs in each worker once it has the app, preloaded or not
+    from app.warmup import after_fork
+    after_fork(worker.wsgi)
@@ -0,0 +1,3 @@
+"""
+Test doubles shared by the test suite and the benchmarks.
+"""
@@ -0,0 +1,413 @@
+"""
+In-process Datastore stand-in for tests and benchmarks.
+
+Serves the subset of the ``google.datastore.v1.Datastore`` gRPC API that
+google-cloud-ndb uses (lookup, commit, queries with equality/range filters,
+ordering, projection and cursors, transactions and id allocation) from a
+dict, so NDB code can run unmodified by pointing DATASTORE_EMULATOR_HOST at
+it.
+
+Usage:
+    fake = FakeDatastore()
+    os.environ['DATASTORE_EMULATOR_HOST'] = fake.start()
+
+Or as a standalone server (e.g. for load tests against a running app):
+    python -m support.datastore_fake --port 8081 --latency 0.01
+"""
+import argparse
+import collections
+import itertools
+import threading
+import time
+import uuid
+from concurrent import futures
+
+import grpc
+from google.cloud.datastore_v1.types import datastore as datastore_pb2
+from google.cloud.datastore_v1.types import entity as entity_pb2
+from google.cloud.datastore_v1.types import query as query_pb2
+
+SERVICE = 'google.datastore.v1.Datastore'
+
+Operator = query_pb2.PropertyFilter.Operator
+ResultType = query_pb2.EntityResult.ResultType
+MoreResults = query_pb2.QueryResultBatch.MoreResultsType
+Direction = query_pb2.PropertyOrder.Direction
+
+# Largest batch returned by a single RunQuery call
+MAX_BATCH_SIZE = 300
+
+
+def _key_path(key_pb):
+    """Hashable, sortable identity of a key protobuf."""
+    path = []
+    for element in key_pb.path:
+        id_type = element.WhichOneof('id_type')
+        if id_type == 'id':
+            path.append((element.kind, 0, element.id))
+        elif id_type == 'name':
+            path.append((element.kind, 1, element.name))
+        else:
+            path.append((element.kind, 2, None))
+    return (key_pb.partition_id.namespace_id, tuple(path))
+
+
+def _python_value(value_pb):
+    """Comparable Python value of a Value protobuf."""
+    value_type = value_pb.WhichOneof('value_type')
+    if value_type is None or value_type == 'null_value':
+        return None
+    if value_type == 'key_value':
+        return _key_path(value_pb.key_value)
+    if value_type == 'timestamp_value':
+        return (value_pb.timestamp_value.seconds, value_pb.timestamp_value.nanos)
+    if value_type == 'array_value':
+        return tuple(_python_value(v) for v in value_pb.array_value.values)
+    if value_type == 'entity_value':
+        return value_pb.entity_value.SerializeToString()
+    if value_type == 'geo_point_value':
+        return (value_pb.geo_point_value.latitude, value_pb.geo_point_value.longitude)
+    return getattr(value_pb, value_type)
+
+
+def _sort_key(value):
+    """Order values of mixed types the way Datastore does (roughly)."""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    return (4, repr(value))
+
+
+def _compare(op, actual, expected):
+    if op == Operator.EQUAL:
+        return actual == expected
+    if op == Operator.NOT_EQUAL:
+        return actual != expected
+    if op == Operator.IN:
+        return actual in expected
+    if op == Operator.NOT_IN:
+        return actual not in expected
+    if actual is None or expected is None:
+        return False
+    actual, expected = _sort_key(actual), _sort_key(expected)
+    if op == Operator.LESS_THAN:
+        return actual < expected
+    if op == Operator.LESS_THAN_OR_EQUAL:
+        return actual <= expected
+    if op == Operator.GREATER_THAN:
+        return actual > expected
+    if op == Operator.GREATER_THAN_OR_EQUAL:
+        return actual >= expected
+    raise NotImplementedError(f"Unsupported filter operator: {op}")
+
+
+class FakeDatastore:
+    """
+    Dict-backed Datastore served over a local gRPC port.
+
+    Args:
+        latency (float): Seconds each RPC waits before being served, to
+            stand in for the network round trip to Datastore
+
+    Attributes:
+        calls (collections.Counter): Number of RPCs received, by method name
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._entities = {}
+        self._versions = {}
+        self._ids = itertools.count(1)
+        self._version = itertools.count(1)
+        self._server = None
+        self.calls = collections.Counter()
+        self.host = None
+
+    # Lifecycle
+
+    def start(self, port=0):
+        """
+        Start serving on a localhost port (a free one by default).
+
+        Returns:
+            str: host:port suitable for DATASTORE_EMULATOR_HOST
+        """
+        handlers = {
+            'Lookup': self._unary(self.lookup, datastore_pb2.LookupRequest,
+                                  datastore_pb2.LookupResponse),
+            'RunQuery': self._unary(self.run_query, datastore_pb2.RunQueryRequest,
+                                    datastore_pb2.RunQueryResponse),
+            'BeginTransaction': self._unary(self.begin_transaction,
+                                            datastore_pb2.BeginTransactionRequest,
+                                            datastore_pb2.BeginTransactionResponse),
+            'Commit': self._unary(self.commit, datastore_pb2.CommitRequest,
+                                  datastore_pb2.CommitResponse),
+            'Rollback': self._unary(self.rollback, datastore_pb2.RollbackRequest,
+                                    datastore_pb2.RollbackResponse),
+            'AllocateIds': self._unary(self.allocate_ids, datastore_pb2.AllocateIdsRequest,
+                                       datastore_pb2.AllocateIdsResponse),
+        }
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=64))
+        self._server.add_generic_rpc_handlers(
+            (grpc.method_handlers_generic_handler(SERVICE, handlers),))
+        port = self._server.add_insecure_port(f'localhost:{port}')
+        self._server.start()
+        self.host = f'localhost:{port}'
+        return self.host
+
+    def stop(self):
+        """Stop the gRPC server."""
+        if self._server is not None:
+            self._server.stop(None)
+            self._server = None
+
+    def reset(self):
+        """Drop all entities and RPC counters."""
+        with self._lock:
+            self._entities.clear()
+            self._versions.clear()
+            self.calls.clear()
+
+    def _unary(self, method, request_type, response_type):
+        request_pb = request_type.pb()
+        name = method.__name__
+
+        def handler(request, context):
+            if self.latency:
+                time.sleep(self.latency)
+            with self._lock:
+                self.calls[name] += 1
+                return method(request, context)
+
+        return grpc.unary_unary_rpc_method_handler(
+            handler,
+            request_deserializer=request_pb.FromString,
+            response_serializer=lambda message: message.SerializeToString(),
+        )
+
+    # Inspection helpers
+
+    def count(self, kind):
+        """Number of stored entities of a kind."""
+        with self._lock:
+            return sum(1 for entity in self._entities.values()
+                       if entity.key.path[-1].kind == kind)
+
+    # RPC implementations (called with the lock held)
+
+    def lookup(self, request, context):
+        response = datastore_pb2.LookupResponse.pb()()
+        for key_pb in request.keys:
+            path = _key_path(key_pb)
+            entity = self._entities.get(path)
+            if entity is None:
+                missing = response.missing.add()
+                missing.entity.key.CopyFrom(key_pb)
+                missing.version = 0
+            else:
+                found = response.found.add()
+                found.entity.CopyFrom(entity)
+                found.version = self._versions[path]
+        return response
+
+    def begin_transaction(self, request, context):
+        response = datastore_pb2.BeginTransactionResponse.pb()()
+        response.transaction = uuid.uuid4().bytes
+        return response
+
+    def rollback(self, request, context):
+        return datastore_pb2.RollbackResponse.pb()()
+
+    def allocate_ids(self, request, context):
+        response = datastore_pb2.AllocateIdsResponse.pb()()
+        for key_pb in request.keys:
+            key = response.keys.add()
+            key.CopyFrom(key_pb)
+            key.path[-1].id = next(self._ids)
+        return response
+
+    def commit(self, request, context):
+        response = datastore_pb2.CommitResponse.pb()()
+        version = next(self._version)
+        for mutation in request.mutations:
+            operation = mutation.WhichOneof('operation')
+            result = response.mutation_results.add()
+            result.version = version
+
+            if operation == 'delete':
+                path = _key_path(mutation.delete)
+                self._entities.pop(path, None)
+                self._versions.pop(path, None)
+                continue
+
+            entity = entity_pb2.Entity.pb()()
+            entity.CopyFrom(getattr(mutation, operation))
+            last = entity.key.path[-1]
+            if last.WhichOneof('id_type') is None:
+                last.id = next(self._ids)
+                result.key.CopyFrom(entity.key)
+
+            path = _key_path(entity.key)
+            if operation == 'insert' and path in self._entities:
+                context.abort(grpc.StatusCode.ALREADY_EXISTS, 'entity already exists')
+            if operation == 'update' and path not in self._entities:
+                context.abort(grpc.StatusCode.NOT_FOUND, 'no entity to update')
+
+            self._entities[path] = entity
+            self._versions[path] = version
+        return response
+
+    def run_query(self, request, context):
+        query = request.query
+        namespace = request.partition_id.namespace_id
+        kinds = {kind.name for kind in query.kind}
+
+        matches = [
+            (path, entity) for path, entity in self._entities.items()
+            if path[0] == namespace
+            and (not kinds or entity.key.path[-1].kind in kinds)
+            and self._matches(entity, query.filter)
+        ]
+        matches.sort(key=lambda item: self._order_key(item, query.order))
+
+        projection = [p.property.name for p in query.projection]
+        if projection == ['__key__']:
+            result_type = ResultType.KEY_ONLY
+        elif projection:
+            result_type = ResultType.PROJECTION
+            matches = [(path, entity) for path, entity in matches
+                       if all(name in entity.properties for name in projection)]
+        else:
+            result_type = ResultType.FULL
+
+        start = int(query.start_cursor.decode()) if query.start_cursor else 0
+        end = len(matches)
+        if query.end_cursor:
+            end = min(end, int(query.end_cursor.decode()))
+        skipped = min(query.offset, max(end - start, 0))
+        position = start + skipped
+
+        batch_size = MAX_BATCH_SIZE
+        limited = query.HasField('limit')
+        if limited:
+            batch_size = min(batch_size, query.limit.value)
+        selected = matches[position:min(end, position + batch_size)]
+
+        response = datastore_pb2.RunQueryResponse.pb()()
+        batch = response.batch
+        batch.entity_result_type = result_type
+        batch.skipped_results = skipped
+        for offset, (path, entity) in enumerate(selected, start=position + 1):
+            result = batch.entity_results.add()
+            result.cursor = str(offset).encode()
+            result.version = self._versions[path]
+            if result_type == ResultType.KEY_ONLY:
+                result.entity.key.CopyFrom(entity.key)
+            elif result_type == ResultType.PROJECTION:
+                result.entity.key.CopyFrom(entity.key)
+                for name in projection:
+                    result.entity.properties[name].CopyFrom(entity.properties[name])
+            else:
+                result.entity.CopyFrom(entity)
+
+        next_position = position + len(selected)
+        batch.end_cursor = str(next_position).encode()
+        if next_position >= end:
+            batch.more_results = MoreResults.NO_MORE_RESULTS
+        elif limited and len(selected) == query.limit.value:
+            batch.more_results = MoreResults.MORE_RESULTS_AFTER_LIMIT
+        else:
+            batch.more_results = MoreResults.NOT_FINISHED
+        return response
+
+    def _matches(self, entity, filter_pb):
+        filter_type = filter_pb.WhichOneof('filter_type')
+        if filter_type is None:
+            return True
+        if filter_type == 'composite_filter':
+            composite = filter_pb.composite_filter
+            results = (self._matches(entity, f) for f in composite.filters)
+            if composite.op == query_pb2.CompositeFilter.Operator.OR:
+                return any(results)
+            return all(results)
+
+        property_filter = filter_pb.property_filter
+        name = property_filter.property.name
+        op = property_filter.op
+        expected = _python_value(property_filter.value)
+
+        if name == '__key__':
+            actual = _key_path(entity.key)
+            if op == Operator.HAS_ANCESTOR:
+                return (actual[0] == expected[0]
+                        and actual[1][:len(expected[1])] == expected[1])
+            return _compare(op, actual, expected)
+
+        if name not in entity.properties:
+            return False
+        value_pb = entity.properties[name]
+        if value_pb.exclude_from_indexes:
+            return False
+        actual = _python_value(value_pb)
+        if isinstance(actual, tuple) and value_pb.WhichOneof('value_type') == 'array_value':
+            return any(_compare(op, item, expected) for item in actual)
+        return _compare(op, actual, expected)
+
+    @staticmethod
+    def _order_key(item, orders):
+        path, entity = item
+        key = []
+        for order in orders:
+            name = order.property.name
+            if name == '__key__':
+                value = path
+            elif name in entity.properties:
+                value = _sort_key(_python_value(entity.properties[name]))
+            else:
+                value = _sort_key(None)
+            if order.direction == Direction.DESCENDING:
+                key.append(_Reversed(value))
+            else:
+                key.append(value)
+        key.append(path)
+        return key
+
+
+class _Reversed:
+    """Sort wrapper that inverts ordering for descending sorts."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the in-process Datastore stand-in.')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Seconds of simulated latency per RPC')
+    args = parser.parse_args()
+
+    fake = FakeDatastore(latency=args.latency)
+    print(f"Datastore stand-in listening on {fake.start(args.port)}", flush=True)
+    try:
+        fake._server.wait_for_termination()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,9 @@ Pytest configuration and fixtures for cloudrun-init.
 import pytest
 import os
 from unittest.mock import patch, MagicMock
+
+# app.auth imports the Admin SDK on first use; load it so it can be patched
+import firebase_admin.auth  # noqa: F401
 from app.main import create_app
 
 
@@ -15,7 +18,8 @@ def app():
         'TESTING': True,
         'SECRET_KEY': 'test-secret-key',
         'FIREBASE_PROJECT_ID': 'test-project',
-        'GOOGLE_CLOUD_PROJECT': 'test-project'
+        'GOOGLE_CLOUD_PROJECT': 'test-project',
+        'METRICS_TOKEN': 'test-metrics-token'
     })
 
     return app
@@ -61,7 +65,7 @@ def authenticated_headers(mock_firebase_token):
 @pytest.fixture
 def mock_firebase_auth():
     """Mock Firebase authentication."""
-    with patch('app.auth.firebase.auth') as mock_auth:
+    with patch('firebase_admin.auth') as mock_auth:
         # Mock the verify_id_token method
         mock_auth.verify_id_token.return_value = {
             'uid': 'test-user-123',
@@ -77,9 +81,42 @@ def mock_firebase_auth():
 @pytest.fixture
 def mock_firebase_init():
     """Mock Firebase initialization."""
-    with patch('app.auth.firebase.firebase_admin') as mock_firebase:
+    with patch('firebase_admin.get_app') as get_app, \
+            patch('firebase_admin.initialize_app') as initialize_app:
         # Mock the get_app method to raise ValueError (not initialized)
-        mock_firebase.get_app.side_effect = ValueError("No app initialized")
+        get_app.side_effect = ValueError("No app initialized")
         # Mock the initialize_app method
-        mock_firebase.initialize_app.return_value = MagicMock()
-        yield mock_firebase 
\ No newline at end of file
+        initialize_app.return_value = MagicMock()
+        yield MagicMock(get_app=get_app, initialize_app=initialize_app)
+
+@pytest.fixture(scope='session')
+def datastore_server():
+    """In-process Datastore stand-in shared by the test session."""
+    from support.datastore_fake import FakeDatastore
+    fake = FakeDatastore()
+    fake.start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def datastore(datastore_server, app, monkeypatch):
+    """Empty Datastore stand-in with NDB pointed at it."""
+    from app.ndb_client import ndb_registry
+    monkeypatch.setenv('DATASTORE_EMULATOR_HOST', datastore_server.host)
+    monkeypatch.setenv('DATASTORE_PROJECT_ID', 'test-project')
+    datastore_server.reset()
+    ndb_registry.reset()
+    with app.app_context():
+        app.config['NDB_AVAILABLE'] = ndb_registry.initialize()
+    yield datastore_server
+    ndb_registry.reset()
+
+
+@pytest.fixture
+def ndb_context(datastore, app):
+    """Active NDB context backed by the Datastore stand-in."""
+    from app.ndb_client import ndb_registry
+    with app.app_context():
+        with ndb_registry.context() as context:
+            yield context
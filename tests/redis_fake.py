@@ -0,0 +1,213 @@
+"""
+In-process Redis stand-in for tests.
+
+Speaks enough of the Redis protocol (RESP) for redis-py and NDB's
+RedisCache: strings with expiry, MGET/MSET/SETNX, DEL, FLUSHDB and
+optimistic transactions (WATCH/MULTI/EXEC). Runs on a local TCP port so
+the real client, including its connection handling, is exercised.
+
+Usage:
+    fake = FakeRedis()
+    url = fake.start()           # redis://127.0.0.1:<port>/0
+    ...
+    fake.stop()
+"""
+import socket
+import socketserver
+import threading
+import time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connections.add(self.connection)
+        self.watched = {}
+        self.queued = None
+        while True:
+            try:
+                command = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            self.wfile.write(self.server.fake.execute(self, command))
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # Inline command
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _bulk(value):
+    if value is None:
+        return b'$-1\r\n'
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def _int(value):
+    return b':%d\r\n' % value
+
+
+def _array(items):
+    return b'*%d\r\n' % len(items) + b''.join(items)
+
+
+OK = b'+OK\r\n'
+
+
+class FakeRedis:
+    """Single-database Redis server backed by a dict."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data = {}
+        self._expires = {}
+        self._versions = {}
+        self._server = None
+        self.commands = 0
+
+    def start(self, port=0):
+        """
+        Start serving on localhost.
+
+        Returns:
+            str: Redis URL of the server
+        """
+        self._server = _Server(('127.0.0.1', port), _Handler)
+        self._server.fake = self
+        self._server.connections = set()
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    @property
+    def url(self):
+        return f'redis://127.0.0.1:{self._server.server_address[1]}/0'
+
+    def stop(self):
+        """Stop serving and drop open connections; clients see errors."""
+        self._server.shutdown()
+        self._server.server_close()
+        for connection in list(self._server.connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._server = None
+
+    def reset(self):
+        """Drop all keys."""
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+            self._versions.clear()
+
+    def keys(self):
+        with self._lock:
+            return [key for key in list(self._data) if self._get(key) is not None]
+
+    def _get(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= self._clock():
+            self._delete(key)
+        return self._data.get(key)
+
+    def _set(self, key, value, ttl=None):
+        self._data[key] = value
+        self._versions[key] = self._versions.get(key, 0) + 1
+        if ttl:
+            self._expires[key] = self._clock() + ttl
+        else:
+            self._expires.pop(key, None)
+
+    def _delete(self, key):
+        if key in self._data:
+            del self._data[key]
+            self._expires.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+            return 1
+        return 0
+
+    def execute(self, connection, command):
+        """Run one command for a connection and encode the reply."""
+        name = command[0].upper().decode()
+        args = command[1:]
+        with self._lock:
+            self.commands += 1
+            if connection.queued is not None and name not in ('EXEC', 'DISCARD', 'MULTI'):
+                connection.queued.append((name, args))
+                return b'+QUEUED\r\n'
+            if name == 'MULTI':
+                connection.queued = []
+                return OK
+            if name == 'DISCARD':
+                connection.queued = None
+                connection.watched = {}
+                return OK
+            if name == 'EXEC':
+                queued, connection.queued = connection.queued or [], None
+                watched, connection.watched = connection.watched, {}
+                if any(self._versions.get(key, 0) != version for key, version in watched.items()):
+                    return b'*-1\r\n'
+                return _array([self._run(connection, n, a) for n, a in queued])
+            return self._run(connection, name, args)
+
+    def _run(self, connection, name, args):
+        if name == 'PING':
+            return b'+PONG\r\n'
+        if name == 'GET':
+            return _bulk(self._get(args[0]))
+        if name == 'MGET':
+            return _array([_bulk(self._get(key)) for key in args])
+        if name == 'SET':
+            self._set(args[0], args[1])
+            return OK
+        if name == 'SETEX':
+            self._set(args[0], args[2], ttl=int(args[1]))
+            return OK
+        if name == 'MSET':
+            for key, value in zip(args[::2], args[1::2]):
+                self._set(key, value)
+            return OK
+        if name == 'SETNX':
+            if self._get(args[0]) is not None:
+                return _int(0)
+            self._set(args[0], args[1])
+            return _int(1)
+        if name == 'EXPIRE':
+            if self._get(args[0]) is None:
+                return _int(0)
+            self._expires[args[0]] = self._clock() + int(args[1])
+            return _int(1)
+        if name == 'DEL':
+            return _int(sum(self._delete(key) for key in args))
+        if name == 'FLUSHDB':
+            self._data.clear()
+            self._expires.clear()
+            return OK
+        if name == 'WATCH':
+            for key in args:
+                self._get(key)
+                connection.watched[key] = self._versions.get(key, 0)
+            return OK
+        if name == 'UNWATCH':
+            connection.watched = {}
+            return OK
+        return b'-ERR unknown command %s\r\n' % name.encode()
@@ -0,0 +1,90 @@
+"""
+Tests for admin routes.
+"""
+import pytest
+from unittest.mock import patch
+from app.models.user import User
+
+
+@pytest.fixture
+def admin_client(app, client, mock_firebase_user):
+    """Client authenticated as an admin."""
+    app.config['ADMIN_UIDS'] = [mock_firebase_user['uid']]
+    with patch('app.auth.firebase.verify_firebase_token', return_value=mock_firebase_user):
+        yield client
+
+
+@pytest.fixture
+def users(app, datastore):
+    """Ten stored users."""
+    from app.ndb_client import ndb_registry
+    with app.app_context(), ndb_registry.context():
+        for i in range(10):
+            User(id=f'user-{i}', uid=f'user-{i}', email=f'user-{i}@example.com',
+                 display_name=f'User {i}').put()
+
+
+HEADERS = {'Authorization': 'Bearer mock-token'}
+
+
+class TestAdminRoutes:
+    """Test cases for admin routes."""
+
+    def test_requires_admin(self, client, mock_firebase_user):
+        """Test that non-admins get 403."""
+        with patch('app.auth.firebase.verify_firebase_token', return_value=mock_firebase_user):
+            response = client.get('/admin/users', headers=HEADERS)
+
+        assert response.status_code == 403
+
+    def test_requires_authentication(self, client):
+        """Test that anonymous requests get 401."""
+        assert client.get('/admin/users').status_code == 401
+
+    def test_list_users_paginates(self, admin_client, users):
+        """Test cursor-based paging through all users."""
+        seen = []
+        cursor = None
+        while True:
+            url = '/admin/users?limit=4' + (f'&cursor={cursor}' if cursor else '')
+            data = admin_client.get(url, headers=HEADERS).get_json()
+            seen.extend(user['uid'] for user in data['users'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        assert seen == [f'user-{i}' for i in range(10)]
+
+    def test_list_users_fields(self, admin_client, users):
+        """Test selecting projected fields."""
+        response = admin_client.get('/admin/users?limit=1&fields=display_name,uid,email', headers=HEADERS)
+
+        user = response.get_json()['users'][0]
+        assert set(user) == {'uid', 'email', 'display_name'}
+        response = admin_client.get('/admin/users?limit=1&fields=created_at', headers=HEADERS)
+        assert set(response.get_json()['users'][0]) == {'created_at'}
+
+    @pytest.mark.parametrize('query', ['limit=0', 'limit=abc', 'fields=password', 'cursor=abc!',
+                                       'fields=uid,created_at,updated_at', 'fields=email,picture'])
+    def test_list_users_bad_request(self, admin_client, users, query):
+        """Test validation of listing parameters."""
+        response = admin_client.get(f'/admin/users?{query}', headers=HEADERS)
+
+        assert response.status_code == 400
+
+    def test_bulk_lookup(self, admin_client, users):
+        """Test batch lookup preserving order."""
+        response = admin_client.post('/admin/users/lookup', headers=HEADERS,
+                                     json={'uids': ['user-3', 'nobody', 'user-1']})
+
+        assert response.status_code == 200
+        data = response.get_json()['users']
+        assert data[0]['display_name'] == 'User 3'
+        assert data[1] is None
+        assert data[2]['uid'] == 'user-1'
+
+    def test_bulk_lookup_validation(self, admin_client):
+        """Test that malformed lookups are rejected."""
+        response = admin_client.post('/admin/users/lookup', headers=HEADERS, json={'uids': 'user-1'})
+
+        assert response.status_code == 400
@@ -0,0 +1,75 @@
+"""
+Tests for the ASGI serving mode.
+"""
+import asyncio
+import json
+import threading
+from flask import jsonify
+from app.asgi import create_asgi_app
+
+
+def call_asgi(asgi_app, method, path, body=b'', headers=None, query_string=b''):
+    """Run one HTTP request through an ASGI app and collect the response."""
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'path': path,
+        'query_string': query_string,
+        'headers': [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 12345),
+        'scheme': 'http',
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    start = sent[0]
+    body = b''.join(message.get('body', b'') for message in sent[1:])
+    return start['status'], dict(start['headers']), body
+
+
+class TestASGI:
+    """Test cases for serving the Flask app through ASGI."""
+
+    def test_serves_blueprints(self, app):
+        """Test that the Flask routes are served through ASGI."""
+        status, headers, body = call_asgi(create_asgi_app(app), 'GET', '/health')
+
+        assert status == 200
+        assert headers[b'content-type'] == b'application/json'
+        assert json.loads(body)['status'] == 'healthy'
+
+    def test_request_body(self, app):
+        """Test that the request body reaches the view."""
+        status, _, body = call_asgi(create_asgi_app(app), 'POST', '/auth/login', body=b'{}',
+                                    headers={'Content-Type': 'application/json', 'Content-Length': '2'})
+
+        assert status == 400
+        assert 'error' in json.loads(body)
+
+    def test_requests_run_concurrently(self, app):
+        """Test that requests run on their own threads rather than one shared thread."""
+        asgi_app = create_asgi_app(app, max_threads=4)
+        barrier = threading.Barrier(2, timeout=5)
+
+        @app.route('/together')
+        def together():
+            barrier.wait()
+            return jsonify({'thread': threading.current_thread().ident})
+
+        async def both():
+            return await asyncio.gather(*(asyncio.to_thread(call_asgi, asgi_app, 'GET', '/together')
+                                          for _ in range(2)))
+
+        responses = asyncio.run(both())
+
+        assert [status for status, _, _ in responses] == [200, 200]
+        assert len({json.loads(body)['thread'] for _, _, body in responses}) == 2
@@ -145,27 +145,29 @@ class TestAuthRoutes:
 class TestFirebaseAuth:
     """Test Firebase authentication utilities."""
 
-    @patch('app.auth.firebase.firebase_admin')
-    def test_init_firebase_with_service_account(self, mock_firebase_admin):
+    @patch('firebase_admin.initialize_app')
+    @patch('firebase_admin.get_app')
+    def test_init_firebase_with_service_account(self, mock_get_app, mock_initialize_app):
         """Test Firebase initialization with service account key."""
         with patch.dict('os.environ', {'FIREBASE_SERVICE_ACCOUNT_KEY': '/path/to/key.json'}):
             from app.auth.firebase import init_firebase
-            mock_firebase_admin.get_app.side_effect = ValueError("No app initialized")
+            mock_get_app.side_effect = ValueError("No app initialized")
             
             init_firebase()
             
-            mock_firebase_admin.initialize_app.assert_called_once()
+            mock_initialize_app.assert_called_once()
 
-    @patch('app.auth.firebase.firebase_admin')
-    def test_init_firebase_with_default_credentials(self, mock_firebase_admin):
+    @patch('firebase_admin.initialize_app')
+    @patch('firebase_admin.get_app')
+    def test_init_firebase_with_default_credentials(self, mock_get_app, mock_initialize_app):
         """Test Firebase initialization with default credentials."""
         with patch.dict('os.environ', {'GOOGLE_APPLICATION_CREDENTIALS': '/path/to/credentials.json'}):
             from app.auth.firebase import init_firebase
-            mock_firebase_admin.get_app.side_effect = ValueError("No app initialized")
+            mock_get_app.side_effect = ValueError("No app initialized")
             
             init_firebase()
             
-            mock_firebase_admin.initialize_app.assert_called_once()
+            mock_initialize_app.assert_called_once()
 
     def test_get_token_from_request_authorization_header(self, client):
         """Test token extraction from Authorization header."""
@@ -189,4 +191,65 @@ class TestFirebaseAuth:
         
         with client.test_request_context('/?token=test-token'):
             token = get_token_from_request()
-            assert token == 'test-token' 
\ No newline at end of file
+            assert token == 'test-token' 
+
+class TestFirebaseState:
+    """Test one-time Firebase initialization."""
+
+    def test_ready_and_degraded(self, app):
+        """Test that init outcome maps to ready/degraded."""
+        from app.auth.firebase import FirebaseState
+
+        with app.app_context():
+            with patch('app.auth.firebase.init_firebase', return_value=True):
+                assert FirebaseState().initialize() == FirebaseState.READY
+            with patch('app.auth.firebase.init_firebase', return_value=False):
+                assert FirebaseState().initialize() == FirebaseState.DEGRADED
+
+    def test_failed_init_retries_with_backoff(self, app):
+        """Test that a failed init is retried only once the backoff has passed."""
+        from app.auth.firebase import FirebaseState
+        clock = MagicMock(return_value=100.0)
+        state = FirebaseState(retry_base=5, clock=clock)
+
+        with app.app_context(), patch('app.auth.firebase.init_firebase',
+                                      side_effect=ValueError('no credentials')) as mock_init:
+            state.initialize()
+            assert state.available() is False
+            assert state.available() is False
+            assert mock_init.call_count == 1
+
+            clock.return_value = 105.0
+            assert state.available() is False
+            assert mock_init.call_count == 2
+            # Second failure doubles the backoff
+            assert state.next_retry_at == 115.0
+
+            mock_init.side_effect = None
+            mock_init.return_value = True
+            clock.return_value = 115.0
+            assert state.available() is True
+            assert state.status == FirebaseState.READY
+
+    def test_decorators_do_not_initialize_per_request(self, client, mock_firebase_user):
+        """Test that requests never call init_firebase."""
+        with patch('app.auth.firebase.init_firebase') as mock_init, \
+             patch('app.auth.firebase.verify_firebase_token', return_value=mock_firebase_user):
+            client.get('/auth/me?token=mock-token')
+            client.get('/auth/status?token=mock-token')
+
+        mock_init.assert_not_called()
+
+    def test_login_required_when_firebase_failed(self, app, client):
+        """Test 503 from login_required while Firebase is down."""
+        from app.auth.firebase import FirebaseState
+        state = app.extensions['firebase']
+        state.status = FirebaseState.FAILED
+        state.next_retry_at = float('inf')
+
+        response = client.get('/auth/me?token=mock-token')
+        assert response.status_code == 503
+
+        response = client.get('/auth/status?token=mock-token')
+        assert response.status_code == 200
+        assert response.get_json()['authenticated'] is False
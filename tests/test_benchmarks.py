@@ -0,0 +1,64 @@
+"""
+Tests for the benchmark harnesses.
+"""
+import pytest
+
+from benchmarks.hot_paths import compare, measure
+
+
+class TestHotPathBenchmarks:
+    """Test cases for benchmark measurement and baseline comparison."""
+
+    def test_measure(self):
+        """Test that a measurement reports throughput and percentiles."""
+        result = measure(lambda: None, duration=0.01, warmup=0)
+
+        assert result['iterations'] > 0
+        assert result['ops_per_sec'] > 0
+        assert result['p50_us'] <= result['p99_us']
+
+    def test_compare_flags_regressions_past_threshold(self):
+        """Test that only drops beyond the threshold are reported."""
+        baseline = {
+            'fast': {'ops_per_sec': 1000.0},
+            'slow': {'ops_per_sec': 1000.0},
+        }
+        results = {
+            'fast': {'ops_per_sec': 800.0},
+            'slow': {'ops_per_sec': 700.0},
+            'new': {'ops_per_sec': 1.0},
+        }
+
+        assert compare(results, baseline, threshold=0.25) == [('slow', 1000.0, 700.0)]
+
+
+class TestLoadGenerator:
+    """Test cases for the load generator's request plans and reports."""
+
+    def test_parse_mix(self):
+        """Test that mixes parse to weights and reject unknown routes."""
+        from benchmarks.load import parse_mix
+
+        assert parse_mix('status=3,patch') == {'status': 3.0, 'patch': 1.0}
+        with pytest.raises(ValueError):
+            parse_mix('status=1,admin=1')
+
+    def test_storm_plan_groups_page_loads(self):
+        """Test that each new user's page load requests are adjacent."""
+        from benchmarks.load import storm_plan
+
+        assert storm_plan(['a', 'b']) == [('status', 'a'), ('me', 'a'), ('profile', 'a'),
+                                          ('status', 'b'), ('me', 'b'), ('profile', 'b')]
+
+    def test_summarize(self):
+        """Test that samples are summarized per route and overall."""
+        from benchmarks.load import summarize
+        samples = [('me', 0.01, 200, 0), ('me', 0.03, 401, 0), ('status', 0.02, None, 0)]
+
+        summary = summarize(samples, elapsed=2.0)
+
+        assert summary['all']['requests'] == 3
+        assert summary['all']['req_per_sec'] == 1.5
+        assert summary['all']['errors'] == 2
+        assert summary['me']['p99_ms'] == 30.0
+        assert 'patch' not in summary
@@ -0,0 +1,146 @@
+"""
+Tests for precompressed static assets and compressed JSON responses.
+"""
+import gzip
+import os
+
+import pytest
+from flask import Flask, jsonify
+
+from app.compression import StaticAssets, compress_response, precompress_directory
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+class TestStaticAssets:
+    """Test cases for static files served from memory."""
+
+    def test_index_gzipped(self, client):
+        """Test that the index page is served gzipped with a content-hash ETag."""
+        plain = client.get('/')
+        response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert response.headers['Cache-Control'] == 'no-cache'
+        assert gzip.decompress(response.data) == plain.data
+        assert response.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+
+    def test_not_modified(self, client):
+        """Test that a client with the current copy gets a 304."""
+        etag = client.get('/', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+        response = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+        # A copy in another encoding is a different representation
+        assert client.get('/', headers={'If-None-Match': etag}).status_code == 200
+
+    def test_refused_encoding(self, client):
+        """Test that codings refused with q=0 are not used."""
+        response = client.get('/', headers={'Accept-Encoding': 'gzip;q=0, identity'})
+
+        assert 'Content-Encoding' not in response.headers
+
+    def test_cache_control(self, tmp_path):
+        """Test that versioned URLs are cached indefinitely and others for max_age."""
+        assets = StaticAssets(max_age=600)
+        assets.add('app.js', write(tmp_path / 'app.js', 'console.log(1);\n' * 50))
+        app = Flask(__name__)
+
+        with app.test_request_context('/static/app.js'):
+            assert assets.response('app.js').headers['Cache-Control'] == 'public, max-age=600'
+        with app.test_request_context(assets.url('app.js')):
+            assert assets.response('app.js').headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+            assert assets.response('missing.js') is None
+
+    def test_precompressed_files_used(self, tmp_path):
+        """Test that build-time .gz files are written and preferred while up to date."""
+        path = write(tmp_path / 'style.css', 'body { margin: 0; }\n' * 50)
+        assert precompress_directory(str(tmp_path)) >= 1
+        assert gzip.decompress((tmp_path / 'style.css.gz').read_bytes()) == (tmp_path / 'style.css').read_bytes()
+
+        (tmp_path / 'style.css.gz').write_bytes(b'marker')
+        assets = StaticAssets()
+        assets.add_directory(str(tmp_path))
+        assert assets.get('style.css').variants['gzip'] == b'marker'
+        assert assets.get('style.css.gz') is None
+
+        os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+        assert assets.add('style.css', path).variants['gzip'] != b'marker'
+
+    def test_small_and_binary_files_not_compressed(self, tmp_path):
+        """Test that tiny and binary files are served as they are."""
+        assets = StaticAssets()
+
+        assert list(assets.add('a.txt', write(tmp_path / 'a.txt', 'hi')).variants) == [None]
+        (tmp_path / 'logo.png').write_bytes(b'\x89PNG' * 200)
+        assert list(assets.add('logo.png', str(tmp_path / 'logo.png')).variants) == [None]
+
+    def test_files_outside_static_folder(self, client, tmp_path):
+        """Test that the test pages have their own routes and nothing escapes /static/."""
+        assert client.get('/test/firebase').status_code == 200
+        assert client.get('/static/..%2Ftest_firebase_config.html').status_code == 404
+        assert client.get('/static/../test_firebase_config.html').status_code == 404
+        with pytest.raises(ValueError):
+            StaticAssets().add('../page.html', write(tmp_path / 'page.html', '<p>hi</p>'))
+
+
+class TestJSONCompression:
+    """Test cases for compressing JSON responses."""
+
+    @pytest.fixture
+    def json_app(self):
+        app = Flask(__name__)
+        app.config.update(COMPRESSION_MIN_SIZE=100, COMPRESSION_GZIP_LEVEL=1)
+        app.after_request(compress_response)
+
+        @app.route('/large')
+        def large():
+            return jsonify({'users': [{'uid': f'user-{i}'} for i in range(50)]})
+
+        @app.route('/small')
+        def small():
+            return jsonify({'ok': True})
+
+        return app
+
+    def test_large_response_compressed(self, json_app):
+        """Test that JSON above the threshold is gzipped for clients accepting it."""
+        client = json_app.test_client()
+        plain = client.get('/large')
+        response = client.get('/large', headers={'Accept-Encoding': 'gzip, deflate'})
+
+        assert 'Content-Encoding' not in plain.headers
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['Content-Length'] == str(len(response.data))
+        assert gzip.decompress(response.data) == plain.data
+        assert plain.headers['Vary'] == response.headers['Vary'] == 'Accept-Encoding'
+
+    def test_small_response_not_compressed(self, json_app):
+        """Test that JSON below the threshold is sent as it is."""
+        response = json_app.test_client().get('/small', headers={'Accept-Encoding': 'gzip'})
+
+        assert 'Content-Encoding' not in response.headers
+
+    def test_brotli_preferred(self, json_app):
+        """Test that brotli is used when installed and accepted."""
+        brotli = pytest.importorskip('brotli')
+        response = json_app.test_client().get('/large', headers={'Accept-Encoding': 'gzip, br'})
+
+        assert response.headers['Content-Encoding'] == 'br'
+        assert brotli.decompress(response.data).startswith(b'{')
+
+    def test_disabled(self):
+        """Test that COMPRESSION_ENABLED=false leaves responses alone."""
+        from app.main import create_app
+        app = create_app({'TESTING': True, 'USER_STORE': 'memory', 'COMPRESSION_ENABLED': False,
+                          'STATIC_PRECOMPRESS': False})
+
+        assert compress_response not in app.after_request_funcs.get(None, [])
+        assert 'static_assets' not in app.extensions
+        assert 'Content-Encoding' not in app.test_client().get(
+            '/', headers={'Accept-Encoding': 'gzip'}).headers
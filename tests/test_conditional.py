@@ -0,0 +1,162 @@
+"""
+Tests for ETag / conditional requests on profile routes.
+"""
+import pytest
+from unittest.mock import patch
+
+HEADERS = {'Authorization': 'Bearer mock-token'}
+
+
+@pytest.fixture
+def memory_app():
+    """App on the memory user store."""
+    from app.main import create_app
+    return create_app({'TESTING': True, 'USER_STORE': 'memory', 'USER_CACHE_TTL': 0})
+
+
+@pytest.fixture
+def signed_in(mock_firebase_user):
+    with patch('app.auth.firebase.verify_firebase_token', return_value=mock_firebase_user) as mock_verify:
+        yield mock_verify
+
+
+class TestConditionalRequests:
+    """Test cases for ETag handling."""
+
+    def test_profile_not_modified(self, memory_app, signed_in):
+        """Test that a matching If-None-Match gets an empty 304."""
+        client = memory_app.test_client()
+        first = client.get('/profile/', headers=HEADERS)
+        etag = first.headers['ETag']
+
+        second = client.get('/profile/', headers=dict(HEADERS, **{'If-None-Match': etag}))
+
+        assert first.status_code == 200
+        assert second.status_code == 304
+        assert second.data == b''
+        assert second.headers['ETag'] == etag
+
+    def test_not_modified_without_loading_user(self, memory_app, signed_in):
+        """Test that the 304 path only reads the version."""
+        client = memory_app.test_client()
+        etag = client.get('/profile/', headers=HEADERS).headers['ETag']
+        repository = memory_app.extensions['user_repository']
+
+        with patch.object(repository, 'get_by_uid') as mock_get, \
+             patch.object(repository, 'get_version', wraps=repository.get_version) as mock_version:
+            response = client.get('/profile/', headers=dict(HEADERS, **{'If-None-Match': etag}))
+
+        assert response.status_code == 304
+        mock_version.assert_called_once()
+        mock_get.assert_not_called()
+
+    def test_etag_changes_with_representation(self, memory_app, signed_in):
+        """Test that field selection and format get their own ETags."""
+        client = memory_app.test_client()
+        full = client.get('/profile/', headers=HEADERS).headers['ETag']
+        partial = client.get('/profile/?fields=uid', headers=HEADERS).headers['ETag']
+        packed = client.get('/profile/', headers=dict(HEADERS, Accept='application/msgpack')).headers['ETag']
+
+        assert len({full, partial, packed}) == 3
+
+    def test_changed_claims_invalidate_etag(self, memory_app, signed_in, mock_firebase_user):
+        """Test that a token with new claims is not answered with 304."""
+        client = memory_app.test_client()
+        etag = client.get('/profile/', headers=HEADERS).headers['ETag']
+        signed_in.return_value = dict(mock_firebase_user, name='New Name')
+
+        response = client.get('/profile/', headers=dict(HEADERS, **{'If-None-Match': etag}))
+
+        assert response.status_code == 200
+        assert response.get_json()['user']['display_name'] == 'New Name'
+
+    def test_stats_not_modified(self, memory_app, signed_in):
+        client = memory_app.test_client()
+        etag = client.get('/profile/stats', headers=HEADERS).headers['ETag']
+
+        response = client.get('/profile/stats', headers=dict(HEADERS, **{'If-None-Match': etag}))
+
+        assert response.status_code == 304
+
+    def test_if_match(self, memory_app, signed_in, mock_firebase_user):
+        """Test optimistic concurrency on PUT."""
+        # Without a name claim, logins do not overwrite display_name
+        signed_in.return_value = {k: v for k, v in mock_firebase_user.items() if k != 'name'}
+        client = memory_app.test_client()
+        etag = client.get('/profile/', headers=HEADERS).headers['ETag']
+
+        updated = client.put('/profile/', headers=dict(HEADERS, **{'If-Match': etag}),
+                             json={'display_name': 'First'})
+        stale = client.put('/profile/', headers=dict(HEADERS, **{'If-Match': etag}),
+                           json={'display_name': 'Second'})
+
+        assert updated.status_code == 200
+        assert updated.headers['ETag'] != etag
+        assert stale.status_code == 412
+        assert stale.headers['ETag'] == updated.headers['ETag']
+        assert client.get('/profile/', headers=HEADERS).get_json()['user']['display_name'] == 'First'
+
+    def test_compressed_etag(self, signed_in):
+        """Test that a gzipped profile has its own ETag, matched by If-None-Match and If-Match."""
+        from app.main import create_app
+        app = create_app({'TESTING': True, 'USER_STORE': 'memory', 'USER_CACHE_TTL': 0,
+                          'COMPRESSION_MIN_SIZE': 1})
+        client = app.test_client()
+        gzipped = dict(HEADERS, **{'Accept-Encoding': 'gzip'})
+        plain = client.get('/profile/', headers=HEADERS).headers['ETag']
+        first = client.get('/profile/', headers=gzipped)
+        etag = first.headers['ETag']
+
+        second = client.get('/profile/', headers=dict(gzipped, **{'If-None-Match': etag}))
+        updated = client.put('/profile/', headers=dict(gzipped, **{'If-Match': etag}),
+                             json={'display_name': 'Zipped'})
+
+        assert first.headers['Content-Encoding'] == 'gzip'
+        assert etag == plain[:-1] + '-gzip"'
+        assert second.status_code == 304
+        assert second.headers['ETag'] == etag
+        assert updated.status_code == 200
+
+    def test_version_lookup_on_datastore(self, client, datastore, signed_in):
+        """Test the NDB version check against the Datastore stand-in."""
+        etag = client.get('/profile/', headers=HEADERS).headers['ETag']
+        client.application.extensions['user_cache'].clear()
+        queries = datastore.calls['run_query']
+
+        response = client.get('/profile/', headers=dict(HEADERS, **{'If-None-Match': etag}))
+
+        assert response.status_code == 304
+        # A key lookup, not an eventually consistent index query
+        assert datastore.calls['run_query'] == queries
+
+    def test_stale_copy_reads_user_once_on_datastore(self, client, datastore, signed_in):
+        """Test that a conditional GET that misses reuses the user its version check read."""
+        from flask import g
+        client.get('/profile/', headers=HEADERS)
+        client.application.extensions['user_cache'].clear()
+        # pytest-flask keeps one app context, and so g, across test requests
+        g.pop('user_model', None)
+        lookups = datastore.calls['lookup']
+
+        response = client.get('/profile/', headers=dict(HEADERS, **{'If-None-Match': '"stale"'}))
+
+        assert response.status_code == 200
+        assert datastore.calls['lookup'] == lookups + 1
+
+    def test_if_match_ignores_cached_user(self, client, datastore, signed_in, mock_firebase_user):
+        """Test that If-Match is checked against the store, not this worker's cache."""
+        signed_in.return_value = {k: v for k, v in mock_firebase_user.items() if k != 'name'}
+        etag = client.get('/profile/', headers=HEADERS).headers['ETag']
+        # Another worker updates the user; this worker's cache still has the old copy
+        repository = client.application.extensions['user_repository']
+        with client.application.app_context():
+            other = repository.get_by_uid(mock_firebase_user['uid'])
+            other.display_name = 'Elsewhere'
+            repository.save(other)
+
+        response = client.put('/profile/', headers=dict(HEADERS, **{'If-Match': etag}),
+                              json={'display_name': 'Here'})
+
+        assert response.status_code == 412
+        with client.application.app_context():
+            assert repository.get_by_uid(mock_firebase_user['uid']).display_name == 'Elsewhere'
@@ -0,0 +1,140 @@
+"""
+Tests for the NDB global cache.
+"""
+import pytest
+from app.models.repository import NDBUserRepository
+from app.models.user import User
+from app.ndb_client import (FailOpenCache, GlobalCacheUnavailable, init_global_cache, ndb_registry,
+                            parse_memcached_hosts)
+from tests.redis_fake import FakeRedis
+
+
+@pytest.fixture
+def redis_server():
+    """Empty Redis stand-in, stopped after the test."""
+    fake = FakeRedis()
+    fake.start()
+    yield fake
+    if fake.running:
+        fake.stop()
+
+
+@pytest.fixture
+def repository(datastore, redis_server, app):
+    """NDB repository whose contexts use the Redis stand-in."""
+    app.config.update(NDB_GLOBAL_CACHE='redis', NDB_GLOBAL_CACHE_URL=redis_server.url)
+    ndb_registry.reset()
+    with app.app_context():
+        ndb_registry.initialize()
+        yield NDBUserRepository(app)
+
+
+def firebase_user(uid):
+    return {'uid': uid, 'email': f'{uid}@example.com', 'name': uid.title()}
+
+
+class TestGlobalCache:
+    """Test cases for User reads through the global cache."""
+
+    def test_reads_served_from_cache(self, repository, datastore, redis_server):
+        """Test that only the first read in any context reaches Datastore."""
+        repository.create(firebase_user('alice'))
+        datastore.calls.clear()
+
+        for _ in range(3):
+            assert repository.get_by_uid('alice').email == 'alice@example.com'
+
+        assert datastore.calls['lookup'] <= 1
+        assert redis_server.keys()
+
+    def test_entries_expire_per_model_timeout(self, repository, redis_server):
+        """Test that User entries are written with the model's timeout."""
+        repository.create(firebase_user('alice'))
+        repository.get_by_uid('alice')
+
+        assert set(redis_server._expires.values())
+        assert all(0 < expires - redis_server._clock() <= User._global_cache_timeout
+                   for expires in redis_server._expires.values())
+
+    def test_writes_invalidate(self, repository):
+        """Test that a saved change is visible to the next read."""
+        user = repository.create(firebase_user('alice'))
+        repository.get_by_uid('alice')
+
+        user.display_name = 'Renamed'
+        repository.save(user)
+
+        assert repository.get_by_uid('alice').display_name == 'Renamed'
+
+    def test_version_from_cache(self, repository, datastore):
+        """Test that version checks skip the projection query."""
+        repository.create(firebase_user('alice'))
+        repository.get_by_uid('alice')
+        datastore.calls.clear()
+
+        version = repository.get_version('alice')
+
+        assert version.uid == 'alice' and version.updated_at is not None
+        assert datastore.calls['run_query'] == 0
+
+    @pytest.mark.filterwarnings('ignore:Error connecting to global cache')
+    def test_fails_open_when_cache_down(self, repository, datastore, redis_server):
+        """Test that reads and writes fall through to Datastore."""
+        user = repository.create(firebase_user('alice'))
+        redis_server.stop()
+
+        assert repository.get_by_uid('alice').uid == 'alice'
+        user.display_name = 'Renamed'
+        repository.save(user)
+        assert repository.get_by_uid('alice').display_name == 'Renamed'
+
+        cache = ndb_registry.get_global_cache()
+        assert not cache.available
+        assert cache.failures == 1
+
+    def test_unknown_backend(self, app):
+        """Test that a typo in NDB_GLOBAL_CACHE is reported."""
+        app.config['NDB_GLOBAL_CACHE'] = 'memcache'
+
+        with app.app_context(), pytest.raises(ValueError):
+            init_global_cache()
+
+    def test_memcached_hosts(self):
+        """Test parsing of NDB_GLOBAL_CACHE_URL for memcached."""
+        assert parse_memcached_hosts('cache-1 10.0.0.2:11212 [::1]:11213 ::1') == [
+            ('cache-1', 11211), ('10.0.0.2', 11212), ('::1', 11213), ('::1', 11211)]
+
+    def test_disabled_by_default(self, datastore, app):
+        """Test that contexts have no global cache unless configured."""
+        with app.app_context():
+            assert ndb_registry.get_global_cache() is None
+
+
+class TestFailOpenCache:
+    """Test cases for the fail-fast window after a cache error."""
+
+    def test_bypasses_backend_until_retry(self):
+        """Test that a failed backend is skipped for retry_interval."""
+        class Backend:
+            transient_errors = (ConnectionError,)
+            calls = 0
+
+            def get(self, keys):
+                self.calls += 1
+                raise ConnectionError('refused')
+
+        now = [100.0]
+        backend = Backend()
+        cache = FailOpenCache(backend, retry_interval=30, clock=lambda: now[0])
+
+        with pytest.raises(ConnectionError):
+            cache.get([b'key'])
+        with pytest.raises(GlobalCacheUnavailable):
+            cache.get([b'key'])
+        assert backend.calls == 1
+        assert GlobalCacheUnavailable in cache.transient_errors
+
+        now[0] += 30
+        with pytest.raises(ConnectionError):
+            cache.get([b'key'])
+        assert backend.calls == 2
@@ -0,0 +1,65 @@
+"""
+Tests for the gunicorn configuration and per-worker initialization.
+"""
+import importlib.util
+import os
+from unittest.mock import patch
+
+import pytest
+
+from app.warmup import after_fork
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'gunicorn.conf.py')
+
+
+@pytest.fixture
+def gunicorn_conf():
+    """The gunicorn.conf.py module, loaded the way gunicorn loads it."""
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', CONFIG_PATH)
+    module = importlib.util.module_from_spec(spec)
+    with patch.dict(os.environ):
+        spec.loader.exec_module(module)
+    return module
+
+
+class TestWorkerSizing:
+    """Test cases for sizing workers and threads."""
+
+    def test_one_worker_per_cpu(self, gunicorn_conf):
+        """Test that threads are spread to reach the concurrency target."""
+        assert gunicorn_conf.size_workers(1, 2 << 30, 80) == (1, 80)
+        assert gunicorn_conf.size_workers(4, 8 << 30, 80) == (4, 20)
+        assert gunicorn_conf.size_workers(4, None, 10) == (4, 3)
+
+    def test_memory_caps_workers(self, gunicorn_conf):
+        """Test that workers are limited to what fits in memory."""
+        assert gunicorn_conf.size_workers(4, 512 << 20, 80, worker_memory_mb=256) == (2, 40)
+        assert gunicorn_conf.size_workers(4, 128 << 20, 80, worker_memory_mb=256) == (1, 80)
+
+    def test_config_values(self, gunicorn_conf):
+        """Test that the module exposes the settings gunicorn reads."""
+        assert gunicorn_conf.preload_app is True
+        assert gunicorn_conf.worker_class == 'gthread'
+        assert gunicorn_conf.workers >= 1 and gunicorn_conf.threads >= 1
+        assert gunicorn_conf.cpu_count() >= 1
+
+
+class TestAfterFork:
+    """Test cases for rebuilding per-process state in a worker."""
+
+    def test_after_fork_rebuilds_state(self):
+        """Test that the worker drops inherited clients and warms up again."""
+        from app.main import create_app
+        app = create_app({'TESTING': True, 'USER_STORE': 'memory', 'WARMUP': 'worker'})
+        state = app.extensions['firebase']
+        assert state.status is None
+
+        with patch('app.ndb_client.ndb_registry.reset') as reset_ndb, \
+                patch.object(state, 'reset', wraps=state.reset) as reset_firebase:
+            warmup = after_fork(app)
+            assert warmup.wait(timeout=10)
+
+        reset_ndb.assert_called_once_with()
+        reset_firebase.assert_called_once_with()
+        assert app.extensions['warmup'] is warmup
+        assert state.status is not None
@@ -0,0 +1,136 @@
+"""
+Tests for Firebase signing key management.
+"""
+import time
+import pytest
+from unittest.mock import MagicMock
+from firebase_admin import auth
+from app.auth.keys import KeyManager, parse_max_age
+from support.tokens import LocalIssuer
+
+
+@pytest.fixture(scope='module')
+def issuer():
+    return LocalIssuer('test-project')
+
+
+@pytest.fixture
+def key_manager(issuer):
+    manager = KeyManager('test-project', source=issuer.certificates)
+    manager.refresh()
+    yield manager
+    manager.stop()
+
+
+class TestKeyManager:
+    """Test cases for KeyManager."""
+
+    def test_parse_max_age(self):
+        """Test Cache-Control parsing."""
+        assert parse_max_age('public, max-age=19204, must-revalidate, no-transform') == 19204
+        assert parse_max_age('no-cache') is None
+        assert parse_max_age(None) is None
+
+    def test_verify_valid_token(self, key_manager, issuer):
+        """Test verifying a locally signed token."""
+        claims = key_manager.verify(issuer.mint('user-1'))
+
+        assert claims['uid'] == 'user-1'
+        assert claims['email'] == 'user-1@example.com'
+
+    def test_verify_expired_token(self, key_manager, issuer):
+        """Test that expired tokens raise ExpiredIdTokenError."""
+        with pytest.raises(auth.ExpiredIdTokenError):
+            key_manager.verify(issuer.mint('user-1', lifetime=-10))
+
+    @pytest.mark.parametrize('claims', [
+        {'aud': 'other-project'},
+        {'iss': 'https://securetoken.google.com/other-project'},
+        {'sub': ''},
+    ])
+    def test_verify_rejects_wrong_claims(self, key_manager, issuer, claims):
+        """Test that tokens for another project or without subject are rejected."""
+        with pytest.raises(auth.InvalidIdTokenError):
+            key_manager.verify(issuer.mint('user-1', **claims))
+
+    def test_verify_rejects_foreign_signature(self, key_manager, issuer):
+        """Test that tokens signed by another key are rejected."""
+        forger = LocalIssuer('test-project', kid=issuer.kid)
+
+        with pytest.raises(auth.InvalidIdTokenError):
+            key_manager.verify(forger.mint('user-1'))
+
+    def test_verify_malformed_token(self, key_manager):
+        """Test that garbage is rejected without raising anything else."""
+        with pytest.raises(auth.InvalidIdTokenError):
+            key_manager.verify('not-a-jwt')
+
+    def test_refresh_metrics(self, issuer):
+        """Test refresh timing metrics and failure accounting."""
+        source = MagicMock(side_effect=[issuer.certificates(), IOError('offline')])
+        manager = KeyManager('test-project', source=source)
+
+        manager.refresh()
+        with pytest.raises(IOError):
+            manager.refresh()
+
+        stats = manager.stats()
+        assert stats['keys'] == 1
+        assert stats['refresh_count'] == 1
+        assert stats['refresh_failures'] == 1
+        assert stats['last_refresh_seconds'] >= 0
+        # Failed refreshes keep serving the previous keys
+        assert manager.ready
+
+    def test_file_source(self, issuer, tmp_path):
+        """Test loading keys from a local JSON file."""
+        path = tmp_path / 'certs.json'
+        issuer.write_certificates(path)
+        manager = KeyManager('test-project', source=str(path))
+
+        manager.refresh()
+
+        assert manager.verify(issuer.mint('user-1'))['uid'] == 'user-1'
+
+    def test_background_refresh(self, issuer):
+        """Test that keys are refreshed ahead of expiry."""
+        source = MagicMock(return_value=({issuer.kid: issuer.public_pem()}, 1))
+        manager = KeyManager('test-project', source=source, refresh_margin=1)
+
+        manager.start()
+        try:
+            for _ in range(100):
+                if source.call_count >= 2:
+                    break
+                time.sleep(0.01)
+        finally:
+            manager.stop()
+
+        assert source.call_count >= 2
+
+
+class TestPrefetchedVerification:
+    """Test cases for verify_firebase_token using prefetched keys."""
+
+    def test_verify_firebase_token_uses_key_manager(self, issuer, tmp_path):
+        """Test end-to-end verification against a local certificate file."""
+        from app.main import create_app
+        from app.auth.firebase import verify_firebase_token
+        path = tmp_path / 'certs.json'
+        issuer.write_certificates(path)
+        app = create_app({
+            'TESTING': True,
+            'FIREBASE_PROJECT_ID': 'test-project',
+            'FIREBASE_KEY_PREFETCH': True,
+            'FIREBASE_CERTS_SOURCE': str(path),
+        })
+
+        with app.test_request_context('/'):
+            user_info = verify_firebase_token(issuer.mint('user-1', name='User One'))
+            rejected = verify_firebase_token(issuer.mint('user-1', lifetime=-10))
+
+        app.extensions['firebase_keys'].stop()
+        assert user_info['uid'] == 'user-1'
+        assert user_info['name'] == 'User One'
+        assert user_info['provider_id'] == 'google.com'
+        assert rejected is None
@@ -0,0 +1,139 @@
+"""
+Tests for request timing instrumentation.
+"""
+import time
+import pytest
+from unittest.mock import patch
+from app.metrics import (Histogram, Metrics, RequestTimings, current_timings, finish_request,
+                         record_phase, start_request, timed)
+
+METRICS_HEADERS = {'Authorization': 'Bearer test-metrics-token'}
+
+
+class TestHistogram:
+    """Test cases for Histogram."""
+
+    def test_cumulative_buckets(self):
+        """Test bucket placement and cumulative counts."""
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in [0.05, 0.1, 0.5, 2.0]:
+            histogram.observe(value)
+
+        assert histogram.cumulative() == [(0.1, 2), (1.0, 3), ('+Inf', 4)]
+        assert histogram.count == 4
+        assert histogram.sum == pytest.approx(2.65)
+
+
+class TestMetrics:
+    """Test cases for the metrics registry."""
+
+    def test_render_prometheus_text(self):
+        """Test the exposition format of recorded series."""
+        metrics = Metrics(buckets=(0.1,))
+        timings = RequestTimings(started=10.0)
+        timings.add('token_verify', 0.02)
+        timings.rpcs.append(('Lookup', 0.03))
+        timings.rpcs.append(('Lookup', 0.01))
+
+        metrics.observe_request('GET', '/profile/', 200, timings, now=10.05)
+        text = metrics.render()
+
+        assert '# TYPE app_request_duration_seconds histogram' in text
+        assert 'app_request_duration_seconds_bucket{method="GET",endpoint="/profile/",status="200",le="0.1"} 1' in text
+        assert 'app_request_duration_seconds_count{method="GET",endpoint="/profile/",status="200"} 1' in text
+        assert 'app_request_phase_seconds_count{endpoint="/profile/",phase="token_verify"} 1' in text
+        assert 'app_request_phase_seconds_sum{endpoint="/profile/",phase="datastore"} 0.04' in text
+        assert 'app_datastore_rpcs_total{endpoint="/profile/",rpc="Lookup"} 2' in text
+
+    def test_label_escaping(self):
+        """Test that label values are escaped."""
+        metrics = Metrics()
+        metrics.observe_request('GET', '/a"b', 200, RequestTimings(time.perf_counter()))
+
+        assert 'endpoint="/a\\"b"' in metrics.render()
+
+
+class TestRequestTimings:
+    """Test cases for per-request phase recording."""
+
+    def test_record_phase_outside_request_is_noop(self):
+        """Test that phases are dropped when no request is being timed."""
+        record_phase('token_verify', 1.0)
+
+        assert current_timings() is None
+
+    def test_timed_decorator(self):
+        """Test that decorated functions add to the current request."""
+        @timed('work')
+        def work():
+            return 'done'
+
+        token = start_request()
+        try:
+            assert work() == 'done'
+            assert 'work' in current_timings().phases
+        finally:
+            finish_request(token)
+
+    def test_token_verify_phase(self, app):
+        """Test that uncached token verification is timed."""
+        from app.auth.firebase import verify_firebase_token
+
+        token = start_request()
+        try:
+            with app.app_context(), patch('firebase_admin.auth') as mock_auth:
+                mock_auth.verify_id_token.return_value = {'uid': 'abc', 'exp': time.time() + 60}
+                verify_firebase_token('token')
+            assert current_timings().phases['token_verify'] >= 0
+        finally:
+            finish_request(token)
+
+
+class TestMetricsEndpoint:
+    """Test cases for the /metrics endpoint."""
+
+    def test_request_latency_recorded(self, client):
+        """Test that requests show up by URL rule."""
+        client.get('/health')
+        client.get('/no-such-page')
+
+        text = client.get('/metrics', headers=METRICS_HEADERS).get_data(as_text=True)
+
+        assert 'app_request_duration_seconds_count{method="GET",endpoint="/health",status="200"} 1' in text
+        assert 'app_request_duration_seconds_count{method="GET",endpoint="unmatched",status="404"} 1' in text
+        assert 'app_request_phase_seconds_count{endpoint="/health",phase="serialization"} 1' in text
+
+    def test_datastore_breakdown(self, client, datastore, mock_firebase_user):
+        """Test NDB context and Datastore RPC timing on a profile request."""
+        with patch('app.auth.firebase.verify_firebase_token', return_value=mock_firebase_user):
+            response = client.get('/profile/', headers={'Authorization': 'Bearer mock-token'})
+        assert response.status_code == 200
+
+        text = client.get('/metrics', headers=METRICS_HEADERS).get_data(as_text=True)
+
+        assert 'app_request_phase_seconds_count{endpoint="/profile/",phase="ndb_context"} 1' in text
+        assert 'app_request_phase_seconds_count{endpoint="/profile/",phase="datastore"} 1' in text
+        assert 'app_datastore_rpcs_total{endpoint="/profile/",rpc="Lookup"}' in text
+        assert 'app_datastore_rpcs_total{endpoint="/profile/",rpc="Commit"} 1' in text
+
+    def test_metrics_require_token(self, client):
+        """Test that /metrics is refused without the bearer token."""
+        assert client.get('/metrics').status_code == 401
+        response = client.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+        assert response.status_code == 401
+        assert response.headers['WWW-Authenticate'] == 'Bearer'
+
+    def test_metrics_not_served_without_token(self):
+        """Test that the endpoint is not registered unless METRICS_TOKEN is set."""
+        from app.main import create_app
+        app = create_app({'TESTING': True})
+
+        assert 'metrics' in app.extensions
+        assert app.test_client().get('/metrics').status_code == 404
+
+    def test_metrics_disabled(self):
+        """Test that METRICS_ENABLED=False removes the endpoint."""
+        from app.main import create_app
+        app = create_app({'TESTING': True, 'METRICS_ENABLED': False})
+
+        assert app.test_client().get('/metrics', headers=METRICS_HEADERS).status_code == 404
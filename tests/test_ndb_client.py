@@ -0,0 +1,90 @@
+"""
+Tests for the NDB client registry.
+"""
+import os
+import threading
+from unittest.mock import patch, MagicMock
+from app.ndb_client import NDBClientRegistry, with_ndb_context
+
+
+class TestNDBClientRegistry:
+    """Test cases for NDBClientRegistry."""
+
+    def test_client_created_once(self):
+        """Test that repeated calls share one client."""
+        factory = MagicMock()
+        registry = NDBClientRegistry(factory=factory)
+
+        assert registry.get_client() is registry.get_client()
+        assert factory.call_count == 1
+        assert registry.is_available()
+
+    def test_client_created_once_across_threads(self):
+        """Test that concurrent first use still creates a single client."""
+        factory = MagicMock()
+        registry = NDBClientRegistry(factory=factory)
+
+        threads = [threading.Thread(target=registry.get_client) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert factory.call_count == 1
+
+    def test_client_rebuilt_after_fork(self):
+        """Test that a new process gets its own client."""
+        factory = MagicMock(side_effect=[MagicMock(), MagicMock()])
+        registry = NDBClientRegistry(factory=factory)
+        parent_client = registry.get_client()
+
+        with patch('app.ndb_client.os.getpid', return_value=os.getpid() + 1):
+            assert not registry.is_available()
+            child_client = registry.get_client()
+
+        assert child_client is not parent_client
+        assert factory.call_count == 2
+
+    def test_reset(self):
+        """Test that reset drops the client."""
+        factory = MagicMock()
+        registry = NDBClientRegistry(factory=factory)
+        registry.get_client()
+
+        registry.reset()
+
+        assert not registry.is_available()
+        registry.get_client()
+        assert factory.call_count == 2
+
+    def test_context_uses_shared_client(self):
+        """Test that contexts come from the shared client."""
+        client = MagicMock()
+        registry = NDBClientRegistry(factory=lambda: client)
+
+        registry.context()
+        registry.context()
+
+        assert client.context.call_count == 2
+
+
+class TestWithNDBContext:
+    """Test cases for the with_ndb_context decorator."""
+
+    def test_creates_context(self):
+        """Test that a context is entered when none is active."""
+        with patch('app.ndb_client.get_ndb_context') as mock_get_context:
+            result = with_ndb_context(lambda: 'done')()
+
+        assert result == 'done'
+        mock_get_context.assert_called_once()
+        mock_get_context.return_value.__enter__.assert_called_once()
+
+    def test_reuses_active_context(self):
+        """Test that an already active context is reused."""
+        with patch('app.ndb_client.ndb.get_context', return_value=MagicMock()), \
+             patch('app.ndb_client.get_ndb_context') as mock_get_context:
+            result = with_ndb_context(lambda: 'done')()
+
+        assert result == 'done'
+        mock_get_context.assert_not_called()
@@ -187,4 +187,122 @@ class TestProfileRoutes:
             
             assert response.status_code == 401
             data = json.loads(response.data)
-            assert 'error' in data 
\ No newline at end of file
+            assert 'error' in data 
+
+class TestUserLoading:
+    """Test request-scoped and per-worker User caching (Datastore stand-in)."""
+
+    @pytest.fixture
+    def signed_in(self, mock_firebase_user):
+        with patch('app.auth.firebase.verify_firebase_token', return_value=mock_firebase_user):
+            yield
+
+    def test_attach_loads_user_once_per_request(self, app, datastore, mock_firebase_user):
+        """Test that repeated attach calls in one request reuse g.user_model."""
+        from flask import g
+        from app.auth import user_middleware
+
+        with app.test_request_context('/'), \
+             patch('app.auth.user_middleware.get_or_create_user',
+                   wraps=user_middleware.get_or_create_user) as mock_load:
+            g.user = mock_firebase_user
+            user_middleware.attach_user_to_request()
+            first = g.user_model
+            user_middleware.attach_user_to_request()
+
+        assert g.user_model is first
+        assert mock_load.call_count == 1
+
+    def test_hot_user_served_without_datastore(self, client, datastore, signed_in):
+        """Test that a recently seen user needs no Datastore RPCs."""
+        response = client.get('/profile/', headers={'Authorization': 'Bearer mock-token'})
+        assert response.status_code == 200
+        datastore.calls.clear()
+
+        response = client.get('/profile/stats', headers={'Authorization': 'Bearer mock-token'})
+
+        assert response.status_code == 200
+        assert sum(datastore.calls.values()) == 0
+
+    def test_changed_claims_bypass_cache(self, app, client, datastore, signed_in, mock_firebase_user):
+        """Test that a token with new claims is written through."""
+        client.get('/profile/', headers={'Authorization': 'Bearer mock-token'})
+        renamed = dict(mock_firebase_user, name='Renamed User')
+
+        with patch('app.auth.firebase.verify_firebase_token', return_value=renamed):
+            response = client.get('/profile/', headers={'Authorization': 'Bearer mock-token'})
+
+        assert response.get_json()['user']['display_name'] == 'Renamed User'
+        assert datastore.calls['commit'] == 2
+
+    def test_first_login_update_writes_once(self, client, datastore, signed_in):
+        """Test that creating the user and applying the update is one commit."""
+        response = client.put('/profile/', headers={'Authorization': 'Bearer mock-token'},
+                              json={'display_name': 'New Name'})
+
+        assert response.get_json()['user']['display_name'] == 'New Name'
+        assert datastore.calls['commit'] == 1
+        assert datastore.count('User') == 1
+
+    def test_update_collapses_claim_and_route_writes(self, client, datastore, mock_firebase_user):
+        """Test that new token claims and the update share one commit."""
+        headers = {'Authorization': 'Bearer mock-token'}
+        with patch('app.auth.firebase.verify_firebase_token', return_value=mock_firebase_user):
+            client.get('/profile/', headers=headers)
+        datastore.calls.clear()
+
+        renamed = dict(mock_firebase_user, email='new@example.com')
+        with patch('app.auth.firebase.verify_firebase_token', return_value=renamed):
+            response = client.put('/profile/', headers=headers, json={'display_name': 'New Name'})
+            unchanged = client.put('/profile/', headers=headers, json={'display_name': 'New Name'})
+
+        assert response.get_json()['user']['email'] == 'new@example.com'
+        assert unchanged.status_code == 200
+        assert datastore.calls['commit'] == 1
+
+    def test_sync_without_changes_skips_write(self, client, datastore, signed_in):
+        """Test that syncing identical claims does not commit."""
+        client.get('/profile/', headers={'Authorization': 'Bearer mock-token'})
+        datastore.calls.clear()
+
+        response = client.post('/profile/sync', headers={'Authorization': 'Bearer mock-token'})
+
+        assert response.status_code == 200
+        assert datastore.calls['commit'] == 0
+
+    def test_invalidate_user(self, app, mock_firebase_user):
+        """Test explicit invalidation after writes."""
+        from app.auth.user_middleware import invalidate_user
+        cache = app.extensions['user_cache']
+        cache.put(User(uid='test-user-123', email='test@example.com'))
+
+        with app.app_context():
+            invalidate_user('test-user-123')
+
+        assert cache.get('test-user-123') is None
+
+
+class TestUserCache:
+    """Test cases for UserCache."""
+
+    def test_returns_independent_copies(self):
+        """Test that cached users are copies."""
+        from app.models.user_cache import UserCache
+        cache = UserCache(ttl=30)
+        cache.put(User(uid='u1', email='u1@example.com', display_name='One'))
+
+        cache.get('u1').display_name = 'Changed'
+
+        assert cache.get('u1').display_name == 'One'
+
+    def test_ttl(self):
+        """Test that entries expire after the TTL."""
+        from app.models.user_cache import UserCache
+        clock = MagicMock(return_value=0)
+        cache = UserCache(ttl=30, clock=clock)
+        cache.put(User(uid='u1', email='u1@example.com'))
+
+        clock.return_value = 29
+        assert cache.get('u1') is not None
+        clock.return_value = 30
+        assert cache.get('u1') is None
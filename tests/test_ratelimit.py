@@ -0,0 +1,204 @@
+"""
+Tests for token-bucket rate limiting.
+"""
+from unittest.mock import MagicMock
+
+import pytest
+from flask import Flask, g, request
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.ratelimit import (KEY_IP, KEY_ROUTE, KEY_UID, LocalBackend, RateLimiter, RedisBackend, parse_rate,
+                           rate_limit, request_key)
+
+METRICS_HEADERS = {'Authorization': 'Bearer test-metrics-token'}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLocalBackend:
+    """Test cases for in-process buckets."""
+
+    @pytest.mark.parametrize('rate, per_second', [
+        ('10/second', 10), ('120/minute', 2), ('3600 / hours', 1), ('5', 5)])
+    def test_parse_rate(self, rate, per_second):
+        """Test that rates are converted to requests per second."""
+        assert parse_rate(rate) == per_second
+
+    @pytest.mark.parametrize('rate', ['10/fortnight', '0/second', 'ten/second'])
+    def test_parse_rate_invalid(self, rate):
+        """Test that unparseable rates are rejected."""
+        with pytest.raises(ValueError):
+            parse_rate(rate)
+
+    def test_burst_then_refill(self):
+        """Test that a full bucket allows a burst and then refills at the rate."""
+        clock = FakeClock()
+        backend = LocalBackend(clock=clock)
+
+        assert [backend.hit('k', rate=2, burst=3) for _ in range(3)] == [0, 0, 0]
+        assert backend.hit('k', rate=2, burst=3) == pytest.approx(0.5)
+        clock.now += 0.5
+        assert backend.hit('k', rate=2, burst=3) == 0
+        assert backend.hit('other', rate=2, burst=3) == 0
+
+    def test_rejections_do_not_consume(self):
+        """Test that rejected requests do not push the retry time further out."""
+        clock = FakeClock()
+        backend = LocalBackend(clock=clock)
+        backend.hit('k', rate=1, burst=1)
+
+        assert backend.hit('k', rate=1, burst=1) == backend.hit('k', rate=1, burst=1) == 1
+
+    def test_idle_buckets_swept(self):
+        """Test that refilled buckets are dropped once over max_keys."""
+        clock = FakeClock()
+        backend = LocalBackend(max_keys=2, clock=clock)
+        backend.hit('a', rate=1, burst=5)
+        backend.hit('b', rate=1, burst=5)
+        clock.now += 10
+        backend.hit('c', rate=1, burst=5)
+
+        assert len(backend) == 1
+
+    def test_flood_keeps_throttled_buckets(self):
+        """Test that a flood of new keys evicts fresh buckets, not a throttled client's."""
+        clock = FakeClock()
+        backend = LocalBackend(max_keys=100, clock=clock)
+        while backend.hit('abuser', rate=1, burst=5) == 0:
+            pass
+
+        for i in range(1000):
+            backend.hit(f'flood-{i}', rate=1, burst=5)
+
+        assert len(backend) <= 100
+        assert backend.hit('abuser', rate=1, burst=5) > 0
+
+
+class TestRateLimiter:
+    """Test cases for the shared backend in front of local buckets."""
+
+    def test_shared_backend_consulted(self, app):
+        """Test that requests allowed locally are checked against the shared backend."""
+        backend = MagicMock()
+        backend.hit.return_value = 2.5
+        limiter = RateLimiter(backend=backend)
+
+        with app.app_context():
+            assert limiter.hit('k', rate=10, burst=10) == 2.5
+        backend.hit.assert_called_once_with('k', 10, 10)
+
+    def test_redis_backend(self):
+        """Test that the Redis backend runs the GCRA script on a prefixed key."""
+        client = MagicMock()
+        client.register_script.return_value.return_value = b'0.25'
+
+        assert RedisBackend(client).hit('k', rate=4, burst=8) == 0.25
+        client.register_script.return_value.assert_called_once_with(keys=['ratelimit:k'], args=[0.25, 8])
+
+    def test_local_rejection_skips_backend(self, app):
+        """Test that clients over the limit locally cost no round trip."""
+        backend = MagicMock()
+        backend.hit.return_value = 0.0
+        limiter = RateLimiter(backend=backend)
+
+        with app.app_context():
+            limiter.hit('k', rate=1, burst=1)
+            assert limiter.hit('k', rate=1, burst=1) > 0
+        assert backend.hit.call_count == 1
+
+    def test_backend_failure_fails_open(self, app):
+        """Test that a failing backend falls back to local limits until retried."""
+        clock = FakeClock()
+        backend = MagicMock()
+        backend.hit.side_effect = RedisConnectionError('refused')
+        limiter = RateLimiter(backend=backend, retry_interval=30, clock=clock)
+
+        with app.app_context():
+            assert limiter.hit('a', rate=10, burst=10) == 0
+            assert limiter.hit('b', rate=10, burst=10) == 0
+            assert backend.hit.call_count == 1
+            clock.now += 30
+            backend.hit.side_effect = None
+            backend.hit.return_value = 0.0
+            limiter.hit('c', rate=10, burst=10)
+
+        assert backend.hit.call_count == 2
+        assert limiter.stats()['backend_failures'] == 1
+
+
+class TestRateLimitedRoutes:
+    """Test cases for limits applied to requests."""
+
+    @pytest.fixture
+    def limited_app(self):
+        from app.main import create_app
+        return create_app({'TESTING': True, 'SECRET_KEY': 'test-secret-key',
+                           'FIREBASE_PROJECT_ID': 'test-project', 'USER_STORE': 'memory',
+                           'RATELIMIT_ENABLED': True, 'RATELIMIT_AUTH': '1/minute',
+                           'RATELIMIT_AUTH_BURST': 2, 'METRICS_TOKEN': 'test-metrics-token'})
+
+    def test_disabled_by_default(self, client):
+        """Test that nothing is limited unless enabled."""
+        assert 'rate_limiter' not in client.application.extensions
+        assert all(client.get('/auth/status').status_code == 200 for _ in range(30))
+
+    def test_auth_blueprint_limited(self, limited_app):
+        """Test that /auth requests over the limit get 429 with Retry-After."""
+        client = limited_app.test_client()
+        statuses = [client.get('/auth/status').status_code for _ in range(3)]
+        response = client.get('/auth/status')
+
+        assert statuses == [200, 200, 429]
+        assert response.get_json() == {'error': 'Too many requests'}
+        assert 0 < int(response.headers['Retry-After']) <= 60
+        # Buckets are per route and per client
+        assert client.post('/auth/logout').status_code == 200
+        assert client.get('/auth/status', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+        assert client.get('/health').status_code == 200
+
+    def test_forwarded_client(self, limited_app):
+        """Test that clients are told apart by X-Forwarded-For behind Cloud Run's proxy by default."""
+        headers = {'X-Forwarded-For': 'spoofed, 203.0.113.7'}
+        with limited_app.test_request_context('/', headers=headers):
+            assert request_key((KEY_IP,)) == '203.0.113.7'
+
+        limited_app.config['RATELIMIT_PROXY_COUNT'] = 0
+        with limited_app.test_request_context('/', headers=headers,
+                                              environ_base={'REMOTE_ADDR': '198.51.100.1'}):
+            assert request_key((KEY_IP,)) == '198.51.100.1'
+
+    def test_metrics_exported(self, limited_app):
+        """Test that rejections appear on /metrics."""
+        client = limited_app.test_client()
+        for _ in range(3):
+            client.get('/auth/status')
+        text = client.get('/metrics', headers=METRICS_HEADERS).get_data(as_text=True)
+
+        assert 'app_ratelimit_rejections_total{scope="auth"} 1' in text
+
+    def test_decorator_keyed_by_uid(self):
+        """Test the decorator on a view keyed by user."""
+        app = Flask(__name__)
+        app.extensions['rate_limiter'] = RateLimiter()
+
+        @app.route('/expensive')
+        @rate_limit('1/minute', burst=1, key=(KEY_UID, KEY_ROUTE))
+        def expensive():
+            return {'ok': True}
+
+        @app.before_request
+        def load_user():
+            uid = request.args.get('uid')
+            g.user = {'uid': uid} if uid else None
+
+        client = app.test_client()
+        assert client.get('/expensive?uid=a').status_code == 200
+        assert client.get('/expensive?uid=a').status_code == 429
+        assert client.get('/expensive?uid=b').status_code == 200
+        assert client.get('/expensive').status_code == 200
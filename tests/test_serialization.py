@@ -0,0 +1,111 @@
+"""
+Tests for User payload serialization.
+"""
+import json
+import msgpack
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+from app.models.user import User
+from app.serialization import USER_PAYLOAD_FIELDS, PayloadCache, encode_user, parse_fields
+
+HEADERS = {'Authorization': 'Bearer mock-token'}
+
+
+@pytest.fixture
+def memory_client(mock_firebase_user):
+    """Client for an app on the memory user store, signed in."""
+    from app.main import create_app
+    app = create_app({'TESTING': True, 'USER_STORE': 'memory'})
+    with patch('app.auth.firebase.verify_firebase_token', return_value=mock_firebase_user):
+        yield app.test_client()
+
+
+class TestParseFields:
+    """Test cases for ?fields= parsing."""
+
+    def test_default_is_all_fields(self):
+        assert parse_fields(None) == USER_PAYLOAD_FIELDS
+
+    def test_selection_keeps_canonical_order(self):
+        assert parse_fields('email, uid') == ('uid', 'email')
+
+    def test_unknown_field(self):
+        with pytest.raises(ValueError):
+            parse_fields('uid,password')
+
+
+class TestEncodeUser:
+    """Test cases for cached user encoding."""
+
+    def test_matches_to_dict(self, app):
+        """Test that the encoding equals json of to_dict()."""
+        user = User(uid='a', email='a@example.com', updated_at=datetime(2024, 1, 1))
+
+        with app.app_context():
+            assert json.loads(encode_user(user)) == user.to_dict()
+
+    def test_cached_per_updated_at(self, app):
+        """Test that an unchanged user is encoded once."""
+        user = User(uid='a', email='a@example.com', updated_at=datetime(2024, 1, 1))
+
+        with app.app_context(), patch.object(User, 'to_dict', wraps=user.to_dict) as mock_to_dict:
+            first = encode_user(user)
+            second = encode_user(user)
+            user.updated_at = datetime(2024, 1, 2)
+            third = encode_user(user)
+
+        assert first is second
+        assert third != first
+        assert mock_to_dict.call_count == 2
+
+    def test_payload_cache_is_bounded(self):
+        cache = PayloadCache(max_size=2)
+        for key in 'abc':
+            cache.put(key, key.encode())
+
+        assert cache.get('a') is None
+        assert cache.stats()['size'] == 2
+
+
+class TestProfileSerialization:
+    """Test cases for profile responses."""
+
+    def test_json_response_shape(self, memory_client, mock_firebase_user):
+        response = memory_client.get('/profile/', headers=HEADERS)
+
+        assert response.status_code == 200
+        assert response.mimetype == 'application/json'
+        assert 'Accept' in response.headers['Vary']
+        data = response.get_json()
+        assert data['message'] == 'Profile retrieved successfully'
+        assert set(data['user']) == set(USER_PAYLOAD_FIELDS)
+        assert data['user']['uid'] == mock_firebase_user['uid']
+
+    def test_field_selection(self, memory_client):
+        response = memory_client.get('/profile/?fields=uid,email,display_name', headers=HEADERS)
+
+        assert set(response.get_json()['user']) == {'uid', 'email', 'display_name'}
+
+    def test_invalid_fields(self, memory_client):
+        response = memory_client.get('/profile/?fields=secret', headers=HEADERS)
+
+        assert response.status_code == 400
+
+    def test_msgpack_negotiation(self, memory_client, mock_firebase_user):
+        response = memory_client.get('/profile/?fields=uid',
+                                     headers=dict(HEADERS, Accept='application/msgpack'))
+
+        assert response.mimetype == 'application/msgpack'
+        assert msgpack.unpackb(response.data) == {
+            'message': 'Profile retrieved successfully',
+            'user': {'uid': mock_firebase_user['uid']},
+        }
+
+    def test_update_returns_new_state(self, memory_client):
+        """Test that a write is not answered from the stale cache entry."""
+        memory_client.get('/profile/', headers=HEADERS)
+        response = memory_client.put('/profile/?fields=display_name', headers=HEADERS,
+                                     json={'display_name': 'Renamed'})
+
+        assert response.get_json()['user'] == {'display_name': 'Renamed'}
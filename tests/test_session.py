@@ -0,0 +1,166 @@
+"""
+Tests for signed session cookies.
+"""
+from unittest.mock import patch
+
+import pytest
+
+from app.auth.session import SESSION_COOKIE, SessionSigner
+
+
+class Clock:
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def session_app():
+    from app.main import create_app
+    return create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'test-secret-key',
+        'USER_STORE': 'memory',
+        'AUTH_SESSION_ENABLED': True,
+        'AUTH_SESSION_TTL': 600,
+    })
+
+
+def login(client, user):
+    with patch('app.routes.auth.verify_firebase_token', return_value=user):
+        response = client.post('/auth/login', json={'idToken': 'valid-token'})
+    assert response.status_code == 200
+    return response
+
+
+class TestSessionSigner:
+    """Test cases for minting and checking session values."""
+
+    def test_round_trip(self, mock_firebase_user):
+        """Test that a minted value verifies to the same user info."""
+        signer = SessionSigner(['secret'])
+
+        assert signer.verify(signer.mint(mock_firebase_user)) == mock_firebase_user
+
+    def test_tampered_value_rejected(self, mock_firebase_user):
+        """Test that changing the payload or tag invalidates the value."""
+        signer = SessionSigner(['secret'])
+        value = signer.mint(mock_firebase_user)
+        other = signer.mint(dict(mock_firebase_user, uid='someone-else'))
+        version, key_id, payload, tag = value.split('.')
+
+        assert signer.verify('.'.join([version, key_id, other.split('.')[2], tag])) is None
+        assert signer.verify(value[:-2] + ('AA' if value[-2:] != 'AA' else 'BB')) is None
+        assert signer.verify('garbage') is None
+        assert signer.verify(None) is None
+
+    def test_expired_value_rejected(self, mock_firebase_user):
+        """Test that values stop verifying after the TTL."""
+        clock = Clock()
+        signer = SessionSigner(['secret'], ttl=60, clock=clock)
+        value = signer.mint(mock_firebase_user)
+
+        clock.now += 59
+        assert signer.verify(value) == mock_firebase_user
+        clock.now += 1
+        assert signer.verify(value) is None
+
+    def test_key_rotation(self, mock_firebase_user):
+        """Test that old secrets verify but only the current one signs."""
+        old = SessionSigner(['old-secret'])
+        rotated = SessionSigner(['new-secret', 'old-secret'])
+        value = old.mint(mock_firebase_user)
+
+        assert rotated.verify(value) == mock_firebase_user
+        assert old.verify(rotated.mint(mock_firebase_user)) is None
+        assert SessionSigner(['new-secret']).verify(value) is None
+
+
+class TestSessionCookies:
+    """Test cases for session cookies in the auth flow."""
+
+    def test_disabled_by_default(self, client, mock_firebase_user):
+        """Test that login sets the ID token cookie unless sessions are enabled."""
+        login(client, mock_firebase_user)
+
+        assert client.get_cookie('firebase_token') is not None
+        assert client.get_cookie(SESSION_COOKIE) is None
+
+    def test_session_skips_firebase(self, session_app, mock_firebase_user):
+        """Test that requests with a session cookie are not verified again."""
+        client = session_app.test_client()
+        login(client, mock_firebase_user)
+
+        assert client.get_cookie('firebase_token') is None
+        with patch('app.auth.firebase.verify_firebase_token') as mock_verify, \
+                patch('app.auth.firebase.firebase_available', return_value=False):
+            me = client.get('/auth/me')
+            status = client.get('/auth/status')
+
+        assert me.status_code == 200
+        assert me.get_json()['user']['uid'] == mock_firebase_user['uid']
+        assert status.get_json()['authenticated'] is True
+        mock_verify.assert_not_called()
+
+    def test_expired_session_falls_back(self, session_app, mock_firebase_user):
+        """Test that an expired session falls back to the token and is re-issued."""
+        client = session_app.test_client()
+        signer = session_app.extensions['session_signer']
+        client.set_cookie(SESSION_COOKIE, signer.mint(mock_firebase_user, expires_at=1))
+        client.set_cookie('firebase_token', 'valid-token')
+
+        with patch('app.auth.firebase.verify_firebase_token', return_value=mock_firebase_user) as mock_verify, \
+                patch('app.auth.firebase.firebase_available', return_value=True):
+            response = client.get('/auth/me')
+
+        assert response.status_code == 200
+        mock_verify.assert_called_once_with('valid-token')
+        assert signer.verify(client.get_cookie(SESSION_COOKIE).value) == mock_firebase_user
+
+    def test_authorization_header_wins(self, session_app, mock_firebase_user):
+        """Test that a bearer token is verified even with a session cookie."""
+        client = session_app.test_client()
+        login(client, mock_firebase_user)
+
+        with patch('app.auth.firebase.verify_firebase_token', return_value=None), \
+                patch('app.auth.firebase.firebase_available', return_value=True):
+            response = client.get('/auth/me', headers={'Authorization': 'Bearer bad-token'})
+
+        assert response.status_code == 401
+
+    def test_logout_clears_session(self, session_app, mock_firebase_user):
+        """Test that logout removes the session cookie."""
+        client = session_app.test_client()
+        login(client, mock_firebase_user)
+        client.post('/auth/logout')
+
+        assert client.get_cookie(SESSION_COOKIE) is None
+
+    def test_not_used_with_revocation_checks(self):
+        """Test that sessions stay off when every token must be checked for revocation."""
+        from app.main import create_app
+        app = create_app({'TESTING': True, 'USER_STORE': 'memory', 'AUTH_SESSION_ENABLED': True,
+                          'FIREBASE_CHECK_REVOKED': True})
+
+        assert 'session_signer' not in app.extensions
+
+    @pytest.mark.parametrize('secrets', [
+        {},
+        {'SECRET_KEY': 'dev-secret-key'},
+        {'SECRET_KEY': 'test-secret-key', 'SECRET_KEY_FALLBACKS': ['your-secret-key-here']},
+        {'SECRET_KEY': 'test-secret-key', 'SECRET_KEY_FALLBACKS': ['']},
+    ])
+    def test_not_used_with_public_secret(self, secrets, mock_firebase_user):
+        """Test that sessions stay off without a private secret, so none can be forged."""
+        from app.main import create_app
+        app = create_app(dict({'TESTING': True, 'USER_STORE': 'memory', 'AUTH_SESSION_ENABLED': True,
+                               'ADMIN_UIDS': [mock_firebase_user['uid']]}, **secrets))
+        client = app.test_client()
+        client.set_cookie(SESSION_COOKIE, SessionSigner(['dev-secret-key']).mint(mock_firebase_user))
+
+        assert 'session_signer' not in app.extensions
+        with patch('app.auth.firebase.firebase_available', return_value=True):
+            assert client.get('/auth/me').status_code == 401
+            assert client.get('/admin/users').status_code == 401
@@ -0,0 +1,158 @@
+"""
+Tests for coalescing concurrent token verification and user loading.
+"""
+import threading
+import time
+from unittest.mock import patch
+
+from app.singleflight import SingleFlight, GROUP_TOKEN_VERIFY, GROUP_USER_LOAD
+
+METRICS_HEADERS = {'Authorization': 'Bearer test-metrics-token'}
+
+
+def run_concurrently(app, func, count):
+    """Call func in count threads, each in its own app context."""
+    results = [None] * count
+
+    def worker(index):
+        with app.app_context():
+            results[index] = func()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+class TestSingleFlight:
+    """Test cases for the SingleFlight group."""
+
+    def test_concurrent_calls_run_once(self):
+        """Test that overlapping calls with one key share the result."""
+        group = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            release.wait(5)
+            return 'result'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(group.do('key', work)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        wait_for(lambda: group.stats()['coalesced'] == 3)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert sorted(results) == [('result', False)] + [('result', True)] * 3
+        assert group.in_flight() == 0
+
+    def test_error_shared_with_waiters(self):
+        """Test that waiters see the leader's exception."""
+        group = SingleFlight()
+        release = threading.Event()
+        errors = []
+
+        def work():
+            release.wait(5)
+            raise ValueError('boom')
+
+        def call():
+            try:
+                group.do('key', work)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        wait_for(lambda: group.stats()['coalesced'] == 1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(errors) == 2 and errors[0] is errors[1]
+
+    def test_sequential_calls_not_coalesced(self):
+        """Test that nothing is remembered once a call has finished."""
+        group = SingleFlight()
+
+        assert group.do('key', lambda: 1) == (1, False)
+        assert group.do('key', lambda: 2) == (2, False)
+        assert group.stats() == {'executed': 2, 'coalesced': 0}
+
+
+class TestCoalescedRequests:
+    """Test cases for coalescing in token verification and user loading."""
+
+    def test_token_verified_once(self, app, mock_firebase_auth):
+        """Test that concurrent requests with one token verify it once."""
+        from app.auth.firebase import verify_firebase_token
+        group = app.extensions['singleflight'][GROUP_TOKEN_VERIFY]
+        release = threading.Event()
+        decoded = dict(mock_firebase_auth.verify_id_token.return_value, exp=time.time() + 3600)
+
+        def verify(token):
+            release.wait(5)
+            return decoded
+
+        mock_firebase_auth.verify_id_token.side_effect = verify
+        threads, results = run_concurrently(app, lambda: verify_firebase_token('shared-token'), 3)
+        wait_for(lambda: group.stats()['coalesced'] == 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert mock_firebase_auth.verify_id_token.call_count == 1
+        assert all(result['uid'] == 'test-user-123' for result in results)
+        assert len({id(result) for result in results}) == 3
+
+    def test_first_login_creates_once(self, mock_firebase_user):
+        """Test that concurrent first logins share one lookup and creation."""
+        from app.main import create_app
+        from app.auth.user_middleware import get_or_create_user
+        app = create_app({'TESTING': True, 'USER_STORE': 'memory'})
+        repository = app.extensions['user_repository']
+        group = app.extensions['singleflight'][GROUP_USER_LOAD]
+        release = threading.Event()
+        original = repository.get_or_create
+
+        def slow_get_or_create(firebase_user_info):
+            release.wait(5)
+            return original(firebase_user_info)
+
+        with patch.object(repository, 'get_or_create', side_effect=slow_get_or_create) as mock:
+            threads, users = run_concurrently(app, lambda: get_or_create_user(mock_firebase_user), 3)
+            wait_for(lambda: group.stats()['coalesced'] == 2)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        assert mock.call_count == 1
+        assert {user.uid for user in users} == {mock_firebase_user['uid']}
+        assert len({id(user) for user in users}) == 3
+
+    def test_metrics_exported(self, client):
+        """Test that coalescing counters appear on /metrics."""
+        text = client.get('/metrics', headers=METRICS_HEADERS).get_data(as_text=True)
+
+        assert 'app_singleflight_calls_total{group="token_verify",outcome="coalesced"} 0' in text
+
+    def test_disabled(self):
+        """Test that SINGLEFLIGHT_ENABLED=false removes the groups."""
+        from app.main import create_app
+        app = create_app({'TESTING': True, 'USER_STORE': 'memory', 'SINGLEFLIGHT_ENABLED': False})
+
+        assert 'singleflight' not in app.extensions
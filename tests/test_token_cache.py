@@ -0,0 +1,127 @@
+"""
+Tests for the verified-token cache.
+"""
+import time
+import pytest
+from unittest.mock import patch
+from app.auth.token_cache import TokenCache
+
+
+class FakeClock:
+    """Manually advanced clock."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenCache:
+    """Test cases for TokenCache."""
+
+    def test_hit_and_miss(self):
+        """Test basic get/put with counters."""
+        cache = TokenCache(max_size=10)
+        assert cache.get('token') is None
+
+        cache.put('token', {'uid': 'abc'}, time.time() + 60)
+
+        assert cache.get('token') == {'uid': 'abc'}
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_expires_at_exp(self):
+        """Test that entries are dropped at the token's exp claim."""
+        clock = FakeClock()
+        cache = TokenCache(max_size=10, clock=clock)
+        cache.put('token', {'uid': 'abc'}, clock.now + 60)
+
+        clock.now += 59
+        assert cache.get('token') is not None
+        clock.now += 1
+        assert cache.get('token') is None
+        assert cache.stats()['size'] == 0
+
+    def test_expired_token_not_cached(self):
+        """Test that already expired tokens are never stored."""
+        clock = FakeClock()
+        cache = TokenCache(max_size=10, clock=clock)
+
+        cache.put('token', {'uid': 'abc'}, clock.now - 1)
+
+        assert cache.stats()['size'] == 0
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted."""
+        cache = TokenCache(max_size=2)
+        exp = time.time() + 60
+        cache.put('a', {'uid': 'a'}, exp)
+        cache.put('b', {'uid': 'b'}, exp)
+        cache.get('a')
+
+        cache.put('c', {'uid': 'c'}, exp)
+
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+        assert cache.stats()['evictions'] == 1
+
+    def test_returns_copies(self):
+        """Test that callers cannot mutate cached entries."""
+        cache = TokenCache(max_size=10)
+        cache.put('token', {'uid': 'abc'}, time.time() + 60)
+
+        cache.get('token')['uid'] = 'tampered'
+
+        assert cache.get('token') == {'uid': 'abc'}
+
+
+class TestVerifyFirebaseTokenCache:
+    """Test cases for token caching in verify_firebase_token."""
+
+    @pytest.fixture
+    def decoded_token(self):
+        return {
+            'uid': 'test-user-123',
+            'email': 'test@example.com',
+            'exp': time.time() + 3600,
+            'firebase': {'sign_in_provider': 'google.com'}
+        }
+
+    def test_token_verified_once(self, app, decoded_token):
+        """Test that a reused token skips signature verification."""
+        from app.auth.firebase import verify_firebase_token
+
+        with app.app_context(), patch('firebase_admin.auth') as mock_auth:
+            mock_auth.verify_id_token.return_value = decoded_token
+            first = verify_firebase_token('token')
+            second = verify_firebase_token('token')
+
+        assert first == second
+        assert first['uid'] == 'test-user-123'
+        assert mock_auth.verify_id_token.call_count == 1
+
+    def test_check_revoked_bypasses_cache(self, app, decoded_token):
+        """Test that revocation checks always go to Firebase."""
+        from app.auth.firebase import verify_firebase_token
+
+        with app.app_context(), patch('firebase_admin.auth') as mock_auth:
+            mock_auth.verify_id_token.return_value = decoded_token
+            verify_firebase_token('token')
+            verify_firebase_token('token', check_revoked=True)
+
+        assert mock_auth.verify_id_token.call_count == 2
+        mock_auth.verify_id_token.assert_called_with('token', check_revoked=True)
+
+    def test_cache_disabled(self, decoded_token):
+        """Test that TOKEN_CACHE_SIZE=0 disables caching."""
+        from app.main import create_app
+        from app.auth.firebase import verify_firebase_token
+        app = create_app({'TESTING': True, 'TOKEN_CACHE_SIZE': 0})
+
+        with app.app_context(), patch('firebase_admin.auth') as mock_auth:
+            mock_auth.verify_id_token.return_value = decoded_token
+            verify_firebase_token('token')
+            verify_firebase_token('token')
+
+        assert mock_auth.verify_id_token.call_count == 2
@@ -0,0 +1,171 @@
+"""
+Tests for screening ID tokens before signature verification.
+"""
+import base64
+import json
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.auth.keys import KeyManager, UnknownKeyError
+from app.auth.screen import TokenScreen
+from support.tokens import LocalIssuer
+
+METRICS_HEADERS = {'Authorization': 'Bearer test-metrics-token'}
+
+
+@pytest.fixture(scope='module')
+def issuer():
+    return LocalIssuer('test-project')
+
+
+def with_header(token, **fields):
+    """Re-encode a token's header with some fields changed (breaking its signature)."""
+    header, rest = token.split('.', 1)
+    decoded = json.loads(base64.urlsafe_b64decode(header + '=' * (-len(header) % 4)))
+    decoded.update(fields)
+    encoded = base64.urlsafe_b64encode(json.dumps(decoded).encode()).rstrip(b'=').decode()
+    return f'{encoded}.{rest}'
+
+
+class TestTokenScreen:
+    """Test cases for TokenScreen."""
+
+    def test_valid_token_passes(self, issuer):
+        """Test that a well-formed token for the project is not rejected."""
+        assert TokenScreen('test-project').check(issuer.mint('user-1')) is None
+
+    @pytest.mark.parametrize('token, reason', [
+        ('mock-token', 'malformed'),
+        ('a.b.c', 'malformed'),
+        ('x' * 5000, 'oversized'),
+    ])
+    def test_junk_rejected(self, token, reason):
+        """Test that malformed and oversized tokens are rejected."""
+        assert TokenScreen('test-project').check(token) == reason
+
+    @pytest.mark.parametrize('header, reason', [
+        ({'alg': 'HS256'}, 'alg'),
+        ({'alg': 'none'}, 'alg'),
+        ({'kid': ''}, 'kid'),
+    ])
+    def test_header_rejected(self, issuer, header, reason):
+        """Test that wrong algorithms and missing key IDs are rejected."""
+        assert TokenScreen('test-project').check(with_header(issuer.mint('user-1'), **header)) == reason
+
+    @pytest.mark.parametrize('kwargs, reason', [
+        ({'aud': 'other-project'}, 'aud'),
+        ({'iss': 'https://securetoken.google.com/other-project'}, 'iss'),
+        ({'lifetime': -10}, 'expired'),
+        ({'iat': 2 ** 40}, 'not_yet_valid'),
+        ({'nbf': 2 ** 40}, 'not_yet_valid'),
+        ({'sub': ''}, 'sub'),
+    ])
+    def test_claims_rejected(self, issuer, kwargs, reason):
+        """Test that tokens Firebase would reject are rejected without crypto."""
+        assert TokenScreen('test-project').check(issuer.mint('user-1', **kwargs)) == reason
+
+    def test_unknown_kid_rejected_once_keys_are_fresh(self, issuer):
+        """Test that unknown key IDs are rejected only when no refresh is due."""
+        key_manager = KeyManager('test-project', source=issuer.certificates)
+        key_manager.refresh()
+        screen = TokenScreen('test-project')
+        token = issuer.mint('user-1', headers={'kid': 'forged'})
+
+        assert screen.check(issuer.mint('user-1'), key_manager) is None
+        assert screen.check(token, key_manager) == 'kid'
+        key_manager.last_attempt_at -= key_manager.min_refresh_interval
+        assert screen.check(token, key_manager) is None
+
+    def test_transient_reasons_not_cached(self, issuer):
+        """Test that unknown key IDs and future iat are counted but not remembered."""
+        screen = TokenScreen('test-project')
+        early = issuer.mint('user-1', iat=2 ** 40)
+
+        assert screen.check(early) == screen.check(early) == 'not_yet_valid'
+        assert screen.check(with_header(early, kid='')) == 'kid'
+        assert screen.stats() == {'rejections': {'not_yet_valid': 2, 'kid': 1}, 'negative_cache': 0}
+
+    def test_negative_cache(self, issuer):
+        """Test that rejected tokens are remembered until negative_ttl passes."""
+        now = [time.time()]
+        screen = TokenScreen('test-project', negative_ttl=60, clock=lambda: now[0])
+        token = issuer.mint('user-1')
+        screen.reject(token, 'verify_failed')
+
+        assert screen.check(token) == 'cached'
+        now[0] += 60
+        assert screen.check(token) is None
+        assert screen.stats()['rejections'] == {'verify_failed': 1, 'cached': 1}
+
+    def test_negative_cache_bounded(self):
+        """Test that the negative cache evicts its oldest entries."""
+        screen = TokenScreen('test-project', negative_cache_size=2)
+        for token in ('a', 'b', 'c'):
+            screen.check(token)
+
+        assert screen.stats()['negative_cache'] == 2
+
+
+class TestScreenedVerification:
+    """Test cases for verify_firebase_token with screening enabled."""
+
+    @pytest.fixture
+    def screen_app(self):
+        from app.main import create_app
+        return create_app({'TESTING': True, 'FIREBASE_PROJECT_ID': 'test-project',
+                           'USER_STORE': 'memory', 'TOKEN_SCREEN_ENABLED': True,
+                           'METRICS_TOKEN': 'test-metrics-token'})
+
+    def test_disabled_by_default(self, client):
+        """Test that tokens are not screened unless enabled."""
+        assert 'token_screen' not in client.application.extensions
+
+    def test_screened_token_not_verified(self, screen_app, mock_firebase_auth):
+        """Test that screened-out tokens never reach signature verification."""
+        from app.auth.firebase import verify_firebase_token
+
+        with screen_app.test_request_context('/'):
+            assert verify_firebase_token('mock-token') is None
+        mock_firebase_auth.verify_id_token.assert_not_called()
+
+    def test_failed_verification_remembered(self, screen_app, issuer):
+        """Test that a token failing verification is not verified again."""
+        from firebase_admin import auth
+        from app.auth.firebase import verify_firebase_token
+        token = LocalIssuer('test-project', kid=issuer.kid).mint('user-1')
+
+        with screen_app.test_request_context('/'), \
+                patch('firebase_admin.auth.verify_id_token',
+                      side_effect=auth.InvalidIdTokenError('bad signature')) as mock_verify:
+            assert verify_firebase_token(token) is None
+            assert verify_firebase_token(token) is None
+
+        assert mock_verify.call_count == 1
+
+    @pytest.mark.parametrize('cause', [
+        UnknownKeyError('rotated'),
+        ValueError('Certificate for key id rotated not found.'),
+    ])
+    def test_unknown_key_not_remembered(self, screen_app, issuer, cause):
+        """Test that a token signed with a key not loaded yet is verified again."""
+        from firebase_admin import auth
+        from app.auth.firebase import verify_firebase_token
+        token = issuer.mint('user-1', headers={'kid': 'rotated'})
+
+        with screen_app.test_request_context('/'), \
+                patch('firebase_admin.auth.verify_id_token',
+                      side_effect=auth.InvalidIdTokenError(str(cause), cause=cause)) as mock_verify:
+            assert verify_firebase_token(token) is None
+            assert verify_firebase_token(token) is None
+
+        assert mock_verify.call_count == 2
+        assert 'verify_failed' not in screen_app.extensions['token_screen'].stats()['rejections']
+
+    def test_metrics_exported(self, screen_app):
+        """Test that rejections appear on /metrics."""
+        screen_app.test_client().get('/auth/me', headers={'Authorization': 'Bearer mock-token'})
+        text = screen_app.test_client().get('/metrics', headers=METRICS_HEADERS).get_data(as_text=True)
+
+        assert 'app_token_screen_rejections_total{reason="malformed"}' in text
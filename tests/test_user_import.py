@@ -0,0 +1,138 @@
+"""
+Tests for the bulk user import.
+"""
+import io
+import json
+from unittest.mock import patch
+
+import pytest
+from google.api_core import exceptions as core_exceptions
+
+from app.models.imports import read_records, user_info_from_record, import_users, write_batch
+from app.models.user import User
+from app.ndb_client import ndb_registry
+
+
+def jsonl(records):
+    return io.StringIO(''.join(json.dumps(record) + '\n' for record in records))
+
+
+def user_records(count, prefix='user'):
+    return [{'uid': f'{prefix}-{i}', 'email': f'{prefix}-{i}@example.com', 'name': f'User {i}'}
+            for i in range(count)]
+
+
+class TestRecords:
+    """Test cases for reading import records."""
+
+    def test_firebase_export_fields(self):
+        """Test that Firebase user record field names map to user info."""
+        record = {'localId': 'abc', 'email': 'a@example.com', 'emailVerified': True,
+                  'displayName': 'A', 'photoUrl': 'https://example.com/a.jpg',
+                  'providerUserInfo': [{'providerId': 'google.com'}]}
+
+        assert user_info_from_record(record) == {
+            'uid': 'abc', 'email': 'a@example.com', 'email_verified': True, 'name': 'A',
+            'picture': 'https://example.com/a.jpg', 'provider_id': 'google.com'}
+
+    def test_csv_records(self):
+        """Test that CSV rows are read with their header and booleans parsed."""
+        stream = io.StringIO('uid,email,email_verified,name\nu1,u1@example.com,true,\n')
+        records = list(read_records(stream, 'csv'))
+
+        assert user_info_from_record(records[0]) == {'uid': 'u1', 'email': 'u1@example.com',
+                                                     'email_verified': True}
+
+    def test_invalid_records(self):
+        """Test that bad JSON and records without uid or email are rejected."""
+        records = list(read_records(io.StringIO('not json\n\n{"uid": "x"}\n'), 'jsonl'))
+
+        assert records == [None, {'uid': 'x'}]
+        assert [user_info_from_record(record) for record in records] == [None, None]
+
+    def test_provider_user_info_in_csv(self):
+        """Test that providerUserInfo is parsed from CSV and malformed values are rejected."""
+        stream = io.StringIO('localId,email,providerUserInfo\n'
+                             'u1,u1@example.com,"[{""providerId"": ""password""}]"\n'
+                             'u2,u2@example.com,password\n'
+                             'u3,u3@example.com,"[""password""]"\n')
+        records = list(read_records(stream, 'csv'))
+
+        assert user_info_from_record(records[0])['provider_id'] == 'password'
+        assert user_info_from_record(records[1]) is None
+        assert user_info_from_record(records[2]) is None
+
+
+class TestImportUsers:
+    """Test cases for importing users into Datastore."""
+
+    def test_import_in_batches(self, datastore, app):
+        """Test that users are written with one commit per batch."""
+        records = user_records(25) + [{'uid': 'user-22', 'email': 'user-22@example.com', 'name': 'Again'}]
+        with app.app_context():
+            stats = import_users(records, ndb_registry.context, batch_size=10, concurrency=3)
+
+        assert stats['written'] == 25
+        assert stats['coalesced'] == 1
+        assert datastore.count('User') == 25
+        assert datastore.calls['commit'] == stats['batches']
+        with app.app_context(), ndb_registry.context():
+            assert User.get_by_uid('user-22').display_name == 'Again'
+
+    def test_reimport_writes_nothing(self, datastore, app):
+        """Test that importing unchanged users again only reads them."""
+        with app.app_context():
+            import_users(user_records(5), ndb_registry.context)
+            commits = datastore.calls['commit']
+            stats = import_users(user_records(5), ndb_registry.context)
+
+        assert stats['written'] == 0 and stats['unchanged'] == 5
+        assert datastore.calls['commit'] == commits
+
+    def test_retry_on_contention(self, datastore, app):
+        """Test that a batch failing with contention is retried."""
+        calls = []
+
+        def flaky(user_infos, lookup=True):
+            calls.append(len(user_infos))
+            if len(calls) == 1:
+                raise core_exceptions.Aborted('too much contention')
+            return write_batch(user_infos, lookup=lookup)
+
+        with app.app_context(), patch('app.models.imports.write_batch', side_effect=flaky):
+            stats = import_users(user_records(3), ndb_registry.context, sleep=lambda delay: None)
+
+        assert stats['retries'] == 1
+        assert datastore.count('User') == 3
+
+    def test_checkpoint_and_resume(self, datastore, app):
+        """Test that a failed import resumes after the last written batch."""
+        checkpoints = []
+
+        def failing(user_infos, lookup=True):
+            if any(info['uid'] == 'user-7' for info in user_infos):
+                raise ValueError('bad batch')
+            return write_batch(user_infos, lookup=lookup)
+
+        with app.app_context():
+            with patch('app.models.imports.write_batch', side_effect=failing), pytest.raises(ValueError):
+                import_users(user_records(12), ndb_registry.context, batch_size=5, concurrency=1,
+                             checkpoint=lambda position, stats: checkpoints.append(position))
+            assert checkpoints[-1] == 5
+
+            stats = import_users(user_records(12), ndb_registry.context, batch_size=5, start=5)
+
+        assert stats['read'] == 7
+        assert datastore.count('User') == 12
+
+    def test_import_command(self, datastore, runner, tmp_path):
+        """Test the import-users CLI command."""
+        path = tmp_path / 'users.jsonl'
+        path.write_text(jsonl(user_records(4)).getvalue())
+
+        result = runner.invoke(args=['import-users', str(path), '--batch-size', '2'])
+
+        assert result.exit_code == 0, result.output
+        assert 'Done: 4 read, 4 written' in result.output
+        assert datastore.count('User') == 4
+        assert not (tmp_path / 'users.jsonl.checkpoint').exists()
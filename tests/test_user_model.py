@@ -127,4 +127,211 @@ class TestUserModel:
         # Test with required fields
         user = User(uid='test-user-123', email='test@example.com')
         assert user.uid == 'test-user-123'
-        assert user.email == 'test@example.com' 
\ No newline at end of file
+        assert user.email == 'test@example.com' 
+
+class TestUserKeys:
+    """Test cases for UID-keyed User entities (backed by the Datastore stand-in)."""
+
+    def test_create_uses_uid_key(self, ndb_context, mock_firebase_user):
+        """Test that new users are keyed by Firebase UID."""
+        user = User.create_from_firebase_user(mock_firebase_user)
+
+        assert user.key.id() == 'test-user-123'
+        assert User.key_for_uid('test-user-123') == user.key
+
+    def test_get_by_uid_uses_key_lookup(self, ndb_context, datastore, mock_firebase_user):
+        """Test that get_by_uid does a key lookup and no query."""
+        User.create_from_firebase_user(mock_firebase_user)
+        ndb_context.clear_cache()
+        datastore.calls.clear()
+
+        user = User.get_by_uid('test-user-123')
+
+        assert user.email == 'test@example.com'
+        assert datastore.calls['lookup'] == 1
+        assert datastore.calls['run_query'] == 0
+
+    def test_get_by_uid_async_batches_lookups(self, ndb_context, datastore):
+        """Test that concurrent tasklet lookups share one Datastore RPC."""
+        for uid in ['alice', 'bob']:
+            User.create_from_firebase_user({'uid': uid, 'email': f'{uid}@example.com'})
+        ndb_context.clear_cache()
+        datastore.calls.clear()
+
+        futures = [User.get_by_uid_async(uid) for uid in ['alice', 'bob']]
+
+        assert [future.result().uid for future in futures] == ['alice', 'bob']
+        assert datastore.calls['lookup'] == 1
+
+    def test_create_twice_does_not_duplicate(self, ndb_context, datastore, mock_firebase_user):
+        """Test that concurrent first logins cannot create duplicate users."""
+        User.create_from_firebase_user(mock_firebase_user)
+        User.create_from_firebase_user(mock_firebase_user)
+
+        assert datastore.count('User') == 1
+
+    def test_get_by_uid_falls_back_to_legacy_entity(self, ndb_context):
+        """Test dual-read of auto-ID entities during the migration window."""
+        User(uid='legacy-user', email='legacy@example.com').put()
+
+        user = User.get_by_uid('legacy-user')
+
+        assert user is not None
+        assert user.key.integer_id() is not None
+
+    def test_get_by_uid_without_legacy_lookup(self, ndb_context, monkeypatch):
+        """Test that auto-ID entities are ignored once the fallback is off."""
+        monkeypatch.setattr(User, 'legacy_uid_lookup', False)
+        User(uid='legacy-user', email='legacy@example.com').put()
+
+        assert User.get_by_uid('legacy-user') is None
+
+
+class TestUserKeyMigration:
+    """Test cases for migrating auto-ID users to UID keys."""
+
+    def test_migrate_user_keys(self, ndb_context, datastore):
+        """Test that legacy entities are rewritten in batches."""
+        from app.models.migrations import migrate_user_keys
+        for i in range(5):
+            User(uid=f'user-{i}', email=f'user-{i}@example.com', display_name=f'User {i}').put()
+
+        stats = migrate_user_keys(batch_size=2)
+
+        assert stats == {'batches': 3, 'written': 5, 'deleted': 5}
+        assert datastore.count('User') == 5
+        ndb_context.clear_cache()
+        user = User.key_for_uid('user-3').get()
+        assert user.display_name == 'User 3'
+        assert user.created_at is not None
+
+    def test_migrate_keeps_existing_uid_entity(self, ndb_context, datastore):
+        """Test that an existing UID-keyed entity wins over legacy duplicates."""
+        from app.models.migrations import migrate_user_keys
+        User(id='dup', uid='dup', email='dup@example.com', display_name='Current').put()
+        User(uid='dup', email='dup@example.com', display_name='Stale 1').put()
+        User(uid='dup', email='dup@example.com', display_name='Stale 2').put()
+
+        stats = migrate_user_keys()
+
+        assert stats['written'] == 0
+        assert stats['deleted'] == 2
+        assert datastore.count('User') == 1
+        ndb_context.clear_cache()
+        assert User.get_by_uid('dup').display_name == 'Current'
+
+    def test_update_of_migrated_legacy_entity(self, ndb_context, datastore, mock_firebase_user):
+        """Test that saving a legacy entity loaded before migration writes the UID key."""
+        from app.models.migrations import migrate_user_keys
+        User(uid=mock_firebase_user['uid'], email='old@example.com').put()
+        loaded = User.get_by_uid(mock_firebase_user['uid'])
+
+        migrate_user_keys()
+        loaded.update_from_firebase_user(mock_firebase_user)
+
+        assert datastore.count('User') == 1
+        assert loaded.key == User.key_for_uid(mock_firebase_user['uid'])
+        ndb_context.clear_cache()
+        assert User.get_by_uid(mock_firebase_user['uid']).email == mock_firebase_user['email']
+        assert migrate_user_keys()['deleted'] == 0
+
+    def test_migrate_is_idempotent(self, ndb_context):
+        """Test that re-running a finished migration does nothing."""
+        from app.models.migrations import migrate_user_keys
+        User(uid='user-1', email='user-1@example.com').put()
+        migrate_user_keys()
+
+        assert migrate_user_keys() == {'batches': 0, 'written': 0, 'deleted': 0}
+
+    def test_migrate_command(self, datastore, runner):
+        """Test the migrate-user-keys CLI command."""
+        result = runner.invoke(args=['migrate-user-keys', '--batch-size', '10'])
+
+        assert result.exit_code == 0
+        assert 'Done: 0 users written' in result.output
+
+
+class TestUserWriteAvoidance:
+    """Test cases for skipping writes when Firebase claims are unchanged."""
+
+    def test_apply_firebase_user_reports_changes(self, mock_firebase_user):
+        """Test that apply_firebase_user detects changed values."""
+        user = User(uid='test-user-123', email='test@example.com', display_name='Test User',
+                    email_verified=True, picture='https://example.com/avatar.jpg',
+                    provider_id='google.com')
+
+        assert user.apply_firebase_user(mock_firebase_user) is False
+        assert user.apply_firebase_user(dict(mock_firebase_user, name='Renamed')) is True
+        assert user.display_name == 'Renamed'
+
+    def test_unchanged_update_skips_put(self, ndb_context, datastore, mock_firebase_user):
+        """Test that an update with identical claims does not write."""
+        user = User.create_from_firebase_user(mock_firebase_user)
+        datastore.calls.clear()
+
+        user.update_from_firebase_user(mock_firebase_user)
+
+        assert datastore.calls['commit'] == 0
+
+    def test_changed_update_writes(self, ndb_context, datastore, mock_firebase_user):
+        """Test that changed claims are written."""
+        user = User.create_from_firebase_user(mock_firebase_user)
+        datastore.calls.clear()
+
+        user.update_from_firebase_user(dict(mock_firebase_user, email='new@example.com'))
+
+        assert datastore.calls['commit'] == 1
+        ndb_context.clear_cache()
+        assert User.get_by_uid('test-user-123').email == 'new@example.com'
+
+    def test_touch_interval(self, monkeypatch):
+        """Test the updated_at refresh policy."""
+        from datetime import timedelta
+        user = User(uid='test-user-123', email='test@example.com')
+        user.updated_at = datetime(2023, 1, 1, 12, 0, 0)
+
+        assert user.needs_touch(now=datetime(2023, 1, 2)) is False
+
+        monkeypatch.setattr(User, 'touch_interval', timedelta(minutes=30))
+        assert user.needs_touch(now=datetime(2023, 1, 1, 12, 10)) is False
+        assert user.needs_touch(now=datetime(2023, 1, 1, 12, 30)) is True
+
+
+class TestBatchLookup:
+    """Test cases for batch user lookups."""
+
+    def test_get_many_by_uid(self, ndb_context, datastore):
+        """Test order preservation, misses and a single lookup RPC."""
+        for uid in ['a', 'b', 'c']:
+            User(id=uid, uid=uid, email=f'{uid}@example.com').put()
+        ndb_context.clear_cache()
+        datastore.calls.clear()
+
+        users = User.get_many_by_uid(['c', 'missing', 'a'])
+
+        assert [user.uid if user else None for user in users] == ['c', None, 'a']
+        assert datastore.calls['lookup'] == 1
+
+    def test_get_many_by_uid_finds_legacy_users(self, ndb_context):
+        """Test that auto-ID users are found during the migration window."""
+        User(id='a', uid='a', email='a@example.com').put()
+        User(uid='legacy', email='legacy@example.com').put()
+
+        users = User.get_many_by_uid(['legacy', 'a', 'missing'])
+
+        assert [user.uid if user else None for user in users] == ['legacy', 'a', None]
+
+    def test_list_page(self, ndb_context):
+        """Test projection paging with cursors."""
+        for i in range(5):
+            User(id=f'user-{i}', uid=f'user-{i}', email=f'user-{i}@example.com').put()
+
+        rows, cursor, more = User.list_page(['uid', 'email'], page_size=3)
+        assert [row['uid'] for row in rows] == ['user-0', 'user-1', 'user-2']
+        assert set(rows[0]) == {'uid', 'email'}
+        assert more
+
+        rows, cursor, more = User.list_page(['uid', 'email'], page_size=3, cursor=cursor)
+        assert [row['uid'] for row in rows] == ['user-3', 'user-4']
+        assert not more
+        assert cursor is None
@@ -0,0 +1,130 @@
+"""
+Tests for the user storage backends.
+"""
+import pytest
+from unittest.mock import patch
+from app.models.repository import (MemoryUserRepository, NDBUserRepository, SQLiteUserRepository,
+                                   create_user_repository)
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'ndb'])
+def repository(request, app, tmp_path):
+    """Each backend, empty."""
+    if request.param == 'memory':
+        yield MemoryUserRepository()
+    elif request.param == 'sqlite':
+        yield SQLiteUserRepository(str(tmp_path / 'users.sqlite3'))
+    else:
+        request.getfixturevalue('datastore')
+        with app.app_context():
+            yield NDBUserRepository(app)
+
+
+def firebase_user(uid, **claims):
+    return dict({'uid': uid, 'email': f'{uid}@example.com', 'name': uid.title(),
+                 'email_verified': True, 'provider_id': 'google.com'}, **claims)
+
+
+class TestUserRepository:
+    """Behaviour shared by all backends."""
+
+    def test_get_or_create(self, repository):
+        """Test that the first call creates and later calls find the user."""
+        user, created = repository.get_or_create(firebase_user('alice'))
+        assert created
+        assert user.created_at is not None
+
+        again, created = repository.get_or_create(firebase_user('alice'))
+        assert not created
+        assert again.to_dict() == user.to_dict()
+
+    def test_lookups(self, repository):
+        """Test get_by_uid, get_by_email and get_many_by_uid."""
+        for uid in ['alice', 'bob']:
+            repository.create(firebase_user(uid))
+
+        assert repository.get_by_uid('alice').display_name == 'Alice'
+        assert repository.get_by_uid('nobody') is None
+        assert repository.get_by_email('bob@example.com').uid == 'bob'
+        users = repository.get_many_by_uid(['bob', 'nobody', 'alice'])
+        assert [user.uid if user else None for user in users] == ['bob', None, 'alice']
+
+    def test_save_persists_changes(self, repository):
+        """Test that saved edits are visible to later reads."""
+        user = repository.create(firebase_user('alice'))
+        user.display_name = 'Renamed'
+        repository.save(user)
+
+        stored = repository.get_by_uid('alice')
+        assert stored.display_name == 'Renamed'
+        assert stored.updated_at >= stored.created_at
+
+    def test_unchanged_user_not_rewritten(self, repository):
+        """Test that syncing identical claims skips the write."""
+        user = repository.create(firebase_user('alice'))
+
+        with patch.object(repository, 'save') as mock_save:
+            repository.update_from_firebase_user(user, firebase_user('alice'))
+            mock_save.assert_not_called()
+            repository.update_from_firebase_user(user, firebase_user('alice', name='New'))
+            mock_save.assert_called_once_with(user)
+
+    def test_list_page(self, repository):
+        """Test paging through all users with cursors."""
+        for i in range(5):
+            repository.create(firebase_user(f'user-{i}'))
+
+        rows, cursor, more = repository.list_page(['uid', 'email_verified'], page_size=3)
+        assert [row['uid'] for row in rows] == ['user-0', 'user-1', 'user-2']
+        assert rows[0] == {'uid': 'user-0', 'email_verified': True}
+        assert more
+
+        rows, cursor, more = repository.list_page(['uid', 'email_verified'], page_size=3, cursor=cursor)
+        assert [row['uid'] for row in rows] == ['user-3', 'user-4']
+        assert (cursor, more) == (None, False)
+
+
+class TestSQLiteUserRepository:
+    """SQLite specific behaviour."""
+
+    def test_wal_mode_and_persistence(self, tmp_path):
+        """Test that data survives reopening the database."""
+        path = str(tmp_path / 'users.sqlite3')
+        SQLiteUserRepository(path).create(firebase_user('alice'))
+
+        repository = SQLiteUserRepository(path)
+        assert repository.get_by_uid('alice').email == 'alice@example.com'
+        mode = repository._connection().execute('PRAGMA journal_mode').fetchone()[0]
+        assert mode == 'wal'
+
+
+class TestUserStoreConfig:
+    """Test cases for selecting the backend."""
+
+    def test_unknown_backend(self, app):
+        """Test that a typo in USER_STORE fails fast."""
+        app.config['USER_STORE'] = 'redis'
+
+        with pytest.raises(ValueError):
+            create_user_repository(app)
+
+    def test_profile_without_datastore(self, mock_firebase_user):
+        """Test that /profile/ works on the memory store with no Datastore."""
+        from app.main import create_app
+        app = create_app({'TESTING': True, 'USER_STORE': 'memory'})
+        client = app.test_client()
+        headers = {'Authorization': 'Bearer mock-token'}
+
+        with patch('app.auth.firebase.verify_firebase_token', return_value=mock_firebase_user):
+            created = client.get('/profile/', headers=headers)
+            updated = client.put('/profile/', headers=headers, json={'display_name': 'New Name'})
+            synced = client.post('/profile/sync', headers=headers)
+            stats = client.get('/profile/stats', headers=headers)
+
+        assert created.status_code == 200
+        assert created.get_json()['user']['uid'] == mock_firebase_user['uid']
+        assert updated.get_json()['user']['display_name'] == 'New Name'
+        assert synced.status_code == 200
+        assert stats.get_json()['stats']['account_age_days'] == 0
+        stored = app.extensions['user_repository'].get_by_uid(mock_firebase_user['uid'])
+        assert stored.display_name == mock_firebase_user['name']
@@ -0,0 +1,55 @@
+"""
+Tests for deferred dependency initialization at startup.
+"""
+from unittest.mock import patch
+from app.auth.firebase import FirebaseState
+from app.main import create_app
+
+
+class TestWarmup:
+    """Test cases for the eager and background warm-up modes."""
+
+    def test_eager_warmup_runs_in_create_app(self, app):
+        """Test that test configs initialize everything before returning."""
+        warmup = app.extensions['warmup']
+
+        assert warmup.finished.is_set()
+        assert app.extensions['firebase'].status is not None
+        assert 'firebase' in warmup.timings and 'total' in warmup.timings
+
+    def test_background_warmup(self):
+        """Test that the background warm-up finishes and records timings."""
+        app = create_app({'TESTING': True, 'USER_STORE': 'memory', 'WARMUP': 'background'})
+        warmup = app.extensions['warmup']
+
+        assert warmup.wait(timeout=10)
+        assert app.extensions['firebase'].status is not None
+        assert set(warmup.timings) >= {'firebase', 'total'}
+
+    def test_request_before_warmup_finishes(self, mock_firebase_user):
+        """Test that a request arriving first initializes what it needs."""
+        with patch('app.warmup.Warmup.start'):
+            app = create_app({'TESTING': True, 'USER_STORE': 'memory', 'WARMUP': 'background'})
+        assert app.extensions['firebase'].status is None
+
+        with patch('app.auth.firebase.verify_firebase_token', return_value=mock_firebase_user):
+            response = app.test_client().get(
+                '/profile/', headers={'Authorization': 'Bearer mock-token'})
+
+        assert response.status_code == 200
+        assert app.extensions['firebase'].status is not None
+
+
+class TestDeferredFirebaseState:
+    """Test cases for FirebaseState initialized on first use."""
+
+    def test_available_initializes_once(self, app):
+        """Test that available() runs the deferred initialization once."""
+        state = FirebaseState()
+
+        with patch.object(state, 'initialize', wraps=state.initialize) as initialize:
+            first = state.available()
+            second = state.available()
+
+        assert first == second
+        assert initialize.call_count == 1